@@ -0,0 +1,63 @@
+"""
+Benchmark of the micro-batching inference service against one model call per request.
+
+Simulates `--bots` bots each asking one prediction per bar of `--bars` bars, all at once as on a
+candle close, and reports the wall time per bar, the batch latency percentiles and the
+throughput for every max batch size.
+
+Usage:
+    python benchmarks/bench_inference.py --bots 256 --bars 50 --batch-sizes 1,16,64,256
+"""
+import argparse
+import asyncio
+import time
+
+import torch
+from torch import nn
+
+from torchtrader.models.predict_model import InferenceService
+
+
+def make_model(features: int) -> nn.Module:
+    return nn.Sequential(
+        nn.Linear(features, 256), nn.ReLU(), nn.Linear(256, 256), nn.ReLU(), nn.Linear(256, 3)
+    )
+
+
+async def run(model: nn.Module, args: argparse.Namespace, max_batch_size: int) -> None:
+    example = torch.zeros(args.features)
+    service = InferenceService(
+        model, max_batch_size=max_batch_size, max_wait_ms=args.max_wait_ms, example=example
+    )
+    samples = torch.randn(args.bots, args.features)
+    async with service:
+        start = time.perf_counter()
+        for _ in range(args.bars):
+            await asyncio.gather(*(service.predict(sample) for sample in samples))
+        seconds = time.perf_counter() - start
+
+    stats = service.stats.summary()
+    print(
+        f"batch <= {max_batch_size:>4}: {seconds / args.bars * 1000:8.2f} ms per bar, "
+        f"mean batch {stats['mean_batch_size']:6.1f}, p50 {stats['p50_ms']:.2f} ms, "
+        f"p99 {stats['p99_ms']:.2f} ms, {stats['throughput']:,.0f} predictions/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bots", type=int, default=256, help="Predictions per bar.")
+    parser.add_argument("--bars", type=int, default=50, help="Bars simulated.")
+    parser.add_argument("--features", type=int, default=64, help="Features per sample.")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="Max wait of a batch.")
+    parser.add_argument("--batch-sizes", default="1,16,64,256", help="Max batch sizes tried.")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = make_model(args.features)
+    for max_batch_size in map(int, args.batch_sizes.split(",")):
+        asyncio.run(run(model, args, max_batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark of the time a trading thread spends in a DEBUG log call.
+
+Compares a logger writing to its file directly with the queue-based setup of
+`torchtrader.logs.logger`, with and without the per-call-site rate limit. Only the time spent in
+the caller is measured; the listener thread writes the records in the background.
+
+Usage:
+    python benchmarks/bench_logging.py --records 100000
+"""
+import argparse
+import logging
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener
+from pathlib import Path
+
+from torchtrader.logs.logger import RateLimitFilter
+from torchtrader.logs.logger import ThreadQueueHandler
+
+
+def make_logger(name: str, log_file: Path, mode: str) -> tuple:
+    logger = logging.getLogger(f"bench.{name}")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    if mode == "direct":
+        logger.addHandler(file_handler)
+        return logger, None
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = ThreadQueueHandler(log_queue)
+    if mode == "queue + rate limit":
+        queue_handler.addFilter(RateLimitFilter())
+    logger.addHandler(queue_handler)
+    listener = QueueListener(log_queue, file_handler)
+    listener.start()
+    return logger, listener
+
+
+def bench_mode(mode: str, n_records: int, tmp_dir: str) -> float:
+    logger, listener = make_logger(mode.replace(" ", "_"), Path(tmp_dir) / f"{mode}.log", mode)
+    start = time.perf_counter()
+    for i in range(n_records):
+        logger.debug("Symbol: %s, Action: %s, Quantity: %s", "BTC/USDT", "buy", i)
+    caller_seconds = time.perf_counter() - start
+    if listener is not None:
+        listener.stop()
+    return caller_seconds / n_records * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=100_000, help="DEBUG records logged.")
+    args = parser.parse_args()
+
+    print(f"{'mode':<20} {'us/call':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for mode in ("direct", "queue", "queue + rate limit"):
+            print(f"{mode:<20} {bench_mode(mode, args.records, tmp_dir):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
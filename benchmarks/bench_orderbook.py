@@ -0,0 +1,64 @@
+"""
+Benchmark of the order book under a stream of single level deltas.
+
+Levels are updated around the top of a `--levels` deep book, as an exchange feed does: a third
+of the deltas remove a level, the others insert or resize one. Reports the deltas applied per
+second and the cost of the depth and VWAP queries.
+
+Usage:
+    python benchmarks/bench_orderbook.py --levels 1000 --updates 200000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from torchtrader.data.orderbook import OrderBook
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--levels", type=int, default=1_000, help="Levels per side.")
+    parser.add_argument("--updates", type=int, default=200_000, help="Deltas applied.")
+    parser.add_argument("--tick", type=float, default=0.01, help="Price step of the levels.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    book = OrderBook("BTC/USDT", history=args.updates)
+    steps = np.arange(args.levels)
+    book.apply_snapshot(
+        {
+            "bids": np.column_stack([100 - steps * args.tick, rng.random(args.levels)]),
+            "asks": np.column_stack([100 + (steps + 1) * args.tick, rng.random(args.levels)]),
+        }
+    )
+
+    # Distance to the top in ticks, most deltas land on the first levels
+    distances = np.abs(rng.normal(0, args.levels / 50, args.updates)).astype(int)
+    amounts = np.where(rng.random(args.updates) < 1 / 3, 0.0, rng.random(args.updates))
+    deltas = [
+        {"bids": [[round(100 - distance * args.tick, 8), amount]]}
+        if rng.random() < 0.5
+        else {"asks": [[round(100 + (distance + 1) * args.tick, 8), amount]]}
+        for distance, amount in zip(distances, amounts)
+    ]
+
+    start = time.perf_counter()
+    for delta in deltas:
+        book.apply_delta(delta)
+    seconds = time.perf_counter() - start
+    print(f"deltas: {args.updates / seconds:,.0f}/s ({seconds / args.updates * 1e6:.2f} us each)")
+
+    for name, query in (
+        ("depth 20", lambda: book.depth("bids", 20)),
+        ("vwap 10", lambda: book.vwap("buy", 10.0)),
+        ("imbalance 10", lambda: book.imbalance(10)),
+    ):
+        start = time.perf_counter()
+        for _ in range(10_000):
+            query()
+        print(f"{name}: {(time.perf_counter() - start) / 10_000 * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark of the SQLite storage profiles in `torchtrader.data.database.SQLITE_PROFILES`.
+
+For every profile a fresh database is filled with 1m candles, one `insert_ohlcv` transaction per
+batch like a collector would do, then read back through the full history and through random one
+day windows.
+
+Usage:
+    python benchmarks/bench_sqlite_profiles.py --rows 200000 --batch-size 1440
+"""
+import argparse
+import logging
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from torchtrader.data.database import GenericDatabase
+from torchtrader.data.database import SQLITE_PROFILES
+from torchtrader.logs.logger import app_logger
+
+START_MS = 1_672_531_200_000
+MINUTE_MS = 60_000
+DAY_MS = 1_440 * MINUTE_MS
+
+
+def bench_profile(profile: str, n_rows: int, batch_size: int, n_windows: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = GenericDatabase(str(Path(tmp_dir) / "bench.db"), profile=profile)
+
+        start = time.perf_counter()
+        for offset in range(0, n_rows, batch_size):
+            candles = [
+                [START_MS + i * MINUTE_MS, 100.0, 101.0, 99.0, 100.5, 10.0]
+                for i in range(offset, min(offset + batch_size, n_rows))
+            ]
+            db.insert_ohlcv(1, "1m", candles)
+        write_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        history = db.read_ohlcv(1, "1m")
+        scan_seconds = time.perf_counter() - start
+        assert len(history["close"]) == n_rows
+
+        last_ms = START_MS + n_rows * MINUTE_MS - DAY_MS
+        start = time.perf_counter()
+        for _ in range(n_windows):
+            window_start = random.randrange(START_MS, last_ms, MINUTE_MS)
+            db.read_ohlcv(1, "1m", window_start, window_start + DAY_MS)
+        window_seconds = time.perf_counter() - start
+
+        db.close()
+        db.db_engine.dispose()
+
+    return {
+        "write rows/s": n_rows / write_seconds,
+        "scan rows/s": n_rows / scan_seconds,
+        "windows/s": n_windows / window_seconds,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000, help="Candles written per profile.")
+    parser.add_argument("--batch-size", type=int, default=1_440, help="Candles per transaction.")
+    parser.add_argument("--windows", type=int, default=200, help="Random one day reads.")
+    parser.add_argument("--profiles", nargs="*", default=list(SQLITE_PROFILES))
+    args = parser.parse_args()
+
+    app_logger.setLevel(logging.WARNING)
+    print(f"{'profile':<10} {'write rows/s':>14} {'scan rows/s':>14} {'windows/s':>12}")
+    for profile in args.profiles:
+        result = bench_profile(profile, args.rows, args.batch_size, args.windows)
+        print(
+            f"{profile:<10} {result['write rows/s']:>14,.0f} {result['scan rows/s']:>14,.0f} "
+            f"{result['windows/s']:>12,.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
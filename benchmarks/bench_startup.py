@@ -0,0 +1,62 @@
+"""
+Benchmark of the start-up time of the Torchtrader CLI and of the database path resolution.
+
+Every run starts a fresh interpreter, so module caches do not hide the cost of imports. The
+script exits with an error when the median start-up time goes over the budget, so it can guard
+against regressions such as eager imports of torch or ccxt in `main.py`.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 10 --budget 0.5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+COMMANDS = {
+    "python": [sys.executable, "-c", "pass"],
+    "main.py --help": [sys.executable, "main.py", "--help"],
+    "locate_database": [
+        sys.executable,
+        "-c",
+        "from torchtrader.data.database import locate_database; locate_database()",
+    ],
+}
+
+
+def bench_command(command: list, n_runs: int) -> float:
+    timings = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=PROJECT_DIR, capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10, help="Interpreter starts per command.")
+    parser.add_argument(
+        "--budget", type=float, default=0.5, help="Maximum median start-up of main.py (s)."
+    )
+    args = parser.parse_args()
+
+    print(f"{'command':<18} {'median s':>10}")
+    results = {}
+    for name, command in COMMANDS.items():
+        results[name] = bench_command(command, args.runs)
+        print(f"{name:<18} {results[name]:>10.3f}")
+
+    if results["main.py --help"] > args.budget:
+        sys.exit(
+            f"main.py start-up took {results['main.py --help']:.3f} s, "
+            f"over the budget of {args.budget:.3f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
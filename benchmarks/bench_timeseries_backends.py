@@ -0,0 +1,54 @@
+"""
+Benchmark of full-history OHLCV loads from the SQLite and the columnar time series backends.
+
+Usage:
+    python benchmarks/bench_timeseries_backends.py --days 365
+"""
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from torchtrader.data.database import GenericDatabase
+from torchtrader.data.timeseries import ColumnarStore
+from torchtrader.logs.logger import app_logger
+
+START_MS = 1_672_531_200_000
+MINUTE_MS = 60_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=365, help="Days of 1m candles to load.")
+    parser.add_argument("--repeat", type=int, default=5, help="Loads timed per backend.")
+    args = parser.parse_args()
+
+    app_logger.setLevel(logging.WARNING)
+    n_rows = args.days * 1_440
+    candles = {
+        "timestamp": [START_MS + i * MINUTE_MS for i in range(n_rows)],
+        **{column: [100.0] * n_rows for column in ("open", "high", "low", "close", "volume")},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backends = {
+            "sqlite": GenericDatabase(str(Path(tmp_dir) / "bench.db"), profile="research"),
+            "columnar": GenericDatabase(
+                str(Path(tmp_dir) / "bench.db"), timeseries=ColumnarStore(Path(tmp_dir) / "ohlcv")
+            ),
+        }
+        print(f"{'backend':<10} {'rows':>10} {'load ms':>10}")
+        for name, db in backends.items():
+            db.insert_ohlcv(1, "1m", candles)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                data = db.read_ohlcv(1, "1m", as_tensor=True)
+            load_ms = (time.perf_counter() - start) / args.repeat * 1000
+            print(f"{name:<10} {len(data['close']):>10,} {load_ms:>10.1f}")
+            db.close()
+            db.db_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,11 @@ module.
 import argparse
 import sys
 
+from torchtrader.logs.journal import trade_journal
 from torchtrader.logs.logger import app_logger
-from torchtrader.logs.logger import trade_logger
+from torchtrader.metrics import start_exporters
+from torchtrader.profiling import enable_profiling
+from torchtrader.profiling import profile_stage
 
 
 def trade_stocks(api_key, symbol, action, quantity):
@@ -22,8 +25,8 @@ def trade_stocks(api_key, symbol, action, quantity):
         action (str): The action to perform (buy or sell).
         quantity (int): The number of shares to trade.
     """
-    app_logger.info(f"Trading stocks with API key: {api_key}")
-    trade_logger.debug(f"Symbol: {symbol}, Action: {action}, Quantity: {quantity}")
+    app_logger.info("Trading stocks with API key: %s", api_key)
+    trade_journal().append(symbol, action, quantity, asset_type="stock")
     # Implement your stock trading logic here.
 
 
@@ -37,21 +40,60 @@ def trade_crypto(api_key, symbol, action, quantity):
         action (str): The action to perform (buy or sell).
         quantity (int): The number of units to trade.
     """
-    app_logger.info(f"Trading cryptocurrencies with API key: {api_key}")
-    trade_logger.debug(f"Symbol: {symbol}, Action: {action}, Quantity: {quantity}")
+    app_logger.info("Trading cryptocurrencies with API key: %s", api_key)
+    trade_journal().append(symbol, action, quantity, asset_type="crypto")
     # Implement your cryptocurrency trading logic here.
 
 
+def run_fleet_mode(args):
+    """
+    Run the bots of the `fleet` configuration in a long-running process, until SIGINT or
+    SIGTERM. SIGHUP reloads the fleet configuration.
+
+    Args:
+        args (list): Command-line arguments following `fleet`.
+    """
+    parser = argparse.ArgumentParser(
+        prog="main.py fleet", description="Torchtrader: run the fleet of bots of config.yaml."
+    )
+    parser.add_argument(
+        "--shard-by-exchange",
+        action="store_true",
+        default=None,
+        help="Run the bots of every exchange in their own worker process.",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="deterministic",
+        choices=["deterministic", "sampling"],
+        help="Profile the fleet processes, sample them live with SIGUSR1.",
+    )
+
+    parsed_args = parser.parse_args(args)
+    start_exporters()
+    # Imported here, one-off trades do not pay for torch
+    from torchtrader.fleet import run_fleet
+
+    run_fleet(shard_by_exchange=parsed_args.shard_by_exchange, profile=parsed_args.profile)
+
+
 def main(args):
     """
     The main function for the Torchtrader app. It parses command-line arguments and calls the
-    appropriate trading function based on the provided arguments.
+    appropriate trading function based on the provided arguments, or runs the fleet of bots
+    when the first argument is `fleet`.
 
     Args:
         args (list): Command-line arguments for the app.
     """
+    if args and args[0] == "fleet":
+        run_fleet_mode(args[1:])
+        return
+
     parser = argparse.ArgumentParser(
-        description="Torchtrader: A simple trading app for stocks and cryptocurrencies."
+        description="Torchtrader: A simple trading app for stocks and cryptocurrencies.",
+        epilog="Run `main.py fleet --help` for the long-running mode trading the configured bots.",
     )
 
     parser.add_argument("api_key", type=str, help="API key for your trading account.")
@@ -71,20 +113,32 @@ def main(args):
     parser.add_argument(
         "quantity", type=int, help="The number of shares or units of the asset you want to trade."
     )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="deterministic",
+        choices=["deterministic", "sampling"],
+        help="Profile the pipeline stages and write the reports under reports/profiles.",
+    )
 
     parsed_args = parser.parse_args(args)
+    start_exporters()
+    profiler = enable_profiling(mode=parsed_args.profile) if parsed_args.profile else None
+
+    order = (parsed_args.api_key, parsed_args.symbol, parsed_args.action, parsed_args.quantity)
 
-    if parsed_args.asset_type == "stock":
-        trade_stocks(
-            parsed_args.api_key, parsed_args.symbol, parsed_args.action, parsed_args.quantity
-        )
-    elif parsed_args.asset_type == "crypto":
-        trade_crypto(
-            parsed_args.api_key, parsed_args.symbol, parsed_args.action, parsed_args.quantity
-        )
-    else:
-        raise ValueError("Invalid asset type. Choose either 'stock' or 'crypto'.")
+    try:
+        with profile_stage("trade"):
+            if parsed_args.asset_type == "stock":
+                trade_stocks(*order)
+            elif parsed_args.asset_type == "crypto":
+                trade_crypto(*order)
+            else:
+                raise ValueError("Invalid asset type. Choose either 'stock' or 'crypto'.")
+    finally:
+        if profiler is not None:
+            profiler.close()
 
 
-if __name__ == "main":
+if __name__ == "__main__":
     main(sys.argv[1:])
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from torchtrader.data.async_database import OHLCVWriteBatcher
+from torchtrader.data.ops_specific import AsyncOperations
+
+
+@pytest.fixture
+async def async_ops(tmp_path):
+    async with AsyncOperations(str(tmp_path / "torchtrader_test.db"), flush_interval=0.05) as ops:
+        exchange_id = await ops.create_exchange({"name": "Binance"})
+        trading_product_id = await ops.create_trading_product(
+            {"name": "Bitcoin", "product_type": "Cryptocurrency", "ticker": "BTC"}
+        )
+        ops.asset_id = await ops.create_asset(
+            {
+                "name": "BTC/USDT",
+                "base_currency": "BTC",
+                "quote_currency": "USDT",
+                "trading_product_id": trading_product_id,
+                "exchange_id": exchange_id,
+            }
+        )
+        yield ops
+
+
+async def test_async_operations(async_ops):
+    exchanges = await async_ops.read_exchange()
+    assert [exchange.name for exchange in exchanges] == ["Binance"]
+
+    await async_ops.update_exchange({"name": "Binance"}, {"name": "Kraken"})
+    assert len(await async_ops.read_exchange({"name": "Kraken"})) == 1
+
+    candles = [[1_672_531_200_000 + i * 60_000, 1.0, 2.0, 0.5, 1.5, 10.0] for i in range(10)]
+    assert await async_ops.create_data_points(async_ops.asset_id, "1m", candles) == (10, 0)
+    data = await async_ops.read_data_points(async_ops.asset_id, "1m")
+    assert data["timestamp"].tolist() == [row[0] for row in candles]
+
+
+async def test_write_batcher_coalesces_collectors(async_ops):
+    async def collector(offset):
+        for i in range(20):
+            timestamp = 1_672_531_200_000 + (offset * 20 + i) * 60_000
+            async_ops.writer.submit(async_ops.asset_id, "1m", [[timestamp, 1, 2, 0.5, 1.5, 10]])
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(collector(offset) for offset in range(5)))
+    # Nothing was written by the collectors themselves
+    assert async_ops.writer.pending == 100
+
+    await asyncio.sleep(0.2)
+    assert async_ops.writer.pending == 0
+    assert async_ops.writer.inserted == 100
+
+    data = await async_ops.read_data_points(async_ops.asset_id, "1m")
+    assert len(data["close"]) == 100
+
+
+async def test_write_batcher_drops_failing_writes(async_ops, monkeypatch):
+    async def failing_bulk_create(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(async_ops, "bulk_create", failing_bulk_create)
+    writer = OHLCVWriteBatcher(async_ops, batch_size=10, max_retries=3, max_pending=25)
+    candles = [[1_672_531_200_000 + i * 60_000, 1, 2, 0.5, 1.5, 10] for i in range(30)]
+    writer.submit(async_ops.asset_id, "1m", candles)
+    # The buffer is bounded, the oldest candles go first
+    assert writer.pending == 25
+    assert writer.dropped == 5
+
+    for _ in range(2):
+        assert await writer.flush() == (0, 0)
+        assert writer.pending == 25
+    # The rows are given up after max_retries failures instead of being retried forever
+    assert await writer.flush() == (0, 0)
+    assert writer.pending == 0
+    assert writer.dropped == 30
+    assert writer.inserted == 0
+
+
+async def test_write_batcher_stop_finishes_flush(async_ops, monkeypatch):
+    started = asyncio.Event()
+    bulk_create = async_ops.bulk_create
+
+    async def slow_bulk_create(*args, **kwargs):
+        started.set()
+        await asyncio.sleep(0.1)
+        return await bulk_create(*args, **kwargs)
+
+    monkeypatch.setattr(async_ops, "bulk_create", slow_bulk_create)
+    writer = OHLCVWriteBatcher(async_ops, batch_size=10, flush_interval=0.01)
+    writer.start()
+    candles = [[1_672_531_200_000 + i * 60_000, 1, 2, 0.5, 1.5, 10] for i in range(10)]
+    writer.submit(async_ops.asset_id, "1m", candles)
+    await started.wait()
+
+    # Stopping in the middle of the bulk insert keeps its rows
+    await writer.stop()
+    assert writer.inserted == 10
+    assert len((await async_ops.read_data_points(async_ops.asset_id, "1m"))["close"]) == 10
@@ -0,0 +1,76 @@
+import pytest
+import torch
+
+from torchtrader.evaluate.backtest import backtest
+from torchtrader.evaluate.backtest import crossover_signal_chunks
+from torchtrader.evaluate.backtest import crossover_signals
+from torchtrader.evaluate.backtest import moving_averages
+
+
+def naive_backtest(signals, prices, fee, delay=1):
+    # Bar by bar reference of a single (parameter set, asset) pair
+    equity, position, peak, drawdown, trades, curve = 1.0, 0.0, 1.0, 0.0, 0, []
+    for t in range(len(prices)):
+        target = float(signals[t - delay]) if t >= delay else 0.0
+        bar_return = prices[t] / prices[t - 1] - 1 if t else 0.0
+        cost = abs(target - position) * fee
+        trades += target != position
+        position = target
+        equity *= 1 + position * bar_return - cost
+        peak = max(peak, equity)
+        drawdown = max(drawdown, 1 - equity / peak)
+        curve.append(equity)
+    return equity - 1, drawdown, trades, curve
+
+
+def test_backtest_matches_bar_by_bar():
+    torch.manual_seed(0)
+    prices = 100 * torch.exp(torch.cumsum(torch.randn(3, 200, dtype=torch.float64) * 0.01, -1))
+    signals = torch.randint(-1, 2, (4, 3, 200)).double()
+
+    result = backtest(signals, prices, fee=0.001, slippage=0.0005, keep_curves=True, chunk_size=3)
+    assert result.total_return.shape == (4, 3)
+    assert result.equity.shape == (4, 3, 200)
+
+    for p in range(4):
+        for n in range(3):
+            total_return, drawdown, trades, curve = naive_backtest(
+                signals[p, n], prices[n].tolist(), 0.0015
+            )
+            assert float(result.total_return[p, n]) == pytest.approx(total_return)
+            assert float(result.max_drawdown[p, n]) == pytest.approx(drawdown)
+            assert int(result.trades[p, n]) == trades
+            assert result.equity[p, n].tolist() == pytest.approx(curve)
+
+
+def test_backtest_chunks_and_delay():
+    prices = torch.tensor([[100.0, 110.0, 121.0, 121.0]])
+    signals = torch.tensor([[1.0, 1.0, 0.0, 0.0]])
+
+    delayed = backtest(signals, prices, fee=0.0)
+    assert float(delayed.total_return[0, 0]) == pytest.approx(0.21)
+    immediate = backtest(signals, prices, fee=0.0, delay=0)
+    assert float(immediate.total_return[0, 0]) == pytest.approx(0.10)
+
+    with pytest.raises(ValueError):
+        backtest(signals, prices[:, :3])
+    for delay in (-1, 4):
+        with pytest.raises(ValueError, match="Delay"):
+            backtest(signals, prices, delay=delay)
+
+
+def test_crossover_signals():
+    prices = torch.arange(1.0, 21.0).repeat(2, 1)
+    averages = moving_averages(prices, [1, 3])
+    assert torch.isnan(averages[1, :, :2]).all()
+    assert averages[1, 0, 2] == pytest.approx(2.0)
+
+    signals = crossover_signals(prices, [2, 3], [5, 8, 10])
+    assert signals.shape == (6, 2, 20)
+    # Rising prices: the fast average stays above the slow one once both exist
+    assert (signals[0, :, 4:] == 1).all() and (signals[0, :, :4] == 0).all()
+
+    chunks = list(crossover_signal_chunks(prices, [2, 3], [5, 8, 10], chunk_size=4))
+    assert [len(chunk) for chunk in chunks] == [4, 2]
+    result = backtest(iter(chunks), prices)
+    assert torch.equal(result.trades, backtest(signals, prices).trades)
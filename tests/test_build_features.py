@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+import torch
+
+from torchtrader.data.timeseries import ColumnarStore
+from torchtrader.features.build_features import FeatureSpec
+from torchtrader.features.build_features import FeatureStore
+from torchtrader.ta.rsi import RSI
+
+SPECS = [
+    FeatureSpec("log_return"),
+    FeatureSpec("sma", {"window": 5}),
+    FeatureSpec("ema", {"period": 12}),
+    FeatureSpec("rsi", {"window": 14}),
+    FeatureSpec("macd", {"fast": 12, "slow": 26, "signal": 9}),
+    FeatureSpec("sma", {"window": 3}, source="volume"),
+]
+
+
+def candles(start: int, count: int):
+    rng = np.random.default_rng(start)
+    close = 100 + np.cumsum(rng.normal(size=count))
+    return {
+        "timestamp": 60_000 * np.arange(start, start + count),
+        "open": close,
+        "high": close + 1,
+        "low": close - 1,
+        "close": close,
+        "volume": rng.uniform(1, 10, count),
+    }
+
+
+@pytest.fixture
+def source(tmp_path):
+    return ColumnarStore(tmp_path / "ohlcv")
+
+
+def test_incremental_refresh_matches_full_build(source, tmp_path):
+    source.insert_ohlcv(1, "1m", candles(0, 100))
+    incremental = FeatureStore(tmp_path / "incremental")
+    assert incremental.refresh(source, 1, "1m", SPECS) == 100
+    for start, count in ((100, 1), (101, 7), (108, 92)):
+        source.insert_ohlcv(1, "1m", candles(start, count))
+        assert incremental.refresh(source, 1, "1m", SPECS) == count
+    assert incremental.refresh(source, 1, "1m", SPECS) == 0
+
+    full = FeatureStore(tmp_path / "full")
+    full.refresh(source, 1, "1m", SPECS)
+    appended, rebuilt = incremental.read(1, "1m", SPECS), full.read(1, "1m", SPECS)
+    assert list(appended) == list(rebuilt)
+    for name in rebuilt:
+        assert len(appended[name]) == 200
+        # Bit for bit, NaN warm-up included
+        assert np.array_equal(appended[name], rebuilt[name], equal_nan=True), name
+
+
+def test_features_match_ta(source, tmp_path):
+    data = candles(0, 60)
+    source.insert_ohlcv(1, "1m", data)
+    store = FeatureStore(tmp_path / "features")
+    store.refresh(source, 1, "1m", SPECS)
+    columns = store.read(1, "1m", SPECS)
+
+    expected = RSI()(torch.from_numpy(data["close"]), 14).numpy()
+    assert np.allclose(columns["rsi_14"][14:], expected[13:])
+    assert np.isnan(columns["rsi_14"][:14]).all()
+    assert np.allclose(columns["sma_5"][4:], np.convolve(data["close"], np.ones(5) / 5, "valid"))
+    assert columns["macd_12_9_26_histogram"] == pytest.approx(
+        columns["macd_12_9_26"] - columns["macd_12_9_26_signal"]
+    )
+
+
+def test_read_subset_and_range(source, tmp_path):
+    source.insert_ohlcv(1, "1m", candles(0, 50))
+    store = FeatureStore(tmp_path / "features")
+    store.refresh(source, 1, "1m", SPECS[:2])
+
+    columns = store.read(1, "1m", [SPECS[1]], start=60_000 * 10, end=60_000 * 20)
+    assert list(columns) == ["timestamp", "sma_5"]
+    assert columns["timestamp"].tolist() == list(range(600_000, 1_200_000, 60_000))
+    assert isinstance(columns["sma_5"], np.memmap)
+
+    # A feature added later is built from the first candle
+    store.refresh(source, 1, "1m", SPECS[:3])
+    assert store.matrix(1, "1m", SPECS[:3]).shape == (50, 3)
+    assert FeatureSpec("ema", {"period": 12}).key != FeatureSpec("ema", {"period": 26}).key
+    reordered = FeatureSpec("macd", {"signal": 9, "slow": 26, "fast": 12})
+    assert reordered.key == SPECS[4].key
+    assert reordered.columns == SPECS[4].columns
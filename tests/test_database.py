@@ -1,11 +1,26 @@
 import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
+import numpy as np
 import pytest
+import torch
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import inspect
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from torchtrader.data.database import DEFAULT_DATABASE_PATH
+from torchtrader.data.database import GenericDatabase
+from torchtrader.data.database import locate_database
+from torchtrader.data.database import OHLCV_COLUMNS
+from torchtrader.data.database import SQLITE_PROFILES
 from torchtrader.data.ops_specific import Operations
 from torchtrader.data.schema import Base
+from torchtrader.data.schema import DataPoint
+from torchtrader.data.schema import Exchange
 
 DB_PATH = "test.db"
 DB_URI = f"sqlite:///{DB_PATH}"
@@ -116,6 +131,277 @@ def test_operations(test_db):
     assert len(remaining_exchanges) == 0
 
 
+@pytest.fixture
+def tmp_ops(tmp_path):
+    ops = Operations(str(tmp_path / "torchtrader_test.db"))
+    exchange_id = ops.create_exchange({"name": "Binance"})
+    trading_product_id = ops.create_trading_product(
+        {"name": "Bitcoin", "product_type": "Cryptocurrency", "ticker": "BTC"}
+    )
+    ops.asset_id = ops.create_asset(
+        {
+            "name": "BTC/USDT",
+            "base_currency": "BTC",
+            "quote_currency": "USDT",
+            "trading_product_id": trading_product_id,
+            "exchange_id": exchange_id,
+        }
+    )
+
+    yield ops
+
+    ops.close()
+
+
+def make_candles(n_candles, start_ms=1_672_531_200_000, step_ms=60_000):
+    return [
+        [start_ms + i * step_ms, 100.0 + i, 101.0 + i, 99.0 + i, 100.5 + i, 10.0 * i]
+        for i in range(n_candles)
+    ]
+
+
+def test_create_data_points(tmp_ops):
+    candles = make_candles(1440)
+
+    # Lists of CCXT rows are inserted in one go
+    assert tmp_ops.create_data_points(tmp_ops.asset_id, "1m", candles) == (1440, 0)
+
+    # Overlapping candles are skipped instead of duplicated
+    assert tmp_ops.create_data_points(tmp_ops.asset_id, "1m", make_candles(1500)) == (60, 1440)
+
+    # The same candle in another timeframe is a different row
+    assert tmp_ops.create_data_points(tmp_ops.asset_id, "1h", candles[:1]) == (1, 0)
+
+    # Columnar input
+    columns = {
+        "timestamp": [row[0] for row in candles[:10]],
+        **{name: [row[i + 1] for row in candles[:10]] for i, name in enumerate(OHLCV_COLUMNS)},
+    }
+    assert tmp_ops.create_data_points(tmp_ops.asset_id, "1m", columns) == (0, 10)
+
+    data_points = tmp_ops.read(DataPoint, {"asset_id": tmp_ops.asset_id, "timeframe": "1m"})
+    assert len(data_points) == 1500
+    assert data_points[0].date_time == datetime(2023, 1, 1)
+    assert data_points[0].close == 100.5
+
+
+def test_read_data_points(tmp_ops):
+    candles = make_candles(100)
+    tmp_ops.create_data_points(tmp_ops.asset_id, "1m", candles[::-1])
+
+    # Whole history comes back sorted, one contiguous array per column
+    data = tmp_ops.read_data_points(tmp_ops.asset_id, "1m")
+    assert data["timestamp"].dtype == np.int64
+    assert data["timestamp"].tolist() == [row[0] for row in candles]
+    assert data["close"].flags["C_CONTIGUOUS"]
+    assert data["close"].tolist() == [row[4] for row in candles]
+
+    # [start, end) range, bounds given as epoch milliseconds or datetimes
+    data = tmp_ops.read_data_points(
+        tmp_ops.asset_id, "1m", candles[10][0], datetime(2023, 1, 1, 0, 20), as_tensor=True
+    )
+    assert isinstance(data["open"], torch.Tensor)
+    assert data["open"].tolist() == [row[1] for row in candles[10:20]]
+
+    assert len(tmp_ops.read_data_points(tmp_ops.asset_id, "1h")["timestamp"]) == 0
+
+
+@pytest.mark.parametrize("profile", ["ingest", "research"])
+def test_sqlite_profile(tmp_path, profile):
+    db = GenericDatabase(str(tmp_path / "torchtrader_test.db"), profile=profile)
+
+    pragmas = SQLITE_PROFILES[profile]
+    with db.db_engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        # NORMAL
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        assert connection.exec_driver_sql("PRAGMA cache_size").scalar() == pragmas["cache_size"]
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == pragmas["busy_timeout"]
+
+    db.close()
+
+
+def test_reference_cache(tmp_ops):
+    statements = []
+    event.listen(
+        tmp_ops.db_engine,
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+
+    # Warm entries and created rows resolve without queries
+    assert tmp_ops.get_asset_id("BTC/USDT") == tmp_ops.asset_id
+    assert tmp_ops.get_trading_product_id("BTC") is not None
+    exchange_id = tmp_ops.get_exchange_id("Binance")
+    assert tmp_ops.create_exchange({"name": "Binance"}) == exchange_id
+    assert statements == []
+
+    # A fresh instance warms its cache from the database
+    ops = Operations(str(tmp_ops.database_uri))
+    assert ops.get_asset_id("BTC/USDT") == tmp_ops.asset_id
+    ops.close()
+
+    # A known name with other data is still refused
+    asset = tmp_ops.read_asset({"name": "BTC/USDT"})[0]
+    fields = ("name", "base_currency", "quote_currency", "trading_product_id", "exchange_id")
+    data = {name: getattr(asset, name) for name in fields}
+    assert tmp_ops.create_asset(data) == tmp_ops.asset_id
+    assert tmp_ops.create_asset({**data, "quote_currency": "EUR"}) == -1
+
+    # Updates and deletes invalidate the cache
+    tmp_ops.update_exchange({"name": "Binance"}, {"name": "Kraken"})
+    assert tmp_ops.get_exchange_id("Binance") is None
+    assert tmp_ops.get_exchange_id("Kraken") == exchange_id
+    tmp_ops.delete_asset({"name": "BTC/USDT"})
+    assert tmp_ops.get_asset_id("BTC/USDT") is None
+
+
+def test_iter_read(tmp_ops):
+    tmp_ops.create_data_points(tmp_ops.asset_id, "1m", make_candles(2500))
+
+    data_points = list(tmp_ops.iter_read(DataPoint, {"timeframe": "1m"}, batch_size=1000))
+    assert len(data_points) == 2500
+    assert [point.id for point in data_points] == sorted(point.id for point in data_points)
+
+    rows = list(
+        tmp_ops.iter_read(
+            DataPoint, batch_size=700, columns=["date_time", "close"], order_by="date_time"
+        )
+    )
+    assert len(rows) == 2500
+    assert rows[0] == (datetime(2023, 1, 1), 100.5)
+
+    batches = list(tmp_ops.iter_ohlcv(tmp_ops.asset_id, "1m", batch_size=1000))
+    assert [len(batch["close"]) for batch in batches] == [1000, 1000, 500]
+    full = tmp_ops.read_data_points(tmp_ops.asset_id, "1m")
+    assert np.array_equal(np.concatenate([b["timestamp"] for b in batches]), full["timestamp"])
+
+
+def test_bulk_update(tmp_ops):
+    candles = make_candles(1000)
+    tmp_ops.create_data_points(tmp_ops.asset_id, "1m", candles)
+
+    # Fix the close of every candle in one transaction
+    fixes = [
+        (
+            {"asset_id": tmp_ops.asset_id, "timeframe": "1m", "date_time": datetime(2023, 1, 1)},
+            {"close": -1.0},
+        )
+    ] + [({"id": i}, {"close": 0.0, "volume": 1.0}) for i in range(2, 1001)]
+    assert tmp_ops.bulk_update(DataPoint, fixes) == (1000, 0)
+    data = tmp_ops.read_data_points(tmp_ops.asset_id, "1m")
+    assert data["close"][0] == -1.0
+    assert (data["close"][1:] == 0.0).all() and (data["volume"][1:] == 1.0).all()
+
+    # Values already held by another row, or claimed earlier in the batch, are dropped
+    tmp_ops.create_exchange({"name": "Kraken"})
+    tmp_ops.create_exchange({"name": "Bitstamp"})
+    renames = [
+        ({"name": "Binance"}, {"name": "Kraken"}),
+        ({"name": "Kraken"}, {"name": "Kraken"}),
+        ({"name": "Bitstamp"}, {"name": "Coinbase"}),
+        ({"name": "Kraken"}, {"name": "Coinbase"}),
+    ]
+    assert tmp_ops.bulk_update(Exchange, renames) == (2, 2)
+    names = sorted(exchange.name for exchange in tmp_ops.read_exchange())
+    assert names == ["Binance", "Coinbase", "Kraken"]
+    assert tmp_ops.get_exchange_id("Bitstamp") is None
+
+    # Composite key violations roll the whole batch back
+    duplicate = [({"id": 2}, {"date_time": datetime(2023, 1, 1)})]
+    assert tmp_ops.bulk_update(DataPoint, duplicate) is None
+
+
+def test_concurrent_readers_and_writer(tmp_path):
+    db_path = str(tmp_path / "torchtrader_test.db")
+    writer = GenericDatabase(db_path, profile="ingest")
+    reader = GenericDatabase(db_path, profile="research", read_only=True)
+    n_batches, batch_size = 50, 200
+    errors = []
+
+    def write():
+        for batch in range(n_batches):
+            candles = make_candles(batch_size, start_ms=1_672_531_200_000 + batch * 12_000_000)
+            if writer.insert_ohlcv(1, "1m", candles) != (batch_size, 0):
+                errors.append(f"batch {batch} not written")
+        writer.close()
+
+    def read():
+        seen = 0
+        while seen < n_batches * batch_size:
+            n_rows = len(reader.read_ohlcv(1, "1m")["close"])
+            # Readers only ever see whole committed transactions
+            if n_rows < seen or n_rows % batch_size:
+                errors.append(f"inconsistent read of {n_rows} rows after {seen}")
+                break
+            with reader.session() as session:
+                session.execute(select(DataPoint.id).limit(10)).all()
+            seen = n_rows
+        reader.close()
+
+    with ThreadPoolExecutor(max_workers=9) as pool:
+        futures = [pool.submit(write)] + [pool.submit(read) for _ in range(8)]
+        for future in futures:
+            future.result(timeout=60)
+
+    assert errors == []
+    # The read-only connection refuses writes
+    assert reader.create(Exchange, {"name": "Binance"}) is None
+    assert len(writer.read(DataPoint)) == n_batches * batch_size
+    writer.dispose()
+    reader.dispose()
+
+
+def test_upgrade_old_schema(tmp_path):
+    path = tmp_path / "old.db"
+    with sqlite3.connect(path) as connection:
+        # data_points as created before the timeframe column and its unique index
+        connection.execute(
+            "CREATE TABLE data_points (id INTEGER PRIMARY KEY, asset_id INTEGER NOT NULL, "
+            "date_time DATETIME NOT NULL, open FLOAT NOT NULL, high FLOAT NOT NULL, "
+            "low FLOAT NOT NULL, close FLOAT NOT NULL, volume FLOAT NOT NULL)"
+        )
+        connection.execute(
+            "INSERT INTO data_points "
+            "VALUES (1, 1, '2023-01-01 00:00:00.000000', 1, 2, 0.5, 1.5, 10)"
+        )
+    connection.close()
+
+    with pytest.raises(RuntimeError, match="timeframe"):
+        GenericDatabase(str(path), read_only=True)
+
+    db = GenericDatabase(str(path))
+    assert [point.timeframe for point in db.read(DataPoint)] == ["1m"]
+    indexes = {index["name"] for index in inspect(db.db_engine).get_indexes("data_points")}
+    assert "ix_data_points_asset_timeframe_date_time" in indexes
+    candles = [[1_672_531_200_000 + i * 60_000, 1, 2, 0.5, 1.5, 10] for i in range(2)]
+    assert db.insert_ohlcv(1, "1m", candles) == (1, 1)
+    db.dispose()
+
+
+def test_locate_database(tmp_path, monkeypatch):
+    def walk(*args, **kwargs):
+        raise AssertionError("locate_database must not walk the file system")
+
+    monkeypatch.setattr(os, "walk", walk)
+    monkeypatch.chdir(tmp_path)
+    data_dir = DEFAULT_DATABASE_PATH.parent
+
+    assert locate_database() == DEFAULT_DATABASE_PATH
+    assert locate_database(str(tmp_path / "a.db")) == tmp_path / "a.db"
+    assert locate_database("missing.db") == data_dir / "missing.db"
+    (tmp_path / "local.db").touch()
+    assert locate_database("local.db") == tmp_path / "local.db"
+    (tmp_path / "missing.db").touch()
+    assert locate_database("missing.db") == tmp_path / "missing.db"
+    (tmp_path / "other").mkdir()
+    monkeypatch.chdir(tmp_path / "other")
+    assert locate_database("local.db") == data_dir / "local.db"
+
+    monkeypatch.setenv("TORCHTRADER_DB_PATH", str(tmp_path / "env.db"))
+    assert locate_database() == tmp_path / "env.db"
+
+
 # Run pytest
 if __name__ == "__main__":
     pytest.main(["-v"])
@@ -0,0 +1,164 @@
+import asyncio
+import math
+
+from torchtrader.fleet import BotSpec
+from torchtrader.fleet import Fleet
+from torchtrader.fleet import load_fleet
+from torchtrader.fleet import MarketDataHub
+from torchtrader.logs.journal import read_journal
+from torchtrader.logs.journal import TradeJournal
+from torchtrader.portfolio import PortfolioLedger
+from torchtrader.runtime import OrderIntent
+from torchtrader.runtime import Strategy
+
+
+class FakeExchange:
+    """
+    Exchange whose candles of every symbol close one per poll, at a price rising by 1.
+    """
+
+    def __init__(self):
+        self.polls = {}
+
+    async def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        count = self.polls[symbol] = self.polls.get(symbol, 0) + 1
+        return [
+            [60_000 * index, index, index, index, float(index), 1.0]
+            for index in range(count, count + limit)
+        ]
+
+
+class Buyer(Strategy):
+    def __init__(self, quantity=1.0):
+        self.quantity = quantity
+
+    def on_bar(self, bars, values):
+        return "buy", self.quantity
+
+
+def make_fleet(tmp_path, **options):
+    hub = MarketDataHub(poll_interval=0.005)
+    exchange = FakeExchange()
+    hub.add_exchange("fake", exchange)
+    fleet = Fleet(
+        hub=hub,
+        ledger=PortfolioLedger(cash=100.0, **options),
+        journal=TradeJournal(tmp_path / "trades.journal"),
+    )
+    return fleet, exchange
+
+
+def spec(name, symbol="BTC/USDT", **options):
+    return BotSpec(name, symbol, "tests.test_fleet:Buyer", exchange="fake", **options)
+
+
+async def test_fleet_hot_add_remove(tmp_path):
+    fleet, exchange = make_fleet(tmp_path)
+    stop_event = asyncio.Event()
+    running = asyncio.create_task(fleet.run(stop_event, handle_signals=False))
+    await fleet.reload([spec("a"), spec("b"), spec("c", "ETH/USDT")])
+    await asyncio.sleep(0.05)
+    # Bots of the same symbol share its feed
+    assert len(fleet.hub.feeds) == 2
+
+    await fleet.reload([spec("a"), spec("b", params={"quantity": 2.0})])
+    assert set(fleet.runtime.bots) == {"a", "b"}
+    await asyncio.sleep(0.02)
+    assert list(fleet.hub.feeds) == [("fake", "BTC/USDT", "1m")]
+    polls = exchange.polls["ETH/USDT"]
+    await asyncio.sleep(0.05)
+    assert exchange.polls["ETH/USDT"] == polls
+
+    stop_event.set()
+    await asyncio.wait_for(running, 1)
+    assert not fleet.hub.feeds
+
+    ledger = fleet.ledger
+    positions = {name: float(ledger.position[row].sum()) for name, row in ledger.bots.items()}
+    assert positions["a"] > 1 and positions["c"] > 1
+    # Fills are booked at the close of the bar, which marks the ledger
+    assert ledger.summary("a")["equity"] == 100.0 + ledger.summary("a")["unrealized"]
+    fleet.journal.close()
+    trades = read_journal(tmp_path / "trades.journal")
+    assert trades["quantity"].sum() == sum(positions.values())
+
+
+async def test_fleet_risk_limits(tmp_path):
+    fleet, _ = make_fleet(tmp_path, max_exposure=5.0)
+    stop_event = asyncio.Event()
+    running = asyncio.create_task(fleet.run(stop_event, handle_signals=False))
+    await fleet.add(spec("a"))
+    await asyncio.sleep(0.1)
+    stop_event.set()
+    await asyncio.wait_for(running, 1)
+    # Orders increasing the exposure of a bot over its limit are dropped
+    assert fleet.ledger.position[0, 0] == 2.0
+
+
+def test_load_fleet(tmp_path):
+    config = tmp_path / "config.yaml"
+    config.write_text(
+        "fleet:\n"
+        "  bots:\n"
+        "    - {name: a, symbol: BTC/USDT, strategy: tests.test_fleet:Buyer}\n"
+        "    - {name: b, symbol: AAPL/USD, strategy: x:Y, exchange: alpaca, timeframe: 1h}\n"
+    )
+    assert [bot.name for bot in load_fleet(str(config))] == ["a", "b"]
+    (bot,) = load_fleet(str(config), exchange="alpaca")
+    assert (bot.symbol, bot.timeframe, bot.params) == ("AAPL/USD", "1h", {})
+
+
+class PricelessBuyer(Strategy):
+    def on_bar(self, bars, values):
+        return OrderIntent("a", "BTC/USDT", "buy", 1.0)
+
+
+async def test_fleet_prices_intents_without_price(tmp_path):
+    fleet, _ = make_fleet(tmp_path)
+    stop_event = asyncio.Event()
+    running = asyncio.create_task(fleet.run(stop_event, handle_signals=False))
+    await fleet.add(BotSpec("a", "BTC/USDT", "tests.test_fleet:PricelessBuyer", exchange="fake"))
+    await asyncio.sleep(0.05)
+    stop_event.set()
+    await asyncio.wait_for(running, 1)
+
+    summary = fleet.ledger.summary("a")
+    assert fleet.ledger.position[0, 0] > 0
+    assert all(math.isfinite(value) for value in summary.values())
+    fleet.journal.close()
+    prices = read_journal(tmp_path / "trades.journal")["price"]
+    # Filled at the close of the bars, 1, 2, ...
+    assert prices.tolist() == [float(index) for index in range(1, len(prices) + 1)]
+
+
+class FakeService:
+    def __init__(self):
+        self.stopped = False
+
+    async def stop(self):
+        await asyncio.sleep(0.01)
+        self.stopped = True
+
+
+class ModelBuyer(Buyer):
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+
+async def test_fleet_reload_stops_unused_services(tmp_path):
+    fleet, _ = make_fleet(tmp_path)
+    service = fleet.services[("model", "factory")] = FakeService()
+    strategy = "tests.test_fleet:ModelBuyer"
+    model = {"exchange": "fake", "model": "model", "model_factory": "factory"}
+    with_model = [BotSpec("a", "BTC/USDT", strategy, **model), spec("b")]
+    # Concurrent reloads run one after the other
+    await asyncio.gather(fleet.reload(with_model), fleet.reload(with_model))
+    assert fleet.runtime.bots["a"].strategy.service is service
+    assert not service.stopped
+
+    await asyncio.gather(fleet.reload([spec("b")]), fleet.reload([spec("b"), spec("c")]))
+    assert set(fleet.specs) == {"b", "c"}
+    assert service.stopped and not fleet.services
+    for name in list(fleet.specs):
+        fleet.remove(name)
@@ -0,0 +1,60 @@
+import math
+
+import numpy as np
+
+from torchtrader.logs.journal import HEADER_SIZE
+from torchtrader.logs.journal import read_journal
+from torchtrader.logs.journal import RECORD
+from torchtrader.logs.journal import TradeJournal
+
+
+def test_append_and_read(tmp_path):
+    path = tmp_path / "trades.journal"
+    with TradeJournal(path, chunk_records=4) as journal:
+        for i in range(10):
+            journal.append("BTC/USDT", "buy" if i % 2 else "sell", i, 100.0 + i, timestamp_ns=i)
+        journal.append("AAPL", "buy", 3, asset_type="stock")
+        assert len(journal) == 11
+
+    trades = read_journal(path)
+    assert trades["timestamp_ns"][:10].tolist() == list(range(10))
+    assert trades["symbol"][0] == "BTC/USDT" and trades["symbol"][-1] == "AAPL"
+    assert trades["side"][:2].tolist() == [-1, 1]
+    assert trades["asset_type"][-1] == 0
+    assert math.isnan(trades["price"][-1])
+    np.testing.assert_array_equal(trades["quantity"][:10], np.arange(10.0))
+
+
+def test_tail_recovery(tmp_path):
+    path = tmp_path / "trades.journal"
+    journal = TradeJournal(path, flush_every=1000, flush_interval=1000.0)
+    for i in range(5):
+        journal.append("ETH/USDT", "buy", i)
+    # Simulate a crash: records 0-4 were never committed and record 3 is torn
+    offset = HEADER_SIZE + 3 * RECORD.size + 10
+    journal._map[offset : offset + 4] = b"\xff\xff\xff\xff"
+    journal._map.flush()
+
+    assert len(read_journal(path)["quantity"]) == 3
+
+    recovered = TradeJournal(path)
+    assert len(recovered) == 3
+    recovered.append("ETH/USDT", "sell", 7)
+    recovered.close()
+    assert read_journal(path)["quantity"].tolist() == [0.0, 1.0, 2.0, 7.0]
+
+
+def test_concurrent_writers(tmp_path):
+    # Two writers of the same file, as two processes appending to the journal
+    path = tmp_path / "trades.journal"
+    first = TradeJournal(path, flush_every=3, chunk_records=4)
+    second = TradeJournal(path, flush_every=3, chunk_records=4)
+    for i in range(5):
+        first.append("BTC/USDT", "buy", i)
+        second.append("ETH/USDT", "sell", 10 + i)
+    first.close()
+    second.close()
+
+    trades = read_journal(path)
+    assert trades["quantity"].tolist() == [0.0, 10.0, 1.0, 11.0, 2.0, 12.0, 3.0, 13.0, 4.0, 14.0]
+    assert len(TradeJournal(path)) == 10
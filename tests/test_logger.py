@@ -0,0 +1,71 @@
+import logging
+
+from torchtrader.logs.logger import RateLimitFilter
+from torchtrader.logs.logger import setup_logger
+from torchtrader.logs.logger import stop_logging
+
+
+def make_record(created: float, level: int = logging.INFO, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("test", level, "bot.py", 42, "Filled %s", ("BTC",), None)
+    record.created = created
+    record.__dict__.update(extra)
+    return record
+
+
+def test_rate_limit_filter():
+    rate_limit = RateLimitFilter(rate=1.0, burst=2)
+
+    assert [rate_limit.filter(make_record(0.0)) for _ in range(4)] == [True, True, False, False]
+    # Errors are never dropped
+    assert rate_limit.filter(make_record(0.0, logging.ERROR))
+
+    record = make_record(1.0)
+    assert rate_limit.filter(record)
+    assert record.getMessage() == "Filled BTC (2 similar messages suppressed)"
+
+
+def test_rate_limit_message_without_args():
+    rate_limit = RateLimitFilter(rate=1.0, burst=1)
+    for created in (0.0, 0.0, 1.0):
+        record = logging.LogRecord("test", logging.INFO, "bot.py", 42, "100% filled", (), None)
+        record.created = created
+        passed = rate_limit.filter(record)
+    assert passed
+    assert record.getMessage() == "100% filled (1 similar messages suppressed)"
+
+
+def test_rate_limit_sampling():
+    rate_limit = RateLimitFilter(rate=1000.0, burst=1000)
+    passed = [rate_limit.filter(make_record(0.0, sample=10)) for _ in range(100)]
+    assert sum(passed) == 10
+
+
+def test_setup_logger(tmp_path):
+    logger = setup_logger("torchtrader.test", str(tmp_path / "test.log"), logging.DEBUG)
+    logger.debug("Order %s filled at %.2f", 7, 101.5)
+    stop_logging("torchtrader.test")
+
+    assert "Order 7 filled at 101.50" in (tmp_path / "test.log").read_text()
+
+
+def test_setup_logger_propagate(tmp_path, caplog):
+    logger = setup_logger("torchtrader.test_propagate", str(tmp_path / "test.log"))
+    with caplog.at_level(logging.INFO):
+        logger.info("Order %s filled", 8)
+    stop_logging("torchtrader.test_propagate")
+
+    assert "Order 8 filled" in caplog.text
+
+
+def test_setup_logger_twice(tmp_path):
+    logger = setup_logger("torchtrader.test_twice", str(tmp_path / "first.log"))
+    logger.info("First")
+    setup_logger("torchtrader.test_twice", str(tmp_path / "second.log"))
+    logger.info("Second")
+    stop_logging("torchtrader.test_twice")
+
+    # The first listener was stopped and its handler replaced, no record is written twice
+    assert len(logger.handlers) == 1
+    assert (tmp_path / "first.log").read_text().count("First") == 1
+    assert "Second" not in (tmp_path / "first.log").read_text()
+    assert (tmp_path / "second.log").read_text().count("Second") == 1
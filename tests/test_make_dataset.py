@@ -0,0 +1,81 @@
+import pickle
+
+import numpy as np
+import pytest
+import torch
+
+from torchtrader.data.make_dataset import load_features
+from torchtrader.data.make_dataset import make_loader
+from torchtrader.data.make_dataset import save_features
+from torchtrader.data.make_dataset import time_split
+from torchtrader.data.make_dataset import WindowDataset
+
+
+@pytest.fixture
+def series():
+    # Asset a: close 1..20 and a second feature, asset b: 12 bars
+    a = np.stack([np.arange(1.0, 21.0), np.arange(20.0)], axis=1)
+    b = np.stack([np.arange(1.0, 13.0) * 2, np.zeros(12)], axis=1)
+    return [a, b]
+
+
+def test_windows_are_views(series):
+    dataset = WindowDataset(series, window=5, horizon=2, stride=3)
+    # (20 - 5 - 2) // 3 + 1 windows for a, (12 - 5 - 2) // 3 + 1 for b
+    assert len(dataset) == 5 + 2
+    assert dataset.windows(0).shape == (5, 5, 2)
+
+    window, label = dataset[1]
+    assert window[:, 0].tolist() == [4.0, 5.0, 6.0, 7.0, 8.0]
+    assert float(label) == pytest.approx(np.log(10.0 / 8.0))
+    assert window.data_ptr() == torch.from_numpy(series[0]).data_ptr() + 3 * 2 * 8
+
+    assert dataset.locate(6) == (1, 3)
+    window, label = dataset[6]
+    assert window[:, 0].tolist() == [8.0, 10.0, 12.0, 14.0, 16.0]
+    with pytest.raises(IndexError):
+        dataset[7]
+
+    direction = WindowDataset(series, window=5, label="direction")
+    assert {float(direction[i][1]) for i in range(len(direction))} == {1.0}
+
+
+def test_time_split_does_not_leak(series):
+    dataset = WindowDataset(series, window=4, horizon=2)
+    train, validation = time_split(dataset, (0.75, 0.25), gap=1)
+    assert train.bounds == [(0, 15), (0, 9)]
+    assert validation.bounds == [(16, 20), (10, 12)]
+
+    for asset in range(2):
+        train_bars = [
+            train.locate(i)[1] + train.window - 1 + train.horizon
+            for i in range(len(train))
+            if train.locate(i)[0] == asset
+        ]
+        validation_bars = [
+            validation.locate(i)[1]
+            for i in range(len(validation))
+            if validation.locate(i)[0] == asset
+        ]
+        # The label bar of the last training window comes before any validation bar
+        assert max(train_bars) < min(validation_bars or [np.inf])
+
+
+def test_memory_mapped_features(series, tmp_path):
+    paths = [save_features(tmp_path / f"{i}.npy", array) for i, array in enumerate(series)]
+    features = [load_features(path) for path in paths]
+    dataset = WindowDataset(features, window=5)
+
+    # Worker processes receive the file names, not the arrays
+    assert [entry[0] for entry in dataset.__getstate__()["series"]] == ["memmap", "memmap"]
+    copy = pickle.loads(pickle.dumps(dataset))
+    assert isinstance(copy.series[0], np.memmap)
+    assert copy[3][0].tolist() == dataset[3][0].tolist()
+
+    batches = list(make_loader(dataset, batch_size=8, shuffle=False, workers=2))
+    windows = torch.cat([batch[0] for batch in batches])
+    assert windows.shape == (len(dataset), 5, 2)
+    assert windows[-1, :, 0].tolist() == [14.0, 16.0, 18.0, 20.0, 22.0]
+
+    balanced = make_loader(dataset, batch_size=len(dataset), balanced=True)
+    assert next(iter(balanced))[0].shape == (len(dataset), 5, 2)
@@ -0,0 +1,92 @@
+import asyncio
+import time
+import urllib.request
+
+import pytest
+
+from torchtrader.metrics import MetricsRegistry
+from torchtrader.metrics import start_file_dump
+from torchtrader.metrics import start_http_server
+from torchtrader.metrics import timed
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry(enabled=True)
+
+
+def test_metrics(registry):
+    rows = registry.counter("rows_total", "Rows", table="data_points")
+    rows.inc(3)
+    assert registry.counter("rows_total", table="data_points") is rows
+    registry.gauge("pending").set(7)
+
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+
+    text = registry.render()
+    assert 'rows_total{table="data_points"} 3' in text
+    assert "pending 7" in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+    assert "# TYPE latency_seconds histogram" in text
+
+
+def test_disabled_metrics():
+    registry = MetricsRegistry(enabled=False)
+    counter = registry.counter("calls_total")
+    histogram = registry.histogram("call_seconds")
+
+    @timed(histogram)
+    def call():
+        counter.inc()
+        return 1
+
+    assert call() == 1
+    assert counter.value == 0 and histogram.count == 0
+
+
+def test_timed(registry):
+    histogram = registry.histogram("call_seconds")
+
+    @timed(histogram)
+    def call():
+        time.sleep(0.001)
+
+    @timed(histogram)
+    async def async_call():
+        pass
+
+    call()
+    assert histogram.count == 1 and histogram.sum >= 0.001
+
+    asyncio.run(async_call())
+    assert histogram.count == 2
+
+
+def test_label_escaping(registry):
+    registry.counter("errors_total", error='bad "value"\\n\nnext').inc()
+    assert 'errors_total{error="bad \\"value\\"\\\\n\\nnext"} 1' in registry.render()
+
+
+def test_exporters(registry, tmp_path):
+    registry.counter("exported_total").inc()
+
+    server = start_http_server(0, registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert "exported_total 1" in response.read().decode()
+    finally:
+        server.shutdown()
+
+    stop = start_file_dump(tmp_path / "metrics.prom", interval=60, registry=registry)
+    stop.set()
+    for _ in range(100):
+        if (tmp_path / "metrics.prom").exists():
+            break
+        time.sleep(0.01)
+    assert "exported_total 1" in (tmp_path / "metrics.prom").read_text()
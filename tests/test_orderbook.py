@@ -0,0 +1,88 @@
+import math
+
+import numpy as np
+import pytest
+
+from torchtrader.data.orderbook import OrderBook
+from torchtrader.data.orderbook import read_replay
+from torchtrader.data.orderbook import write_replay
+
+
+@pytest.fixture
+def book():
+    book = OrderBook("BTC/USDT", capacity=4, history=3)
+    book.apply_snapshot(
+        {
+            "bids": [[99.0, 2.0], [100.0, 1.0], [98.0, 3.0]],
+            "asks": [[102.0, 2.0], [101.0, 1.0], [103.0, 0.0]],
+            "timestamp": 1,
+            "nonce": 10,
+        }
+    )
+    return book
+
+
+def test_snapshot_and_top_of_book(book):
+    assert (book.best_bid, book.best_ask) == (100.0, 101.0)
+    assert book.mid == 100.5 and book.spread == 1.0
+    np.testing.assert_array_equal(book.depth("bids"), [[100, 1], [99, 2], [98, 3]])
+    # Empty levels of a snapshot are dropped
+    np.testing.assert_array_equal(book.depth("asks", 5), [[101, 1], [102, 2]])
+    assert book.volume("bids", 1.0) == 3.0
+    assert book.imbalance(2) == 0.0
+
+
+def test_deltas(book):
+    assert book.apply({"type": "delta", "bids": [[100.5, 4.0], [99.0, 0.0]], "nonce": 11})
+    assert book.apply_delta({"asks": [[101.0, 0.0], [100.8, 1.0], [104.0, 1.0], [105.0, 1.0]]})
+    assert (book.best_bid, book.best_ask) == (100.5, 100.8)
+    np.testing.assert_array_equal(book.depth("bids")[:, 0], [100.5, 100, 98])
+    np.testing.assert_array_equal(book.depth("asks")[:, 0], [100.8, 102, 104, 105])
+    # Deltas older than the book are skipped
+    assert not book.apply_delta({"bids": [[100.7, 1.0]], "nonce": 11})
+    assert book.best_bid == 100.5
+
+    book.update("sell", 100.5, 0.0)
+    book.update("bids", 77.0, 0.0)
+    assert book.best_bid == 100.0
+
+
+def test_vwap(book):
+    assert book.vwap("buy", 1.0) == 101.0
+    assert book.vwap("buy", 2.0) == pytest.approx((101.0 + 102.0) / 2)
+    assert book.vwap("sell", 2.5) == pytest.approx((100.0 + 99.0 * 1.5) / 2.5)
+    assert math.isnan(book.vwap("buy", 10.0))
+
+
+def test_random_updates_match_a_dict():
+    rng = np.random.default_rng(0)
+    book = OrderBook(capacity=2)
+    expected = {"bids": {}, "asks": {}}
+    for _ in range(2000):
+        side = "bids" if rng.random() < 0.5 else "asks"
+        price = float(rng.integers(1, 60)) + (0 if side == "bids" else 100)
+        amount = float(rng.integers(0, 3))
+        book.update(side, price, amount)
+        if amount:
+            expected[side][price] = amount
+        else:
+            expected[side].pop(price, None)
+    for side, reverse in (("bids", True), ("asks", False)):
+        levels = sorted(expected[side].items(), reverse=reverse)
+        np.testing.assert_array_equal(book.depth(side), np.array(levels).reshape(-1, 2))
+
+
+def test_history_and_replay(book, tmp_path):
+    for nonce in range(11, 14):
+        book.apply_delta({"bids": [[100.0, float(nonce)]], "timestamp": nonce, "nonce": nonce})
+    history = book.history.columns()
+    np.testing.assert_array_equal(history["timestamp"], [11, 12, 13])
+    np.testing.assert_array_equal(history["bid_amount"], [11, 12, 13])
+    assert (history["ask"] == 101.0).all()
+
+    path = tmp_path / "book.jsonl"
+    write_replay(path, [{"bids": [[1.0, 1.0]], "asks": [[2.0, 1.0]], "nonce": 1}])
+    write_replay(path, [{"type": "delta", "asks": [[1.5, 1.0]], "nonce": 2}])
+    replayed = OrderBook()
+    assert all(replayed.apply(message) for message in read_replay(path))
+    assert (replayed.best_bid, replayed.best_ask, replayed.nonce) == (1.0, 1.5, 2)
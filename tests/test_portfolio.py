@@ -0,0 +1,95 @@
+import pytest
+import torch
+
+from torchtrader.logs.journal import TradeJournal
+from torchtrader.portfolio import PortfolioLedger
+
+
+def test_fills_and_mark_to_market():
+    ledger = PortfolioLedger(["a", "b"], ["BTC", "ETH"], cash=1000.0)
+    ledger.fill("a", "BTC", "buy", 2, 100.0, fee=1.0)
+    ledger.fill("a", "BTC", "buy", 2, 110.0)
+    assert ledger.avg_cost[0, 0] == 105.0
+    ledger.fill("a", "BTC", "sell", 1, 120.0)
+    assert ledger.realized[0, 0] == 15.0
+    assert ledger.avg_cost[0, 0] == 105.0
+
+    ledger.fill("b", "ETH", "sell", 3, 50.0)
+    ledger.mark(torch.tensor([130.0, 40.0]))
+    assert ledger.unrealized.tolist() == [[75.0, 0.0], [0.0, 30.0]]
+    assert ledger.exposure.tolist() == [[390.0, 0.0], [0.0, 120.0]]
+
+    summary = ledger.summary("a")
+    assert summary["cash"] == 1000.0 - 201.0 - 220.0 + 120.0
+    assert summary["equity"] == summary["cash"] + 3 * 130.0
+    assert summary["equity"] == 1000.0 + 15.0 + 75.0 - 1.0
+    assert summary["fees"] == 1.0
+
+    # Flip from short to long: the long side opens at the fill price
+    ledger.fill("b", "ETH", "buy", 5, 45.0)
+    assert ledger.realized[1, 1] == 15.0
+    assert ledger.position[1, 1] == 2.0 and ledger.avg_cost[1, 1] == 45.0
+    ledger.fill("b", "ETH", "sell", 2, 46.0)
+    assert ledger.position[1, 1] == 0.0 and ledger.avg_cost[1, 1] == 0.0
+    assert ledger.unrealized[1, 1] == 0.0
+
+
+def test_batch_matches_sequential_fills():
+    torch.manual_seed(0)
+    bots, assets, n = 5, 7, 400
+    rows = torch.randint(0, bots, (n,))
+    columns = torch.randint(0, assets, (n,))
+    quantities = torch.randint(-3, 4, (n,)).double()
+    prices = 100 + torch.randn(n, dtype=torch.float64)
+    names = [str(index) for index in range(bots)]
+    symbols = [str(index) for index in range(assets)]
+
+    batched = PortfolioLedger(names, symbols)
+    batched.apply_fills(rows, columns, quantities, prices)
+    sequential = PortfolioLedger(names, symbols)
+    for fill in zip(rows, columns, quantities, prices):
+        sequential.apply_fills(*(value.reshape(1) for value in fill))
+
+    for name in ("position", "avg_cost", "realized", "cash", "equity"):
+        torch.testing.assert_close(getattr(batched, name), getattr(sequential, name))
+
+
+def test_risk_checks_and_hot_add():
+    ledger = PortfolioLedger(["a", "b"], cash=1000.0, max_exposure=500.0, max_drawdown=0.1)
+    ledger.fill("a", "BTC", "buy", 4, 100.0)
+    ledger.fill("b", "BTC", "buy", 6, 100.0)
+    assert ledger.check_risk().exposure.tolist() == [False, True]
+    ledger.mark({"BTC": 80.0})
+    report = ledger.check_risk()
+    assert report.drawdown.tolist() == [False, True]
+    assert ledger.breaches() == ["b"]
+    assert ledger.drawdown[0].item() == pytest.approx(0.08)
+
+    ledger.add_bot("c", cash=10.0)
+    ledger.fill("c", "ETH", "buy", 1, 5.0)
+    assert ledger.position.shape == (3, 2)
+    assert ledger.summary("c")["equity"] == 10.0
+
+
+def test_drawdown_needs_cash():
+    # Without cash the equity has no positive peak to draw down from
+    with pytest.raises(ValueError):
+        PortfolioLedger(max_drawdown=0.1)
+    ledger = PortfolioLedger(["a"], cash=1000.0, max_drawdown=0.1)
+    with pytest.raises(ValueError):
+        ledger.add_bot("b", cash=0.0)
+
+    ledger.fill("a", "BTC", "buy", 1, 100.0)
+    ledger.mark({"BTC": 10.0})
+    assert ledger.drawdown[0].item() == pytest.approx(0.09)
+
+
+def test_from_journal(tmp_path):
+    with TradeJournal(tmp_path / "trades.journal") as journal:
+        journal.append("BTC/USDT", "buy", 2, 100.0)
+        journal.append("BTC/USDT", "sell", 1, 110.0)
+        journal.append("ETH/USDT", "buy", 1)
+    ledger = PortfolioLedger.from_journal(tmp_path / "trades.journal")
+    assert list(ledger.assets) == ["BTC/USDT"]
+    assert ledger.position[0, 0] == 1.0
+    assert ledger.summary("journal")["realized"] == 10.0
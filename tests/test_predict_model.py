@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+import torch
+from torch import nn
+
+from torchtrader.models.predict_model import InferenceService
+
+
+class Recorder(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.linear = nn.Linear(4, 2)
+        self.batch_sizes = []
+
+    def forward(self, inputs):
+        self.batch_sizes.append(len(inputs))
+        return self.linear(inputs)
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    return Recorder()
+
+
+async def test_micro_batches(model):
+    samples = torch.randn(10, 4)
+    async with InferenceService(model, max_batch_size=4, max_wait_ms=50) as service:
+        predictions = await asyncio.gather(*(service.predict(sample) for sample in samples))
+
+    with torch.inference_mode():
+        expected = model.linear(samples)
+    assert torch.allclose(torch.stack(predictions), expected)
+    assert model.batch_sizes == [4, 4, 2]
+
+    stats = service.stats.summary()
+    assert stats["batches"] == 3
+    assert stats["requests"] == 10
+    assert stats["mean_batch_size"] == pytest.approx(10 / 3)
+    assert stats["throughput"] > 0
+
+
+async def test_max_wait_and_warm_up(model):
+    service = InferenceService(model, max_batch_size=64, max_wait_ms=1, example=torch.zeros(4))
+    async with service:
+        # Warm-up ran every power of two up to the max batch size
+        assert model.batch_sizes == [1, 2, 4, 8, 16, 32, 64]
+        first = await service.predict(torch.randn(4))
+        second = await service.predict(torch.randn(4))
+    # A lone request does not wait for a full batch
+    assert model.batch_sizes[-2:] == [1, 1]
+    assert first.shape == second.shape == (2,)
+
+
+async def test_failures_and_shapes(model):
+    async with InferenceService(model, max_batch_size=8, max_wait_ms=20, offload=False) as service:
+        good, bad = await asyncio.gather(
+            service.predict(torch.randn(4)), service.predict(torch.randn(3)), return_exceptions=True
+        )
+    assert good.shape == (2,)
+    # The malformed request fails alone, in its own shape group
+    assert isinstance(bad, RuntimeError)
+
+    with pytest.raises(RuntimeError):
+        await service.predict(torch.randn(4))
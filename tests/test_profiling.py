@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import torch
+
+from torchtrader import profiling
+from torchtrader.profiling import active_stages
+from torchtrader.profiling import enable_profiling
+from torchtrader.profiling import profiled
+from torchtrader.profiling import StageProfiler
+from torchtrader.ta.rsi import RSI
+
+
+def busy(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+def test_disabled_profiler():
+    profiler = StageProfiler(enabled=False)
+    with profiler.stage("collect"):
+        pass
+    assert profiler.close() is None
+
+
+def test_stage_reports(tmp_path):
+    profiler = StageProfiler(enabled=True, output_dir=tmp_path, sample_interval=0.001)
+    with profiler.stage("collect"):
+        busy(0.05)
+    with profiler.stage("features"):
+        RSI()(torch.rand(500), 14)
+
+    output_dir = profiler.close()
+    assert (output_dir / "collect.pstats").is_file()
+    assert "busy" in (output_dir / "collect.txt").read_text()
+    assert "busy" in (output_dir / "collect.folded").read_text()
+    assert "collect;" in (output_dir / "all.folded").read_text()
+    assert "stage:features" in (output_dir / "torch.txt").read_text()
+    summary = (output_dir / "summary.txt").read_text()
+    assert "collect" in summary and "features" in summary
+
+
+def test_sampling_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_profiler", StageProfiler(enabled=False))
+
+    @profiled("store")
+    def store():
+        busy(0.05)
+
+    store()
+    profiler = enable_profiling(mode="sampling", output_dir=tmp_path, sample_interval=0.001)
+    store()
+
+    output_dir = profiler.close()
+    assert not (output_dir / "store.pstats").exists()
+    assert "store" in (output_dir / "store.folded").read_text()
+
+
+async def test_stages_of_interleaved_coroutines(tmp_path):
+    profiler = StageProfiler(enabled=True, output_dir=tmp_path, sample_interval=0.001)
+
+    async def stage(name, other_started, started):
+        with profiler.stage(name, asynchronous=True):
+            started.set()
+            # The other coroutine enters its stage while this one is suspended
+            await other_started.wait()
+            await asyncio.sleep(0)
+            return active_stages()
+
+    collect, store = asyncio.Event(), asyncio.Event()
+    stages = await asyncio.gather(stage("collect", store, collect), stage("store", collect, store))
+    assert stages == [("collect",), ("store",)]
+    assert active_stages() == ()
+
+    output_dir = profiler.close()
+    # cProfile is not enabled around awaited code
+    assert not list(output_dir.glob("*.pstats"))
+    assert "collect" in (output_dir / "summary.txt").read_text()
@@ -0,0 +1,63 @@
+import pytest
+import torch
+from torch import nn
+
+from torchtrader.models.registry import CheckpointRegistry
+from torchtrader.models.registry import state_dict_digest
+
+
+def make_model():
+    return nn.Sequential(nn.Linear(4, 8), nn.ReLU(), nn.Linear(8, 2))
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return CheckpointRegistry(tmp_path / "checkpoints", pool_size=2)
+
+
+def test_save_deduplicates(registry):
+    torch.manual_seed(0)
+    model = make_model()
+    digest = registry.save("mlp", model, {"run": 1})
+    assert registry.path(digest).is_file()
+    # Same weights: same file and no new version
+    copy = make_model()
+    copy.load_state_dict(model.state_dict())
+    assert registry.save("mlp", copy) == digest
+    assert registry.save("mlp-copy", model.state_dict()) == digest
+    assert len(list(registry.root.glob("*/*.pt"))) == 1
+    assert [version["metadata"] for version in registry.versions("mlp")] == [{"run": 1}]
+
+    with torch.no_grad():
+        model[0].bias.add_(1)
+    newer = registry.save("mlp", model)
+    assert newer != digest
+    assert registry.resolve("mlp") == newer
+    assert registry.resolve("mlp", 0) == digest
+    assert registry.resolve(digest) == digest
+    with pytest.raises(KeyError):
+        registry.resolve("unknown")
+
+
+def test_load_memory_mapped_and_pooled(registry):
+    torch.manual_seed(0)
+    model = make_model()
+    registry.save("mlp", model)
+
+    first = registry.load("mlp", make_model)
+    second = registry.load("mlp", make_model)
+    assert first is second
+    assert not first.training
+    assert not any(parameter.requires_grad for parameter in first.parameters())
+    inputs = torch.randn(3, 4)
+    assert torch.equal(first(inputs), model(inputs).detach())
+    # The parameters are the tensors mapped from the checkpoint, not copies
+    mapped = registry.state_dict("mlp")
+    assert first[0].weight.data_ptr() == mapped["0.weight"].data_ptr()
+    assert state_dict_digest(mapped) == registry.resolve("mlp")
+
+    # The pool keeps the 2 most recently used entries
+    registry.save("other", nn.Linear(2, 2))
+    registry.state_dict("other")
+    registry.load("other", lambda: nn.Linear(2, 2))
+    assert registry.load("mlp", make_model) is not first
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from torchtrader.data.database import GenericDatabase
+from torchtrader.data.database import to_datetime
+from torchtrader.data.rollup import aggregate_ohlcv
+from torchtrader.data.rollup import RollupManager
+from torchtrader.data.schema import DataPoint
+
+START_MS = 1_672_531_200_000
+MINUTE_MS = 60_000
+HOUR_MS = 60 * MINUTE_MS
+
+
+def make_candles(first_minute, last_minute):
+    return [
+        [START_MS + i * MINUTE_MS, 100.0 + i, 101.0 + i, 99.0 - i, 100.5 + i, 1.0]
+        for i in range(first_minute, last_minute)
+    ]
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = GenericDatabase(str(tmp_path / "torchtrader_test.db"))
+    db.rollups = RollupManager(db, "1m", ["1h", "1d"])
+    yield db
+    db.dispose()
+
+
+def test_aggregate_ohlcv():
+    data = {
+        "timestamp": np.array([0, 30, 60, 90, 150]) * 1000,
+        "open": np.array([1.0, 2.0, 3.0, 4.0, 5.0]),
+        "high": np.array([5.0, 6.0, 1.0, 2.0, 3.0]),
+        "low": np.array([0.5, 0.1, 1.0, 0.2, 3.0]),
+        "close": np.array([1.5, 2.5, 3.5, 4.5, 5.5]),
+        "volume": np.array([1.0, 1.0, 2.0, 2.0, 3.0]),
+    }
+    rollup = aggregate_ohlcv(data, 60_000)
+    assert rollup["timestamp"].tolist() == [0, 60_000, 120_000]
+    assert rollup["open"].tolist() == [1.0, 3.0, 5.0]
+    assert rollup["high"].tolist() == [6.0, 2.0, 3.0]
+    assert rollup["low"].tolist() == [0.1, 0.2, 3.0]
+    assert rollup["close"].tolist() == [2.5, 4.5, 5.5]
+    assert rollup["volume"].tolist() == [2.0, 4.0, 3.0]
+
+
+def test_incremental_rollups(db):
+    # Two full hours and the beginning of a third one
+    db.insert_ohlcv(1, "1m", make_candles(0, 150))
+    hourly = db.read_ohlcv(1, "1h")
+    assert hourly["timestamp"].tolist() == [START_MS, START_MS + HOUR_MS, START_MS + 2 * HOUR_MS]
+    assert hourly["open"].tolist() == [100.0, 160.0, 220.0]
+    assert hourly["close"].tolist() == [159.5, 219.5, 249.5]
+    assert hourly["volume"].tolist() == [60.0, 60.0, 30.0]
+    assert db.read_ohlcv(1, "1d")["volume"].tolist() == [150.0]
+
+    # Only the bucket touched by new base candles is recomputed
+    db.insert_ohlcv(1, "1m", make_candles(150, 180))
+    assert db.rollups.refresh(1) == {"1h": 0, "1d": 0}
+    hourly = db.read_ohlcv(1, "1h")
+    assert hourly["close"].tolist() == [159.5, 219.5, 279.5]
+    assert hourly["low"].tolist()[-1] == 99.0 - 179
+
+    # A late candle in an old bucket updates it too
+    db.insert_ohlcv(1, "1m", [[START_MS - MINUTE_MS, 1.0, 1000.0, 1.0, 1.0, 5.0]])
+    hourly = db.read_ohlcv(1, "1h")
+    assert hourly["timestamp"][0] == START_MS - HOUR_MS
+    assert db.read_ohlcv(1, "1d")["volume"].tolist() == [5.0, 180.0]
+
+
+def test_rollups_follow_bulk_updates(db):
+    db.insert_ohlcv(1, "1m", make_candles(0, 90))
+    candle = {"asset_id": 1, "timeframe": "1m", "date_time": to_datetime(START_MS + 59 * MINUTE_MS)}
+    last = {**candle, "date_time": to_datetime(START_MS + 89 * MINUTE_MS)}
+    # Correct the close of the first hour and move the last candle two hours later
+    moved = to_datetime(START_MS + 3 * HOUR_MS)
+    assert db.bulk_update(DataPoint, [(candle, {"close": 500.0}), (last, {"date_time": moved})])
+
+    hourly = db.read_ohlcv(1, "1h")
+    assert hourly["timestamp"].tolist() == [START_MS, START_MS + HOUR_MS, START_MS + 3 * HOUR_MS]
+    assert hourly["close"].tolist() == [500.0, 188.5, 189.5]
+    assert hourly["volume"].tolist() == [60.0, 29.0, 1.0]
+
+    # Matching by id works too, the candle left its bucket empty
+    moved_id = db.read(DataPoint, {"timeframe": "1m", "date_time": moved})[0].id
+    assert db.bulk_update(DataPoint, [({"id": moved_id}, {"timeframe": "5m"})])
+    assert db.read_ohlcv(1, "1h")["timestamp"].tolist() == [START_MS, START_MS + HOUR_MS]
+    assert db.read_ohlcv(1, "1d")["volume"].tolist() == [89.0]
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import numpy as np
+import torch
+
+from torchtrader.data.collection import MarketData
+from torchtrader.metrics import indicator_seconds
+from torchtrader.metrics import REGISTRY
+from torchtrader.runtime import BarBuffer
+from torchtrader.runtime import market_data_source
+from torchtrader.runtime import OrderIntent
+from torchtrader.runtime import replay_source
+from torchtrader.runtime import Strategy
+from torchtrader.runtime import StrategyRuntime
+from torchtrader.ta.ema import ExponentialMovingAverage
+
+
+def make_bars(count: int):
+    return [(60_000 * i, i, i + 1, i - 1, float(i), 10.0) for i in range(1, count + 1)]
+
+
+class EmaCross(Strategy):
+    def __init__(self):
+        self.ema = torch.jit.script(ExponentialMovingAverage())
+
+    def indicators(self):
+        return {"ema": lambda bar: float(self.ema(torch.tensor(bar[4]), 0.5))}
+
+    def on_bar(self, bars, values):
+        if bars.last("close") > values["ema"] and len(bars) == 3:
+            return "buy", 1.0
+        return None
+
+
+class Sleepy(Strategy):
+    async def on_bar(self, bars, values):
+        await asyncio.sleep(1)
+
+
+def test_bar_buffer():
+    bars = BarBuffer(capacity=4)
+    for bar in make_bars(6):
+        bars.append(bar)
+
+    assert len(bars) == 4
+    assert bars.column("close").tolist() == [3.0, 4.0, 5.0, 6.0]
+    assert bars.column("close", 2).tolist() == [5.0, 6.0]
+    assert bars.last("timestamp") == 360_000
+    # Windows are views of the preallocated storage
+    assert np.shares_memory(bars.window(), bars._data)
+
+
+async def test_runtime():
+    intents = []
+    runtime = StrategyRuntime(budget_ms=20, on_intent=intents.append)
+    runtime.add_bot("ema", "BTC/USDT", EmaCross(), replay_source(make_bars(5), 0.005))
+    runtime.add_bot("slow", "ETH/USDT", Sleepy(), replay_source(make_bars(5)))
+
+    start = time.perf_counter()
+    await runtime.run()
+    # The slow bot abandons its decisions instead of stalling the loop for 1 s per bar
+    assert time.perf_counter() - start < 1
+
+    assert intents == [
+        OrderIntent("ema", "BTC/USDT", "buy", 1.0, 3.0, 180_000, intents[0].latency_ns)
+    ]
+    latency = runtime.latency()
+    assert latency["ema"]["count"] + latency["ema"]["conflated"] == 5
+    assert latency["ema"]["overruns"] == 0
+    assert latency["slow"]["overruns"] == latency["slow"]["count"] > 0
+    assert runtime.bots["slow"].bars.count == 5
+
+
+async def test_runtime_indicator_metrics(monkeypatch):
+    monkeypatch.setattr(REGISTRY, "enabled", True)
+    timer = indicator_seconds("ema")
+    count = timer.count
+    runtime = StrategyRuntime(budget_ms=20)
+    runtime.add_bot("ema", "BTC/USDT", EmaCross(), replay_source(make_bars(5)))
+    await runtime.run()
+
+    # One update per processed bar, conflated bars included
+    assert timer.count - count == 5
+
+
+async def test_runtime_stop_event():
+    async def endless():
+        timestamp = 0
+        while True:
+            timestamp += 60_000
+            yield (timestamp, 1.0, 1.0, 1.0, 1.0, 1.0)
+            await asyncio.sleep(0.001)
+
+    runtime = StrategyRuntime()
+    runtime.add_bot("idle", "BTC/USDT", Strategy(), endless())
+    stop_event = asyncio.Event()
+    asyncio.get_running_loop().call_later(0.05, stop_event.set)
+    await asyncio.wait_for(runtime.run(stop_event), 1)
+    assert runtime.bots["idle"].bars.count > 0
+
+
+async def test_runtime_hot_add_remove():
+    async def endless():
+        timestamp = 0
+        while True:
+            timestamp += 60_000
+            yield (timestamp, 1.0, 1.0, 1.0, 1.0, 1.0)
+            await asyncio.sleep(0.001)
+
+    runtime = StrategyRuntime()
+    stop_event = asyncio.Event()
+    running = asyncio.create_task(runtime.run(stop_event, persistent=True))
+    await asyncio.sleep(0.01)
+    # Without bots, a persistent runtime waits for some
+    assert not running.done()
+    runtime.add_bot("late", "BTC/USDT", Strategy(), endless())
+    runtime.add_bot("short", "ETH/USDT", Strategy(), replay_source(make_bars(3)))
+    await asyncio.sleep(0.05)
+    bot = runtime.remove_bot("late")
+    count = bot.bars.count
+    assert count > 0
+    await asyncio.sleep(0.02)
+    assert bot.bars.count == count
+    assert runtime.bots["short"].bars.count == 3
+    stop_event.set()
+    await asyncio.wait_for(running, 1)
+
+
+async def test_market_data_source_reuses_session(monkeypatch):
+    class FakeExchange:
+        def __init__(self):
+            self.polls = [make_bars(2)[:1], make_bars(2), make_bars(3)[1:], make_bars(4)[2:]]
+
+        async def fetch_ohlcv(self, symbol, timeframe, limit=None):
+            return [list(bar) for bar in self.polls.pop(0)]
+
+    sessions = []
+
+    @asynccontextmanager
+    async def setup_exchange(self):
+        self.exchange = FakeExchange()
+        sessions.append(self.exchange)
+        yield
+
+    monkeypatch.setattr(MarketData, "setup_exchange", setup_exchange)
+    source = market_data_source("binance", "BTC", "USDT", "1m", poll_interval=0.001)
+    bars = [await anext(source) for _ in range(3)]
+    await source.aclose()
+    # One exchange session for every poll, each bar emitted once after it closed
+    assert len(sessions) == 1
+    assert [bar[0] for bar in bars] == [60_000, 120_000, 180_000]
@@ -0,0 +1,29 @@
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def test_main_import_is_lightweight(tmp_path):
+    script = (
+        "import sys, main\n"
+        "heavy = [name for name in ('torch', 'ccxt', 'sqlalchemy') if name in sys.modules]\n"
+        "print(','.join(heavy))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == ""
+
+
+def test_main_help():
+    result = subprocess.run(
+        [sys.executable, "main.py", "--help"], cwd=PROJECT_DIR, capture_output=True, text=True
+    )
+    assert result.returncode == 0
+    assert "Torchtrader" in result.stdout
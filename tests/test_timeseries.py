@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import numpy as np
+import torch
+
+from torchtrader.data.database import GenericDatabase
+from torchtrader.data.schema import DataPoint
+from torchtrader.data.timeseries import ColumnarStore
+
+# 2023-01-31 23:00 UTC, so 120 candles of 1m span two monthly partitions
+START_MS = 1_675_206_000_000
+
+
+def make_candles(n_candles, start_ms=START_MS, step_ms=60_000):
+    return [
+        [start_ms + i * step_ms, 100.0 + i, 101.0 + i, 99.0 + i, 100.5 + i, 10.0 * i]
+        for i in range(n_candles)
+    ]
+
+
+def test_columnar_store(tmp_path):
+    store = ColumnarStore(tmp_path)
+    candles = make_candles(120)
+
+    assert store.insert_ohlcv(1, "1m", candles[:100]) == (100, 0)
+    # Already stored candles are skipped, only the new tail is appended
+    assert store.insert_ohlcv(1, "1m", candles[90:]) == (20, 10)
+
+    manifest = store.read_manifest(1, "1m")
+    assert [p["period"] for p in manifest["partitions"]] == ["2023-01", "2023-02"]
+    assert sum(p["rows"] for p in manifest["partitions"]) == 120
+
+    data = store.read_ohlcv(1, "1m")
+    assert data["timestamp"].tolist() == [row[0] for row in candles]
+    assert data["close"].tolist() == [row[4] for row in candles]
+
+    # A range inside one partition is a view of the memory-mapped file
+    data = store.read_ohlcv(1, "1m", candles[70][0], datetime(2023, 2, 1, 0, 30), as_tensor=True)
+    assert isinstance(data["open"], torch.Tensor)
+    assert data["open"].tolist() == [row[1] for row in candles[70:90]]
+
+    assert len(store.read_ohlcv(2, "1m")["close"]) == 0
+
+
+def test_columnar_store_backfill(tmp_path):
+    store = ColumnarStore(tmp_path)
+    candles = make_candles(120)
+    # Candles 40-60 missing from both months, the first ones stored later
+    store.insert_ohlcv(1, "1m", candles[10:40] + candles[60:])
+
+    # Gaps and history before the first candle are merged, stored ones still skipped
+    assert store.insert_ohlcv(1, "1m", candles[:50]) == (20, 30)
+    tail = make_candles(2, candles[-1][0] + 60_000)
+    assert store.insert_ohlcv(1, "1m", candles[45:65] + tail) == (12, 10)
+    data = store.read_ohlcv(1, "1m")
+    expected = candles + tail
+    assert data["timestamp"].tolist() == [row[0] for row in expected]
+    assert data["close"].tolist() == [row[4] for row in expected]
+
+    manifest = store.read_manifest(1, "1m")
+    assert [p.get("dir", p["period"]) for p in manifest["partitions"]] == ["2023-01.v2", "2023-02"]
+    # Only the partitions the manifest points to are kept
+    assert sorted(path.name for path in (tmp_path / "1" / "1m").iterdir()) == [
+        "2023-01.v2",
+        "2023-02",
+        "manifest.json",
+    ]
+
+
+def test_columnar_store_discards_interrupted_append(tmp_path):
+    store = ColumnarStore(tmp_path)
+    store.insert_ohlcv(1, "1d", make_candles(3, step_ms=86_400_000))
+
+    # Simulate a crash after writing column bytes but before the manifest
+    partition_dir = store.series_dir(1, "1d") / "2023"
+    with open(partition_dir / "close.bin", "ab") as column_file:
+        column_file.write(np.float64(-1.0).tobytes())
+
+    assert store.insert_ohlcv(1, "1d", make_candles(5, step_ms=86_400_000)) == (2, 3)
+    data = store.read_ohlcv(1, "1d")
+    assert data["close"].tolist() == [100.5, 101.5, 102.5, 103.5, 104.5]
+
+
+def test_generic_database_columnar_backend(tmp_path):
+    db = GenericDatabase(str(tmp_path / "torchtrader_test.db"), timeseries=ColumnarStore(tmp_path))
+
+    assert db.insert_ohlcv(1, "1m", make_candles(10)) == (10, 0)
+    assert len(db.read_ohlcv(1, "1m")["close"]) == 10
+    # Candles did not go to SQLite
+    assert db.read(DataPoint) == []
+    db.close()
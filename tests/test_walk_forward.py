@@ -0,0 +1,101 @@
+import pytest
+import torch
+
+from torchtrader.ta.ema import ExponentialMovingAverage
+from torchtrader.ta.rsi import RSI
+from torchtrader.train.walk_forward import ema
+from torchtrader.train.walk_forward import Fold
+from torchtrader.train.walk_forward import parameter_grid
+from torchtrader.train.walk_forward import rsi_signals
+from torchtrader.train.walk_forward import walk_forward_folds
+from torchtrader.train.walk_forward import WalkForwardOptimizer
+
+
+@pytest.fixture
+def prices():
+    torch.manual_seed(0)
+    return 100 * torch.exp(torch.cumsum(torch.randn(3, 1200, dtype=torch.float64) * 0.01, -1))
+
+
+def test_walk_forward_folds():
+    assert walk_forward_folds(10, 4, 3) == [Fold(0, 4, 4, 7), Fold(3, 7, 7, 10)]
+    assert walk_forward_folds(10, 4, 2, step=3, anchored=True) == [
+        Fold(0, 4, 4, 6),
+        Fold(0, 7, 7, 9),
+    ]
+    with pytest.raises(ValueError):
+        walk_forward_folds(5, 4, 3)
+
+
+def test_indicators_match_ta_modules(prices):
+    module = ExponentialMovingAverage()
+    expected = [module(value.clone(), 2 / 13).item() for value in prices[0, :50]]
+    assert ema(prices[:1, :50], [12])[0, 0].tolist() == pytest.approx(expected)
+
+    rsi = RSI()(prices[0], 14)
+    params = {"window": 14, "lower": 30, "upper": 70}
+    signals = rsi_signals(prices[:1], prices[:1], prices[:1], [params])
+    # Entries of the mean reversion on the RSI of the module, held until the opposite one
+    position = 0.0
+    for t in range(14, prices.shape[1]):
+        value = rsi[t - 1].item()
+        position = 1.0 if value < 30 else -1.0 if value > 70 else position
+        assert signals[0, 0, t].item() == position
+
+
+def test_parameter_grid():
+    grid = parameter_grid("macd", {"fast": [12, 26], "slow": [26], "signal": [9]})
+    assert grid == [{"fast": 12, "signal": 9, "slow": 26}]
+
+
+def test_walk_forward_optimizer(prices, tmp_path):
+    space = {"fast": [4, 8, 12], "slow": [20, 30], "signal": [5, 9]}
+    folds = walk_forward_folds(prices.shape[1], 400, 200)
+    options = {"workers": 0, "cache_path": tmp_path / "cache.jsonl"}
+
+    result = WalkForwardOptimizer("macd", space, folds, **options).run(prices)
+    assert len(result.ranking) == 12
+    # Successive halving: only the survivors of the first fold are scored on all of them
+    assert result.evaluations < 12 * len(folds)
+    assert result.ranking[0][2] == len(folds)
+    assert result.best_params == result.ranking[0][0]
+    assert len(result.fold_params) == len(result.test_scores) == len(folds)
+
+    resumed = WalkForwardOptimizer("macd", space, folds, **options).run(prices)
+    assert resumed.evaluations == 0
+    assert resumed.ranking == result.ranking
+    assert resumed.test_scores == result.test_scores
+
+    pooled = WalkForwardOptimizer(
+        "macd", space, folds, workers=2, chunk_size=4, cache_path=tmp_path / "pooled.jsonl"
+    ).run(prices)
+    assert pooled.ranking == pytest.approx(result.ranking)
+    assert pooled.test_scores == pytest.approx(result.test_scores)
+
+
+class ScriptedOptimizer(WalkForwardOptimizer):
+    # Train scores of every candidate per fold, instead of backtests
+    SCORES = [[5, 0, 0, 0], [4, 9, 9, 9], [0, 0, 0, 0], [0, 0, 0, 0]]
+
+    def _score(self, pool, close, high, low, indices, windows):
+        starts = [fold.train_start for fold in self.folds]
+        return {
+            index: [
+                float(self.SCORES[index][starts.index(start)]) if start in starts else 0.0
+                for start, _ in windows
+            ]
+            for index in indices
+        }
+
+
+def test_walk_forward_test_picks_use_past_folds_only(prices):
+    space = {"fast": [4, 8], "slow": [20, 30], "signal": [5]}
+    folds = walk_forward_folds(prices.shape[1], 400, 200)
+    assert len(folds) == 4
+    optimizer = ScriptedOptimizer("macd", space, folds, eta=2, workers=0)
+    result = optimizer.run(prices)
+    candidates = optimizer.candidates
+    # Candidate 1 wins the whole search thanks to the later folds, the first fold trades the
+    # best candidate on its own train window
+    assert result.best_params == candidates[1]
+    assert result.fold_params == [candidates[0]] + [candidates[1]] * 3
@@ -0,0 +1,49 @@
+"""
+torchtrader/config.py
+
+Access to the YAML configuration of the Torchtrader app, `config/config.yaml` by default. The
+`TORCHTRADER_CONFIG` environment variable points to another file.
+"""
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+from typing import Dict
+
+import yaml
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CONFIG_PATH = PROJECT_DIR / "config" / "config.yaml"
+
+
+@lru_cache(maxsize=None)
+def load_config(path: str | None = None) -> Dict[str, Any]:
+    """
+    Load and cache the configuration file.
+
+    Args:
+        path (str | None): The YAML file to load. Defaults to `TORCHTRADER_CONFIG` or
+            `config/config.yaml`.
+
+    Returns:
+        Dict[str, Any]: The configuration, empty if the file is missing or empty.
+    """
+    path = Path(path or os.environ.get("TORCHTRADER_CONFIG", DEFAULT_CONFIG_PATH))
+    if not path.is_file():
+        return {}
+    with path.open() as config_file:
+        return yaml.safe_load(config_file) or {}
+
+
+def get_section(name: str, path: str | None = None) -> Dict[str, Any]:
+    """
+    Get a top-level section of the configuration.
+
+    Args:
+        name (str): The section name, e.g. "database".
+        path (str | None): The YAML file to load, see `load_config`.
+
+    Returns:
+        Dict[str, Any]: The section, empty if it is not configured.
+    """
+    return load_config(path).get(name) or {}
@@ -0,0 +1,402 @@
+"""
+torchtrader/data/async_database.py
+
+Asyncio counterpart of `GenericDatabase`, built on `create_async_engine` and aiosqlite, plus a
+background task coalescing OHLCV writes from many coroutines into periodic bulk transactions.
+"""
+import asyncio
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import Sequence
+from typing import Tuple
+from typing import Type
+
+from sqlalchemy import and_
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm.exc import FlushError
+
+from torchtrader.data.database import apply_sqlite_profile
+from torchtrader.data.database import locate_database
+from torchtrader.data.database import ohlcv_arrays
+from torchtrader.data.database import OHLCV_KEY
+from torchtrader.data.database import ohlcv_params
+from torchtrader.data.database import ohlcv_select
+from torchtrader.data.database import sqlite_profile
+from torchtrader.data.schema import Base
+from torchtrader.data.schema import create_schema
+from torchtrader.data.schema import DataPoint
+from torchtrader.logs.logger import app_logger
+
+
+class AsyncGenericDatabase:
+    """
+    Non-blocking version of `GenericDatabase`.
+
+    Every operation runs in its own `AsyncSession`, so many coroutines can use the same instance
+    concurrently. Use it as an async context manager, or call `connect` and `close` explicitly.
+
+    Args:
+        db_path (str): The database location, resolved like in `GenericDatabase`.
+        batch_size (int): Rows buffered by the write batcher before it flushes early.
+        flush_interval (float): Seconds between periodic flushes of the write batcher.
+        profile (str | Dict[str, Any] | None): The SQLite storage profile, see `sqlite_profile`.
+    """
+
+    def __init__(
+        self,
+        db_path: str = None,
+        batch_size: int = 5000,
+        flush_interval: float = 0.5,
+        profile: str | Dict[str, Any] | None = None,
+    ):
+        self.database_uri = locate_database(db_path)
+
+        self.db_engine = create_async_engine(f"sqlite+aiosqlite:///{self.database_uri}")
+        apply_sqlite_profile(self.db_engine.sync_engine, sqlite_profile(profile))
+        self.session_factory = async_sessionmaker(self.db_engine, expire_on_commit=False)
+        self.writer = OHLCVWriteBatcher(self, batch_size, flush_interval)
+
+    async def __aenter__(self) -> "AsyncGenericDatabase":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def connect(self) -> None:
+        async with self.db_engine.begin() as connection:
+            await connection.run_sync(create_schema)
+        self.writer.start()
+        app_logger.info("Async database connected successfully.")
+
+    async def create(self, tableclass: Type[Base], data: Dict[str, Any]) -> int | None:
+        async with self.session_factory() as session:
+            try:
+                filter_dict = {k: v for k, v in data.items() if k != "id"}
+                result = await session.execute(select(tableclass).filter_by(**filter_dict))
+                existing_record = result.scalars().first()
+
+                if existing_record is not None:
+                    app_logger.warning(
+                        "A record with the same data already exists in %s. Skipping.",
+                        tableclass.__name__,
+                    )
+                    return existing_record.id
+
+                record = tableclass(**data)
+                session.add(record)
+                await session.commit()
+                app_logger.info("Created %s with data: %s", tableclass.__name__, data)
+                return record.id
+            except IntegrityError as e:
+                app_logger.error("Error creating %s: %s", tableclass.__name__, e)
+                await session.rollback()
+                return -1
+            except Exception as e:
+                app_logger.error("Unexpected error creating %s: %s", tableclass.__name__, e)
+                await session.rollback()
+                return None
+
+    async def bulk_create(
+        self,
+        tableclass: Type[Base],
+        rows: List[Dict[str, Any]],
+        conflict_columns: Sequence[str] | None = None,
+    ) -> Tuple[int, int] | None:
+        """
+        Insert many records in a single transaction, ignoring the ones that already exist.
+
+        Args:
+            tableclass (Type[Base]): The table to insert into.
+            rows (List[Dict[str, Any]]): The records to insert.
+            conflict_columns (Sequence[str] | None): The unique key deciding which rows are
+                duplicates. Any unique constraint applies when not given.
+
+        Returns:
+            Tuple[int, int] | None: The number of inserted and skipped rows, or None on error.
+        """
+        if not rows:
+            return 0, 0
+        async with self.session_factory() as session:
+            try:
+                statement = insert(tableclass.__table__).on_conflict_do_nothing(
+                    index_elements=conflict_columns
+                )
+                result = await session.execute(statement, rows)
+                await session.commit()
+                inserted = result.rowcount
+                skipped = len(rows) - inserted
+                app_logger.info(
+                    "Bulk inserted %s rows into %s (%s skipped)",
+                    inserted,
+                    tableclass.__name__,
+                    skipped,
+                )
+                return inserted, skipped
+            except Exception as e:
+                app_logger.error("Error bulk inserting into %s: %s", tableclass.__name__, e)
+                await session.rollback()
+                return None
+
+    async def insert_ohlcv(
+        self, asset_id: int, timeframe: str, data: Mapping[str, Sequence] | Sequence
+    ) -> Tuple[int, int] | None:
+        """
+        Bulk insert OHLCV candles right away, see `GenericDatabase.insert_ohlcv`.
+
+        Collectors that only need the candles to be stored eventually should call
+        `self.writer.submit` instead, which never waits on the database.
+        """
+        return await self.bulk_create(
+            DataPoint, ohlcv_params(asset_id, timeframe, data), conflict_columns=OHLCV_KEY
+        )
+
+    async def read_ohlcv(
+        self,
+        asset_id: int,
+        timeframe: str,
+        start: Any = None,
+        end: Any = None,
+        as_tensor: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Read the candles of an asset in the time range [start, end), see
+        `GenericDatabase.read_ohlcv`.
+        """
+        async with self.session_factory() as session:
+            try:
+                result = await session.execute(ohlcv_select(asset_id, timeframe, start, end))
+                rows = result.all()
+            except Exception as e:
+                app_logger.error(
+                    "Error reading OHLCV for asset %s (%s): %s", asset_id, timeframe, e
+                )
+                rows = []
+        return ohlcv_arrays(rows, as_tensor)
+
+    async def read(
+        self, tableclass: Type[Base], filters: Dict[str, Any] = None
+    ) -> List[Type[Base]]:
+        async with self.session_factory() as session:
+            try:
+                query = select(tableclass)
+
+                if filters:
+                    query = query.filter_by(**filters)
+
+                result = await session.execute(query)
+                records = list(result.scalars().all())
+                app_logger.info("Read %s records from %s", len(records), tableclass.__name__)
+                return records
+            except Exception as e:
+                app_logger.error("Error reading %s: %s", tableclass.__name__, e)
+                return []
+
+    async def update(
+        self, tableclass: Type[Base], record: Dict[str, Any], updates: Dict[str, Any]
+    ) -> None:
+        async with self.session_factory() as session:
+            try:
+                result = await session.execute(select(tableclass).filter_by(**record))
+                target_record = result.scalars().first()
+
+                if target_record is None:
+                    app_logger.warning("Record not found in %s. Skipping.", tableclass.__name__)
+                    return
+
+                for key, value in updates.items():
+                    # Check if the updated value is already present in the database
+                    result = await session.execute(
+                        select(tableclass.id).where(
+                            and_(
+                                getattr(tableclass, key) == value,
+                                tableclass.id != target_record.id,
+                            )
+                        )
+                    )
+
+                    if result.first():
+                        app_logger.warning(
+                            "%s with %s=%s already exists. Skipping update.",
+                            tableclass.__name__,
+                            key,
+                            value,
+                        )
+                        continue
+
+                    setattr(target_record, key, value)
+
+                await session.commit()
+                app_logger.info("Updated %s with record %s", tableclass.__name__, record)
+            except (IntegrityError, FlushError) as e:
+                app_logger.error(
+                    "Error updating %s with record %s: %s", tableclass.__name__, record, e
+                )
+                await session.rollback()
+            except Exception as e:
+                app_logger.error(
+                    "Unexpected error updating %s with record %s: %s",
+                    tableclass.__name__,
+                    record,
+                    e,
+                )
+                await session.rollback()
+
+    async def delete(self, tableclass: Type[Base], data: Dict[str, Any]) -> None:
+        async with self.session_factory() as session:
+            try:
+                result = await session.execute(select(tableclass).filter_by(**data))
+                target_record = result.scalars().first()
+
+                if not target_record:
+                    app_logger.warning(
+                        "Item %s doesn't exist in %s. Skipping.", data, tableclass.__name__
+                    )
+                    return
+
+                await session.delete(target_record)
+                await session.commit()
+                app_logger.info("Deleted %s with %s", tableclass.__name__, data)
+            except Exception as e:
+                app_logger.error(
+                    "Error deleting %s with record %s: %s", tableclass.__name__, data, e
+                )
+                await session.rollback()
+
+    async def close(self) -> None:
+        await self.writer.stop()
+        await self.db_engine.dispose()
+        app_logger.info("Async database closed.")
+
+
+class OHLCVWriteBatcher:
+    """
+    Background task that coalesces candles submitted by many coroutines into bulk inserts.
+
+    `submit` only appends to an in-memory buffer, so producers never wait on SQLite. The buffer
+    is written in one transaction every `flush_interval` seconds, or as soon as it holds
+    `batch_size` rows. A failed write is retried on the next flushes, and its rows are dropped
+    after `max_retries` failures in a row. The buffer holds at most `max_pending` rows, the
+    oldest ones are dropped beyond that, so a database that stays down cannot exhaust memory.
+
+    Args:
+        database (AsyncGenericDatabase): The database to write to.
+        batch_size (int): Buffered rows that trigger an early flush.
+        flush_interval (float): Seconds between periodic flushes.
+        max_retries (int): Failed flushes in a row after which their rows are dropped.
+        max_pending (int | None): Rows kept in the buffer, 20 batches by default.
+    """
+
+    def __init__(
+        self,
+        database: AsyncGenericDatabase,
+        batch_size: int = 5000,
+        flush_interval: float = 0.5,
+        max_retries: int = 3,
+        max_pending: int | None = None,
+    ):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_pending = max_pending or 20 * batch_size
+        self.inserted = 0
+        self.skipped = 0
+        self.dropped = 0
+        self._failures = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def submit(
+        self, asset_id: int, timeframe: str, data: Mapping[str, Sequence] | Sequence
+    ) -> None:
+        """
+        Queue candles for the next bulk insert without waiting for it.
+
+        Args:
+            asset_id (int): The asset the candles belong to.
+            timeframe (str): The candle timeframe, e.g. "1m".
+            data (Mapping[str, Sequence] | Sequence): Columnar arrays or a list of rows, see
+                `ohlcv_params`.
+        """
+        self._buffer.extend(ohlcv_params(asset_id, timeframe, data))
+        self._trim()
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> Tuple[int, int]:
+        """
+        Write everything buffered so far in a single transaction.
+
+        Returns:
+            Tuple[int, int]: The number of inserted and skipped candles in this flush.
+        """
+        async with self._lock:
+            rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0, 0
+            result = await self.database.bulk_create(DataPoint, rows, conflict_columns=OHLCV_KEY)
+            if result is None:
+                self._failures += 1
+                if self._failures >= self.max_retries:
+                    self._failures = 0
+                    self.dropped += len(rows)
+                    app_logger.error(
+                        "Dropped %s candles after %s failed writes", len(rows), self.max_retries
+                    )
+                else:
+                    # Keep the rows for the next attempt, within the bound of the buffer
+                    self._buffer[:0] = rows
+                    self._trim()
+                return 0, 0
+            self._failures = 0
+            self.inserted += result[0]
+            self.skipped += result[1]
+            return result
+
+    def _trim(self) -> None:
+        # Drop the oldest rows beyond max_pending
+        overflow = len(self._buffer) - self.max_pending
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self.dropped += overflow
+            app_logger.warning("Write buffer full, dropped the %s oldest candles", overflow)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Let the loop finish its flush instead of cancelling it, the rows of a cancelled
+        # bulk insert are already out of the buffer and would be lost
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await asyncio.shield(self._task)
+            finally:
+                self._stopping = False
+                self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
@@ -0,0 +1,127 @@
+"""
+torchtrader/data/cache.py
+
+Identity-map cache resolving the small reference tables (`Exchange`, `Asset`, `TradingProduct`)
+from their natural keys to their ids without hitting SQLite on every lookup.
+"""
+import threading
+from typing import Any
+from typing import Dict
+from typing import Type
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from torchtrader.data.schema import Asset
+from torchtrader.data.schema import Base
+from torchtrader.data.schema import Exchange
+from torchtrader.data.schema import TradingProduct
+from torchtrader.logs.logger import app_logger
+
+# Natural key column of every cached table
+REFERENCE_KEYS: Dict[Type[Base], str] = {
+    Exchange: "name",
+    Asset: "name",
+    TradingProduct: "ticker",
+}
+
+
+class ReferenceCache:
+    """
+    Read-through cache of the rows of the reference tables in `REFERENCE_KEYS`, by natural key.
+
+    Entries are only ever filled from the database or from rows just created, and a whole table
+    is dropped from the cache whenever one of its rows is updated or deleted. The cache can be
+    shared by threads.
+    """
+
+    def __init__(self):
+        self._rows: Dict[Type[Base], Dict[str, Dict[str, Any]]] = {
+            table: {} for table in REFERENCE_KEYS
+        }
+        self._lock = threading.Lock()
+
+    def warm(self, session: Session) -> int:
+        """
+        Load the rows of all the reference tables, one query per table.
+
+        Args:
+            session (Session): The session to query with.
+
+        Returns:
+            int: The number of cached entries.
+        """
+        loaded = {}
+        for table, key in REFERENCE_KEYS.items():
+            rows = session.execute(select(table.__table__).order_by(table.id)).mappings()
+            loaded[table] = {}
+            for row in rows:
+                # Keep the oldest row for natural keys that are not unique, e.g. tickers
+                loaded[table].setdefault(row[key], dict(row))
+
+        with self._lock:
+            for table, rows in loaded.items():
+                self._rows[table].update(rows)
+            n_entries = sum(len(rows) for rows in self._rows.values())
+        app_logger.info("Reference cache warmed with %s entries", n_entries)
+        return n_entries
+
+    def get(self, tableclass: Type[Base], key: str) -> int | None:
+        row = self._rows[tableclass].get(key)
+        return None if row is None else row["id"]
+
+    def match(self, tableclass: Type[Base], data: Dict[str, Any]) -> int | None:
+        """
+        The id of the cached row with the natural key of `data`, if all the fields of `data`
+        have the same values in it, else None.
+        """
+        row = self._rows[tableclass].get(data.get(REFERENCE_KEYS[tableclass]))
+        if row is None:
+            return None
+        if any(
+            name not in row or row[name] != value for name, value in data.items() if name != "id"
+        ):
+            return None
+        return row["id"]
+
+    def put(self, tableclass: Type[Base], record_id: int, data: Dict[str, Any]) -> None:
+        """
+        Cache the row just created with `data`, unless its natural key is already cached.
+        """
+        with self._lock:
+            key = data[REFERENCE_KEYS[tableclass]]
+            self._rows[tableclass].setdefault(key, {**data, "id": record_id})
+
+    def invalidate(self, tableclass: Type[Base]) -> None:
+        with self._lock:
+            self._rows[tableclass].clear()
+
+    def resolve(self, session: Session, tableclass: Type[Base], key: str) -> int | None:
+        """
+        Get the id of the row with the given natural key, querying the database on a miss.
+
+        Args:
+            session (Session): The session to query with on a cache miss.
+            tableclass (Type[Base]): One of the tables in `REFERENCE_KEYS`.
+            key (str): The natural key, e.g. the asset name.
+
+        Returns:
+            int | None: The id, or None if no such row exists.
+        """
+        record_id = self.get(tableclass, key)
+        if record_id is None:
+            key_column = getattr(tableclass, REFERENCE_KEYS[tableclass])
+            row = (
+                session.execute(
+                    select(tableclass.__table__)
+                    .where(key_column == key)
+                    .order_by(tableclass.id)
+                    .limit(1)
+                )
+                .mappings()
+                .first()
+            )
+            if row is not None:
+                with self._lock:
+                    record_id = self._rows[tableclass].setdefault(key, dict(row))["id"]
+        return record_id
@@ -2,6 +2,7 @@
 torchtrader/data/collection.py
 """
 import asyncio
+import time
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from typing import Any
@@ -9,7 +10,14 @@ from typing import Dict
 from typing import List
 from typing import Optional
 
-import ccxt.async_support as ccxt
+from torchtrader.metrics import REGISTRY
+from torchtrader.profiling import profiled
+
+FETCH_SECONDS = REGISTRY.histogram("torchtrader_exchange_fetch_seconds", "Exchange fetch latency")
+CANDLES_FETCHED = REGISTRY.counter("torchtrader_exchange_candles_total", "Candles fetched")
+BAR_SECONDS = REGISTRY.histogram(
+    "torchtrader_bar_latency_seconds", "Live bar latency, from the exchange request to processed"
+)
 
 
 @dataclass
@@ -33,6 +41,9 @@ class MarketData:
 
     @asynccontextmanager
     async def setup_exchange(self):
+        # ccxt loads hundreds of exchange modules, import it only when a market is used
+        import ccxt.async_support as ccxt
+
         if self.market not in ccxt.exchanges:
             raise ValueError(f"Market '{self.market}' not supported by CCXT")
         exchange_class = getattr(ccxt, self.market)
@@ -44,6 +55,7 @@ class MarketData:
         finally:
             await self.exchange.close()
 
+    @profiled("collect")
     async def get_data(
         self,
         base: str,
@@ -63,9 +75,12 @@ class MarketData:
             else:
                 limit = 1000
 
-            data = await self.exchange.fetch_ohlcv(symbol, timeframe, since, limit)
+            with FETCH_SECONDS.time():
+                data = await self.exchange.fetch_ohlcv(symbol, timeframe, since, limit)
+            CANDLES_FETCHED.inc(len(data))
             return self.process_data(data, base, quote, timeframe)
 
+    @profiled("collect")
     async def get_live_data(
         self, base: str, quote: str, timeframe: str, stop_event: asyncio.Event
     ) -> list[dict[str, Any]]:
@@ -73,8 +88,13 @@ class MarketData:
             symbol = f"{base}/{quote}"
 
             while not stop_event.is_set():
-                data = await self.exchange.fetch_ohlcv(symbol, timeframe, limit=1)
-                return self.process_data(data, base, quote, timeframe)
+                start = time.perf_counter()
+                with FETCH_SECONDS.time():
+                    data = await self.exchange.fetch_ohlcv(symbol, timeframe, limit=1)
+                CANDLES_FETCHED.inc(len(data))
+                processed_data = self.process_data(data, base, quote, timeframe)
+                BAR_SECONDS.observe(time.perf_counter() - start)
+                return processed_data
 
     @staticmethod
     def process_data(
@@ -1,46 +1,401 @@
 """
 torchtrader/data/database.py
 """
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from datetime import timedelta
+from itertools import chain
+from pathlib import Path
 from typing import Any
 from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Mapping
+from typing import Sequence
+from typing import Tuple
 from typing import Type
 
+import numpy as np
 from sqlalchemy import and_
+from sqlalchemy import bindparam
+from sqlalchemy import cast
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import func
+from sqlalchemy import Integer
+from sqlalchemy import or_
+from sqlalchemy import Select
+from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import Session
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.exc import FlushError
+from sqlalchemy.pool import QueuePool
 
+from torchtrader.config import get_section
+from torchtrader.config import PROJECT_DIR
 from torchtrader.data.schema import Base
+from torchtrader.data.schema import create_schema
+from torchtrader.data.schema import DataPoint
 from torchtrader.logs.logger import app_logger
-from torchtrader.utils import find_dir
-from torchtrader.utils import find_file
+from torchtrader.metrics import REGISTRY
+from torchtrader.metrics import timed
+from torchtrader.profiling import profiled
+
+DATA_DIR = PROJECT_DIR / "data"
+DEFAULT_DATABASE_PATH = DATA_DIR / "torchtrader.db"
+EPOCH = datetime(1970, 1, 1)
+OHLCV_COLUMNS = ("open", "high", "low", "close", "volume")
+# Unique key of a candle, see the index on DataPoint
+OHLCV_KEY = ("asset_id", "timeframe", "date_time")
+# Julian day number of the unix epoch, used to turn stored datetimes into epoch milliseconds in SQL
+JULIAN_EPOCH = 2440587.5
+MS_PER_DAY = 86_400_000
+
+COMMIT_SECONDS = REGISTRY.histogram("torchtrader_db_commit_seconds", "Database commit time")
+ROWS_INSERTED = REGISTRY.counter("torchtrader_db_rows_inserted_total", "Rows bulk inserted")
+ROWS_SKIPPED = REGISTRY.counter("torchtrader_db_rows_skipped_total", "Duplicate rows skipped")
+
+# SQLite storage profiles applied on every new connection. "ingest" favours write throughput
+# for collectors, "research" a large cache and memory map for long scans from notebooks; both use
+# WAL so readers never block the writer.
+SQLITE_PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    "ingest": {
+        "busy_timeout": 5_000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65_536,
+        "mmap_size": 268_435_456,
+        "temp_store": "MEMORY",
+    },
+    "research": {
+        "busy_timeout": 30_000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -262_144,
+        "mmap_size": 1_073_741_824,
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def timed_operation(operation: str):
+    """
+    Decorator timing a database operation in `torchtrader_db_operation_seconds`.
+    """
+    return timed(
+        REGISTRY.histogram(
+            "torchtrader_db_operation_seconds", "Database operation time", operation=operation
+        )
+    )
+
+
+def locate_database(db_path: str | None = None) -> Path:
+    """
+    Resolve the SQLite file to use for a database path, without searching the file system.
+
+    Args:
+        db_path (str | None): An absolute path, used as is, or a relative one, looked up in the
+            working directory and then in the project `data` directory. Defaults to the
+            `TORCHTRADER_DB_PATH` environment variable, `database.path` in the configuration, or
+            `data/torchtrader.db`.
+
+    Returns:
+        Path: The location of the database file.
+    """
+    if db_path is None:
+        db_path = (
+            os.environ.get("TORCHTRADER_DB_PATH")
+            or get_section("database").get("path")
+            or DEFAULT_DATABASE_PATH
+        )
+    # Not cached: a relative path depends on the working directory and on the files in it
+    path = Path(db_path).expanduser()
+    if path.is_absolute():
+        app_logger.info("Database located in %s", path)
+        return path
+    if path.is_file():
+        app_logger.info("Database found in %s", path.resolve())
+        return path.resolve()
+    location = DATA_DIR / path.name
+    app_logger.info("Database located in %s", location)
+    return location
+
+
+def sqlite_profile(profile: str | Dict[str, Any] | None = None) -> Dict[str, Any]:
+    """
+    Resolve the PRAGMA settings of a SQLite storage profile.
+
+    Args:
+        profile (str | Dict[str, Any] | None): A preset name from `SQLITE_PROFILES` or an explicit
+            dict of pragmas. Defaults to `database.profile` in the configuration, or "default".
+
+    Returns:
+        Dict[str, Any]: The pragmas of the preset, updated with the `database.pragmas`
+        overrides from the configuration.
+    """
+    if isinstance(profile, dict):
+        return profile
+    config = get_section("database")
+    profile = profile or config.get("profile", "default")
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLite profile: {profile}")
+    return {**SQLITE_PROFILES[profile], **(config.get("pragmas") or {})}
+
+
+def apply_sqlite_profile(engine: Engine, pragmas: Dict[str, Any]) -> None:
+    """
+    Run the given PRAGMA statements on every connection the engine opens.
+
+    Args:
+        engine (Engine): The engine, use `AsyncEngine.sync_engine` for async engines.
+        pragmas (Dict[str, Any]): The pragma names and values, e.g. {"journal_mode": "WAL"}.
+    """
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def to_datetime(value: Any) -> datetime:
+    """
+    Convert a candle timestamp into the naive UTC datetime stored in `DataPoint.date_time`.
+
+    Args:
+        value (Any): A datetime or a CCXT-style epoch timestamp in milliseconds.
+
+    Returns:
+        datetime: The naive UTC datetime.
+    """
+    if isinstance(value, datetime):
+        return value
+    return EPOCH + timedelta(milliseconds=int(value))
+
+
+def ohlcv_params(
+    asset_id: int, timeframe: str, data: Mapping[str, Sequence] | Sequence
+) -> List[Dict[str, Any]]:
+    """
+    Normalize OHLCV candles into `DataPoint` insert parameters.
+
+    Args:
+        asset_id (int): The asset the candles belong to.
+        timeframe (str): The candle timeframe, e.g. "1m".
+        data (Mapping[str, Sequence] | Sequence): Either columnar arrays keyed by
+            "timestamp" (or "date_time") and the OHLCV column names, or a list of rows. Rows can
+            be raw CCXT `[timestamp, open, high, low, close, volume]` lists or the dicts
+            returned by `MarketData.process_data`.
+
+    Returns:
+        List[Dict[str, Any]]: One parameter dict per candle.
+    """
+    if isinstance(data, Mapping):
+        times = data["timestamp"] if "timestamp" in data else data["date_time"]
+        columns = [_as_list(times)] + [_as_list(data[column]) for column in OHLCV_COLUMNS]
+        rows = zip(*columns)
+    else:
+        rows = (ohlcv_row(row) if isinstance(row, Mapping) else row for row in data)
+
+    return [
+        {
+            "asset_id": asset_id,
+            "timeframe": timeframe,
+            "date_time": to_datetime(time),
+            "open": open_,
+            "high": high,
+            "low": low,
+            "close": close,
+            "volume": volume,
+        }
+        for time, open_, high, low, close, volume in rows
+    ]
+
+
+def timestamp_ms(date_time: Any) -> Any:
+    """
+    SQL expression converting a stored datetime column into integer epoch milliseconds.
+    """
+    return cast(func.round((func.julianday(date_time) - JULIAN_EPOCH) * MS_PER_DAY), Integer)
+
+
+def ohlcv_select(asset_id: int, timeframe: str, start: Any = None, end: Any = None) -> Select:
+    """
+    Build the Core query reading `(timestamp, open, high, low, close, volume)` rows of an asset.
+
+    Args:
+        asset_id (int): The asset to read.
+        timeframe (str): The candle timeframe, e.g. "1m".
+        start (Any): Inclusive lower bound, a datetime or epoch milliseconds. Unbounded if None.
+        end (Any): Exclusive upper bound, a datetime or epoch milliseconds. Unbounded if None.
+
+    Returns:
+        Select: The query, ordered by time, with timestamps in epoch milliseconds.
+    """
+    table = DataPoint.__table__
+    statement = (
+        select(timestamp_ms(table.c.date_time), *(table.c[column] for column in OHLCV_COLUMNS))
+        .where(table.c.asset_id == asset_id, table.c.timeframe == timeframe)
+        .order_by(table.c.date_time)
+    )
+    if start is not None:
+        statement = statement.where(table.c.date_time >= to_datetime(start))
+    if end is not None:
+        statement = statement.where(table.c.date_time < to_datetime(end))
+    return statement
+
+
+def ohlcv_arrays(rows: Sequence[Sequence[float]], as_tensor: bool = False) -> Dict[str, Any]:
+    """
+    Turn `(timestamp, open, high, low, close, volume)` rows into contiguous column arrays.
+
+    Args:
+        rows (Sequence[Sequence[float]]): The rows, timestamps in epoch milliseconds.
+        as_tensor (bool): Return torch tensors sharing memory with the arrays instead of
+            NumPy arrays.
+
+    Returns:
+        Dict[str, Any]: An int64 "timestamp" array and one float64 array per OHLCV column.
+    """
+    n_columns = len(OHLCV_COLUMNS) + 1
+    values = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * n_columns)
+    # Transposing and copying once leaves every column contiguous in memory
+    columns = np.ascontiguousarray(values.reshape(-1, n_columns).T)
+    arrays = {"timestamp": columns[0].astype(np.int64)}
+    arrays.update(zip(OHLCV_COLUMNS, columns[1:]))
+    if as_tensor:
+        import torch
+
+        return {name: torch.from_numpy(array) for name, array in arrays.items()}
+    return arrays
+
+
+def ohlcv_row(row: Mapping[str, Any]) -> tuple:
+    """
+    Extract `(time, open, high, low, close, volume)` from a candle dict.
+    """
+    time = row["timestamp"] if "timestamp" in row else row["date_time"]
+    return time, *(row[column] for column in OHLCV_COLUMNS)
+
+
+def _as_list(column: Sequence) -> list:
+    # NumPy arrays and tensors convert to native Python scalars much faster in bulk
+    return column.tolist() if hasattr(column, "tolist") else list(column)
 
 
 class GenericDatabase:
-    def __init__(self, db_path: str = None):
-        db_path = "torchtrader/data/torchtrader.db" if db_path is None else db_path
-        self.db_filename = db_path.split("/")[-1]
+    """
+    CRUD access to the Torchtrader SQLite database.
+
+    Each thread gets its own session through `db_session`, and `session()` opens a dedicated one
+    for a unit of work, so a single instance can be shared by a thread pool. Connections come
+    from a pool configured by `database.pool` in the configuration (`size`, `max_overflow`,
+    `timeout`).
+
+    Args:
+        db_path (str): The database location, see `locate_database`.
+        profile (str | Dict[str, Any] | None): The SQLite storage profile, see `sqlite_profile`.
+        timeseries (Any): The OHLCV backend, "sqlite", "columnar" or a `TimeSeriesStore`.
+        read_only (bool): Open the database read-only, e.g. for backtest workers and notebooks
+            reading while a collector writes.
+    """
+
+    def __init__(
+        self,
+        db_path: str = None,
+        profile: str | Dict[str, Any] | None = None,
+        timeseries: Any = None,
+        read_only: bool = False,
+    ):
+        self.db_path = db_path
+        self.read_only = read_only
 
         self.database_uri = self.locate_or_create_db()
+        self.db_filename = self.database_uri.name
 
-        self.db_engine = create_engine(f"sqlite:///{self.database_uri}")
-        self.db_session = Session(self.db_engine)
+        config = get_section("database")
+        pool = config.get("pool") or {}
+        pragmas = sqlite_profile(profile)
+        if read_only:
+            url = f"sqlite:///file:{self.database_uri}?mode=ro&uri=true"
+            pragmas = {**pragmas, "query_only": "ON"}
+            # The journal mode is a property of the file, only the writer may change it
+            pragmas.pop("journal_mode", None)
+        else:
+            url = f"sqlite:///{self.database_uri}"
+        self.db_engine = create_engine(
+            url,
+            poolclass=QueuePool,
+            pool_size=pool.get("size", 5),
+            max_overflow=pool.get("max_overflow", 10),
+            pool_timeout=pool.get("timeout", 30),
+            connect_args={"check_same_thread": False},
+        )
+        apply_sqlite_profile(self.db_engine, pragmas)
+        self.session_factory = sessionmaker(self.db_engine)
+        self.scoped_session = scoped_session(self.session_factory)
 
         app_logger.info("Database connected successfully.")
 
-        Base.metadata.create_all(bind=self.db_engine)
+        with self.db_engine.begin() as connection:
+            create_schema(connection, read_only)
+
+        # Candles go to DataPoint rows unless another TimeSeriesStore backend is selected
+        timeseries = timeseries or config.get("timeseries", "sqlite")
+        self.timeseries = None
+        if timeseries != "sqlite":
+            from torchtrader.data.timeseries import make_timeseries_store
+
+            self.timeseries = make_timeseries_store(timeseries, **config.get(timeseries, {}))
+
+        # Rollup timeframes maintained on every insert of base candles, when configured
+        self.rollups = None
+        if get_section("rollups").get("timeframes") and self.timeseries is None and not read_only:
+            from torchtrader.data.rollup import RollupManager
+
+            self.rollups = RollupManager(self)
 
     def locate_or_create_db(self):
-        locate = find_file(self.db_filename)
-        if locate is not None:
-            app_logger.info(f"Database found in {locate}")
-            return locate
-        default_location = find_dir("data") / self.db_filename
-        app_logger.info(f"Database created successfully in {default_location}")
-        return default_location
+        return locate_database(self.db_path)
+
+    @property
+    def db_session(self) -> Session:
+        """
+        The session of the calling thread, created on first use.
+        """
+        return self.scoped_session()
+
+    @contextmanager
+    def session(self) -> Iterator[Session]:
+        """
+        Open a dedicated session for a unit of work, committed on success and rolled back on
+        error.
+
+        Yields:
+            Session: The session, closed when the block exits. Loaded objects stay usable after.
+        """
+        session = self.session_factory(expire_on_commit=False)
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
+    @timed_operation("create")
     def create(self, tableclass: Type[Base], data: Dict[str, Any]) -> int | None:
         try:
             filter_dict = {k: v for k, v in data.items() if k != "id"}
@@ -48,25 +403,135 @@ class GenericDatabase:
 
             if existing_record is not None:
                 app_logger.warning(
-                    f"A record with the same data already exists "
-                    f"in {tableclass.__name__}. Skipping."
+                    "A record with the same data already exists in %s. Skipping.",
+                    tableclass.__name__,
                 )
                 return existing_record.id
 
             record = tableclass(**data)
             self.db_session.add(record)
-            self.db_session.commit()
-            app_logger.info(f"Created {tableclass.__name__} with data: {data}")
+            with COMMIT_SECONDS.time():
+                self.db_session.commit()
+            app_logger.info("Created %s with data: %s", tableclass.__name__, data)
             return record.id
         except IntegrityError as e:
-            app_logger.error(f"Error creating {tableclass.__name__}: {e}")
+            app_logger.error("Error creating %s: %s", tableclass.__name__, e)
             self.db_session.rollback()
             return -1
         except Exception as e:
-            app_logger.error(f"Unexpected error creating {tableclass.__name__}: {e}")
+            app_logger.error("Unexpected error creating %s: %s", tableclass.__name__, e)
+            self.db_session.rollback()
+            return None
+
+    @timed_operation("bulk_create")
+    def bulk_create(
+        self,
+        tableclass: Type[Base],
+        rows: List[Dict[str, Any]],
+        conflict_columns: Sequence[str] | None = None,
+    ) -> Tuple[int, int] | None:
+        """
+        Insert many records in a single transaction, ignoring the ones that already exist.
+
+        The rows are sent with one `executemany` of `INSERT ... ON CONFLICT DO NOTHING`, so
+        unlike `create` there is no per-record duplicate lookup, commit or log line.
+
+        Args:
+            tableclass (Type[Base]): The table to insert into.
+            rows (List[Dict[str, Any]]): The records to insert.
+            conflict_columns (Sequence[str] | None): The unique key deciding which rows are
+                duplicates. Any unique constraint applies when not given.
+
+        Returns:
+            Tuple[int, int] | None: The number of inserted and skipped rows, or None on error.
+        """
+        if not rows:
+            return 0, 0
+        try:
+            statement = insert(tableclass.__table__).on_conflict_do_nothing(
+                index_elements=conflict_columns
+            )
+            result = self.db_session.execute(statement, rows)
+            with COMMIT_SECONDS.time():
+                self.db_session.commit()
+            inserted = result.rowcount
+            skipped = len(rows) - inserted
+            ROWS_INSERTED.inc(inserted)
+            ROWS_SKIPPED.inc(skipped)
+            app_logger.info(
+                "Bulk inserted %s rows into %s (%s skipped)", inserted, tableclass.__name__, skipped
+            )
+            return inserted, skipped
+        except Exception as e:
+            app_logger.error("Error bulk inserting into %s: %s", tableclass.__name__, e)
             self.db_session.rollback()
             return None
 
+    @profiled("store")
+    @timed_operation("insert_ohlcv")
+    def insert_ohlcv(
+        self, asset_id: int, timeframe: str, data: Mapping[str, Sequence] | Sequence
+    ) -> Tuple[int, int] | None:
+        """
+        Bulk insert OHLCV candles for an asset, skipping candles that are already stored.
+
+        Args:
+            asset_id (int): The asset the candles belong to.
+            timeframe (str): The candle timeframe, e.g. "1m".
+            data (Mapping[str, Sequence] | Sequence): Columnar arrays or a list of rows, see
+                `ohlcv_params`.
+
+        Returns:
+            Tuple[int, int] | None: The number of inserted and skipped candles, or None on error.
+        """
+        if self.timeseries is not None:
+            return self.timeseries.insert_ohlcv(asset_id, timeframe, data)
+        result = self.bulk_create(
+            DataPoint,
+            ohlcv_params(asset_id, timeframe, data),
+            conflict_columns=OHLCV_KEY,
+        )
+        if self.rollups is not None and timeframe == self.rollups.base_timeframe and result:
+            self.rollups.refresh(asset_id)
+        return result
+
+    @timed_operation("read_ohlcv")
+    def read_ohlcv(
+        self,
+        asset_id: int,
+        timeframe: str,
+        start: Any = None,
+        end: Any = None,
+        as_tensor: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Read the candles of an asset in the time range [start, end) as column arrays.
+
+        Only the needed columns are selected through SQLAlchemy Core, so no ORM objects are built,
+        and the (asset_id, timeframe, date_time) index serves both the filter and the ordering.
+
+        Args:
+            asset_id (int): The asset to read.
+            timeframe (str): The candle timeframe, e.g. "1m".
+            start (Any): Inclusive lower bound, a datetime or epoch milliseconds. Unbounded if None.
+            end (Any): Exclusive upper bound, a datetime or epoch milliseconds. Unbounded if None.
+            as_tensor (bool): Return torch tensors sharing memory with the arrays instead of
+                NumPy arrays.
+
+        Returns:
+            Dict[str, Any]: "timestamp" in epoch milliseconds plus one array per OHLCV column,
+            sorted by time.
+        """
+        if self.timeseries is not None:
+            return self.timeseries.read_ohlcv(asset_id, timeframe, start, end, as_tensor)
+        try:
+            rows = self.db_session.execute(ohlcv_select(asset_id, timeframe, start, end)).all()
+        except Exception as e:
+            app_logger.error("Error reading OHLCV for asset %s (%s): %s", asset_id, timeframe, e)
+            rows = []
+        return ohlcv_arrays(rows, as_tensor)
+
+    @timed_operation("read")
     def read(self, tableclass: Type[Base], filters: Dict[str, Any] = None) -> List[Type[Base]]:
         try:
             query = self.db_session.query(tableclass)
@@ -75,12 +540,119 @@ class GenericDatabase:
                 query = query.filter_by(**filters)
 
             records = query.all()
-            app_logger.info(f"Read {len(records)} records from {tableclass.__name__}")
+            app_logger.info("Read %s records from %s", len(records), tableclass.__name__)
             return records
         except Exception as e:
-            app_logger.error(f"Error reading {tableclass.__name__}: {e}")
+            app_logger.error("Error reading %s: %s", tableclass.__name__, e)
             return []
 
+    def iter_read(
+        self,
+        tableclass: Type[Base],
+        filters: Dict[str, Any] = None,
+        batch_size: int = 1000,
+        columns: Sequence[str] | None = None,
+        order_by: str = "id",
+    ) -> Iterator[Any]:
+        """
+        Stream the records of a table in bounded memory.
+
+        Records are fetched `batch_size` at a time with keyset pagination on `order_by`, each
+        page being an index seek past the last key seen, so memory does not grow with the table.
+
+        Args:
+            tableclass (Type[Base]): The table to read.
+            filters (Dict[str, Any]): Equality filters, like in `read`.
+            batch_size (int): Records fetched per query.
+            columns (Sequence[str] | None): Yield plain tuples of these columns instead of mapped
+                instances.
+            order_by (str): A unique column to paginate on, e.g. "id", or "date_time" when the
+                filters select a single candle series.
+
+        Yields:
+            Any: Mapped instances, or tuples of `columns`, in `order_by` order.
+        """
+        key = getattr(tableclass, order_by)
+        if columns is None:
+            query = select(tableclass)
+        else:
+            query = select(*(getattr(tableclass, column) for column in columns), key)
+        if filters:
+            query = query.filter_by(**filters)
+        query = query.order_by(key).limit(batch_size)
+
+        last_key = None
+        while True:
+            page = query if last_key is None else query.where(key > last_key)
+            try:
+                result = self.db_session.execute(page)
+                rows = result.scalars().all() if columns is None else result.all()
+            except Exception as e:
+                app_logger.error("Error reading %s: %s", tableclass.__name__, e)
+                return
+
+            if not rows:
+                return
+            if columns is None:
+                last_key = getattr(rows[-1], order_by)
+                yield from rows
+            else:
+                last_key = rows[-1][-1]
+                yield from (tuple(row[:-1]) for row in rows)
+            if len(rows) < batch_size:
+                return
+
+    def iter_ohlcv(
+        self,
+        asset_id: int,
+        timeframe: str,
+        start: Any = None,
+        end: Any = None,
+        batch_size: int = 100_000,
+        as_tensor: bool = False,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the candles of an asset in [start, end) as columnar batches of `batch_size` rows.
+
+        Args:
+            asset_id (int): The asset to read.
+            timeframe (str): The candle timeframe, e.g. "1m".
+            start (Any): Inclusive lower bound, a datetime or epoch milliseconds. Unbounded if None.
+            end (Any): Exclusive upper bound, a datetime or epoch milliseconds. Unbounded if None.
+            batch_size (int): Candles per batch.
+            as_tensor (bool): Yield torch tensors instead of NumPy arrays.
+
+        Yields:
+            Dict[str, Any]: Batches in the format of `read_ohlcv`, in time order.
+        """
+        if self.timeseries is not None:
+            # Memory-mapped columns are only paged in as the batches are consumed
+            data = self.timeseries.read_ohlcv(asset_id, timeframe, start, end, as_tensor)
+            for offset in range(0, len(data["timestamp"]), batch_size):
+                yield {name: values[offset : offset + batch_size] for name, values in data.items()}
+            return
+
+        date_time = DataPoint.__table__.c.date_time
+        statement = ohlcv_select(asset_id, timeframe, start, end).limit(batch_size)
+        last_time = None
+        while True:
+            page = statement if last_time is None else statement.where(date_time > last_time)
+            try:
+                rows = self.db_session.execute(page).all()
+            except Exception as e:
+                app_logger.error(
+                    "Error reading OHLCV for asset %s (%s): %s", asset_id, timeframe, e
+                )
+                return
+
+            if not rows:
+                return
+            last_time = to_datetime(rows[-1][0])
+            yield ohlcv_arrays(rows, as_tensor)
+            if len(rows) < batch_size:
+                return
+
+    @timed_operation("update")
     def update(
         self, tableclass: Type[Base], record: Dict[str, Any], updates: Dict[str, Any]
     ) -> None:
@@ -89,7 +661,7 @@ class GenericDatabase:
             target_record = self.db_session.query(tableclass).filter_by(**record).first()
 
             if target_record is None:
-                app_logger.warning(f"Record not found in {tableclass.__name__}. Skipping.")
+                app_logger.warning("Record not found in %s. Skipping.", tableclass.__name__)
                 return
 
             for key, value in updates.items():
@@ -107,38 +679,198 @@ class GenericDatabase:
 
                 if exists:
                     app_logger.warning(
-                        f"{tableclass.__name__} with {key}={value} already exists. Skipping update."
+                        "%s with %s=%s already exists. Skipping update.",
+                        tableclass.__name__,
+                        key,
+                        value,
                     )
                     continue
 
                 setattr(target_record, key, value)
 
-            self.db_session.commit()
-            app_logger.info(f"Updated {tableclass.__name__} with record {record}")
+            with COMMIT_SECONDS.time():
+                self.db_session.commit()
+            app_logger.info("Updated %s with record %s", tableclass.__name__, record)
         except (IntegrityError, FlushError) as e:
-            app_logger.error(f"Error updating {tableclass.__name__} with " f"record {record}: {e}")
+            app_logger.error("Error updating %s with record %s: %s", tableclass.__name__, record, e)
             self.db_session.rollback()
         except Exception as e:
             app_logger.error(
-                f"Unexpected error updating {tableclass.__name__} with " f"record {record}: {e}"
+                "Unexpected error updating %s with record %s: %s", tableclass.__name__, record, e
             )
             self.db_session.rollback()
 
+    @timed_operation("bulk_update")
+    def bulk_update(
+        self,
+        tableclass: Type[Base],
+        changes: Sequence[Tuple[Dict[str, Any], Dict[str, Any]]],
+    ) -> Tuple[int, int] | None:
+        """
+        Apply many `(match, updates)` pairs in a single transaction.
+
+        Like `update`, a new value for a unique column is dropped when another row already holds
+        it, but all the pairs are validated with one set-based query instead of per-field probes.
+        Pairs sharing the same match and update columns are sent as one `executemany`, and
+        composite constraints (e.g. the candle key) are left to the database: a violation rolls
+        the whole batch back. The rollup buckets of the candles changed are refreshed.
+
+        Args:
+            tableclass (Type[Base]): The table to update.
+            changes (Sequence[Tuple[Dict[str, Any], Dict[str, Any]]]): Equality filters selecting
+                the rows to update, with the column values to set on them.
+
+        Returns:
+            Tuple[int, int] | None: The number of updated rows and of pairs skipped because no
+            update was left after validation, or None on error.
+        """
+        table = tableclass.__table__
+        unique_columns = [column.name for column in table.columns if column.unique]
+
+        try:
+            # Current holders of every new value proposed for a unique column
+            proposed = {
+                name: {updates[name] for _, updates in changes if name in updates}
+                for name in unique_columns
+            }
+            conditions = [table.c[name].in_(values) for name, values in proposed.items() if values]
+            holders = (
+                self.db_session.execute(select(table).where(or_(*conditions))).mappings().all()
+                if conditions
+                else []
+            )
+
+            holders_by_value: Dict[Tuple[str, Any], List[Any]] = {}
+            for holder in holders:
+                for name in unique_columns:
+                    holders_by_value.setdefault((name, holder[name]), []).append(holder)
+
+            def is_taken(key: str, value: Any, match: Dict[str, Any]) -> bool:
+                if key not in claimed:
+                    return False
+                if value in claimed[key]:
+                    return True
+                # Rows matched by the pair itself may keep their own value
+                return any(
+                    any(holder[column] != match_value for column, match_value in match.items())
+                    for holder in holders_by_value.get((key, value), ())
+                )
+
+            groups: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[Dict[str, Any]]] = {}
+            claimed = {name: set() for name in unique_columns}
+            skipped = 0
+            for match, updates in changes:
+                valid = {}
+                for key, value in updates.items():
+                    if is_taken(key, value, match):
+                        app_logger.warning(
+                            "%s with %s=%s already exists. Skipping update.",
+                            tableclass.__name__,
+                            key,
+                            value,
+                        )
+                        continue
+                    if key in claimed:
+                        claimed[key].add(value)
+                    valid[key] = value
+
+                if not valid:
+                    skipped += 1
+                    continue
+                signature = (tuple(sorted(match)), tuple(sorted(valid)))
+                params = {f"match_{key}": value for key, value in match.items()}
+                params.update({f"new_{key}": value for key, value in valid.items()})
+                groups.setdefault(signature, []).append(params)
+
+            # Candles changed in place are invisible to the rollup watermark, refresh their
+            # buckets before and after the update
+            rollup = tableclass is DataPoint and self.rollups is not None
+            changed_ids = self._matched_ids(table, groups) if rollup else []
+            changed = self._candle_times(changed_ids)
+
+            updated = 0
+            for (match_keys, update_keys), params in groups.items():
+                statement = (
+                    update(table)
+                    .where(*(table.c[key] == bindparam(f"match_{key}") for key in match_keys))
+                    .values({key: bindparam(f"new_{key}") for key in update_keys})
+                )
+                updated += self.db_session.execute(statement, params).rowcount
+            changed.extend(self._candle_times(changed_ids))
+            with COMMIT_SECONDS.time():
+                self.db_session.commit()
+            if rollup:
+                self._refresh_rollups(changed)
+            app_logger.info(
+                "Bulk updated %s rows of %s (%s pairs skipped)",
+                updated,
+                tableclass.__name__,
+                skipped,
+            )
+            return updated, skipped
+        except Exception as e:
+            app_logger.error("Error bulk updating %s: %s", tableclass.__name__, e)
+            self.db_session.rollback()
+            return None
+
+    def _matched_ids(self, table: Any, groups: Dict[tuple, List[Dict[str, Any]]]) -> List[int]:
+        # Ids of the rows matched by the pairs of bulk_update, queried in chunks
+        ids = []
+        for (match_keys, _), params in groups.items():
+            columns = tuple_(*(table.c[key] for key in match_keys))
+            values = [tuple(param[f"match_{key}"] for key in match_keys) for param in params]
+            for offset in range(0, len(values), 500):
+                statement = select(table.c.id).where(columns.in_(values[offset : offset + 500]))
+                ids.extend(self.db_session.execute(statement).scalars())
+        return ids
+
+    def _candle_times(self, ids: List[int]) -> List[Tuple[int, str, int]]:
+        # (asset_id, timeframe, epoch milliseconds) of DataPoint rows
+        table = DataPoint.__table__
+        columns = (table.c.asset_id, table.c.timeframe, timestamp_ms(table.c.date_time))
+        times = []
+        for offset in range(0, len(ids), 500):
+            statement = select(*columns).where(table.c.id.in_(ids[offset : offset + 500]))
+            times.extend(tuple(row) for row in self.db_session.execute(statement))
+        return times
+
+    def _refresh_rollups(self, changed: List[Tuple[int, str, int]]) -> None:
+        timestamps: Dict[int, List[int]] = {}
+        for asset_id, timeframe, timestamp in changed:
+            if timeframe == self.rollups.base_timeframe:
+                timestamps.setdefault(asset_id, []).append(timestamp)
+        for asset_id, asset_timestamps in timestamps.items():
+            self.rollups.refresh(asset_id, asset_timestamps)
+
+    @timed_operation("delete")
     def delete(self, tableclass: Type[Base], data: Dict[str, Any]) -> None:
         try:
             target_record = self.db_session.query(tableclass).filter_by(**data).first()
 
             if not target_record:
-                app_logger.warning(f"Item {data} doesn't exist in {tableclass.__name__}. Skipping.")
+                app_logger.warning(
+                    "Item %s doesn't exist in %s. Skipping.", data, tableclass.__name__
+                )
                 return
 
             self.db_session.delete(target_record)
-            self.db_session.commit()
-            app_logger.info(f"Deleted {tableclass.__name__} with {data}")
+            with COMMIT_SECONDS.time():
+                self.db_session.commit()
+            app_logger.info("Deleted %s with %s", tableclass.__name__, data)
         except Exception as e:
-            app_logger.error(f"Error deleting {tableclass.__name__} with " f"record {data}: {e}")
+            app_logger.error("Error deleting %s with record %s: %s", tableclass.__name__, data, e)
             self.db_session.rollback()
 
     def close(self):
-        self.db_session.close()
+        """
+        Close the session of the calling thread, worker threads should call it when done.
+        """
+        self.scoped_session.remove()
         app_logger.info("Database session closed.")
+
+    def dispose(self):
+        """
+        Close the session of the calling thread and every pooled connection.
+        """
+        self.close()
+        self.db_engine.dispose()
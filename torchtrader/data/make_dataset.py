@@ -0,0 +1,268 @@
+"""
+torchtrader/data/make_dataset.py
+
+Sliding window datasets for training models on features of many assets.
+
+Every asset is a `[T, F]` array of features (bars x features), usually a memory-mapped `.npy`
+file written by `save_features`. Windows are strided views of these arrays: a sample is a
+`[window, F]` view and nothing but the batches assembled by the `DataLoader` is copied, whatever
+the window length.
+
+The label of a window ending on bar e is computed on bar e + horizon, and a dataset only uses the
+bars inside its `bounds`, features and labels alike. Datasets split by `time_split` therefore
+never share a bar, so no label of a training window leaks into a validation window.
+"""
+import math
+import os
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+import torch
+from torch import Tensor
+from torch.utils.data import DataLoader
+from torch.utils.data import Dataset
+from torch.utils.data import WeightedRandomSampler
+
+LABELS = ("return", "direction")
+
+
+def save_features(path: str | Path, features: np.ndarray | Tensor) -> Path:
+    """
+    Save the `[T, F]` features of an asset as a contiguous `.npy` file for `load_features`.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if isinstance(features, Tensor):
+        features = features.detach().cpu().numpy()
+    np.save(path, np.ascontiguousarray(features))
+    return path
+
+
+def load_features(path: str | Path) -> np.memmap:
+    """
+    Memory-map features saved by `save_features`. Pages are shared by all the processes mapping
+    the file, and copied on write only.
+    """
+    return np.load(path, mmap_mode="c")
+
+
+class WindowDataset(Dataset):
+    """
+    Sliding windows over the features of many assets, as zero-copy views.
+
+    A sample is `(window, label)`: a `[window, F]` view of the features, and the label of the
+    window from the `target` column, the log return from its last bar to `horizon` bars later
+    ("return"), or 1.0 when it is positive and 0.0 otherwise ("direction").
+
+    Args:
+        series (Sequence[np.ndarray | Tensor]): The `[T, F]` features of every asset.
+        window (int): Bars of a window.
+        horizon (int): Bars between the last bar of a window and its label bar.
+        stride (int): Bars between the starts of two windows of an asset.
+        target (int): Column of the prices labels are computed on.
+        label (str): "return" or "direction".
+        bounds (Sequence[Tuple[int, int]] | None): The bars `[start, end)` used of every asset,
+            all of them by default.
+    """
+
+    def __init__(
+        self,
+        series: Sequence[np.ndarray | Tensor],
+        window: int,
+        horizon: int = 1,
+        stride: int = 1,
+        target: int = 0,
+        label: str = "return",
+        bounds: Sequence[Tuple[int, int]] | None = None,
+    ):
+        if label not in LABELS:
+            raise ValueError(f"Unknown label: {label}")
+        self.series = list(series)
+        self.window = window
+        self.horizon = horizon
+        self.stride = stride
+        self.target = target
+        self.label = label
+        self.bounds = [
+            (max(0, start), min(end, len(features)))
+            for (start, end), features in zip(
+                bounds or [(0, len(features)) for features in self.series], self.series
+            )
+        ]
+        # Windows of every asset: the last one needs `horizon` more bars for its label
+        self.counts = np.array(
+            [max(0, (end - start - window - horizon) // stride + 1) for start, end in self.bounds],
+            dtype=np.int64,
+        )
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+        self._views: Dict[int, Tuple[Tensor, Tensor]] = {}
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def locate(self, index: int) -> Tuple[int, int]:
+        """
+        The asset of a sample and the bar its window starts on.
+        """
+        if not 0 <= index < len(self):
+            raise IndexError(f"Sample {index} out of range for {len(self)} samples")
+        asset = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        return asset, self.bounds[asset][0] + (index - int(self.offsets[asset])) * self.stride
+
+    def windows(self, asset: int) -> Tensor:
+        """
+        All the windows of an asset as a single `[count, window, F]` strided view.
+        """
+        return self._asset_views(asset)[0]
+
+    def __getitem__(self, index: int) -> Tuple[Tensor, Tensor]:
+        asset, _ = self.locate(index)
+        windows, labels = self._asset_views(asset)
+        position = index - int(self.offsets[asset])
+        return windows[position], labels[position]
+
+    def _asset_views(self, asset: int) -> Tuple[Tensor, Tensor]:
+        # Built on first use in every worker process, from the arrays it shares with the others
+        views = self._views.get(asset)
+        if views is None:
+            features = self.series[asset]
+            if not isinstance(features, Tensor):
+                features = torch.from_numpy(features)
+            start, _ = self.bounds[asset]
+            count = int(self.counts[asset])
+            span = (count - 1) * self.stride + self.window
+            if count:
+                windows = features[start : start + span].unfold(0, self.window, self.stride)
+                windows = windows.transpose(1, 2)
+            else:
+                windows = features.new_empty((0, self.window, features.shape[1]))
+
+            prices = features[:, self.target]
+            last = start + self.window - 1 + torch.arange(count) * self.stride
+            labels = torch.log(prices[last + self.horizon] / prices[last])
+            if self.label == "direction":
+                labels = (labels > 0).to(features.dtype)
+            views = self._views[asset] = (windows, labels)
+        return views
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Memory-mapped series are sent to worker processes as their file, not their content
+        state = self.__dict__.copy()
+        state["series"] = [
+            ("memmap", features.filename, features.offset, features.dtype, features.shape)
+            if _maps_whole_file(features)
+            else features
+            for features in self.series
+        ]
+        state["_views"] = {}
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        state["series"] = [
+            np.memmap(entry[1], dtype=entry[3], mode="c", offset=entry[2], shape=entry[4])
+            if isinstance(entry, tuple) and entry[0] == "memmap"
+            else entry
+            for entry in state["series"]
+        ]
+        self.__dict__.update(state)
+
+    def subset(self, bounds: Sequence[Tuple[int, int]]) -> "WindowDataset":
+        """
+        A dataset of the same arrays and options restricted to other bounds.
+        """
+        return WindowDataset(
+            self.series,
+            self.window,
+            self.horizon,
+            self.stride,
+            self.target,
+            self.label,
+            bounds,
+        )
+
+    def asset_sampler(self, num_samples: int | None = None) -> WeightedRandomSampler:
+        """
+        Sampler drawing every asset equally often, whatever its number of windows.
+        """
+        weights = np.repeat(1.0 / np.maximum(self.counts, 1), self.counts)
+        return WeightedRandomSampler(
+            torch.from_numpy(weights), num_samples or len(self), replacement=True
+        )
+
+
+def _maps_whole_file(features: Any) -> bool:
+    # Slices of a memmap keep the file name and offset of the whole mapping, so they are not
+    # reopened from the file but pickled with their content
+    return (
+        isinstance(features, np.memmap)
+        and features.filename is not None
+        and features.flags.c_contiguous
+        and features.offset + features.nbytes == os.path.getsize(features.filename)
+    )
+
+
+def time_split(
+    dataset: WindowDataset, fractions: Sequence[float] = (0.8, 0.2), gap: int = 0
+) -> List[WindowDataset]:
+    """
+    Split the bars of every asset in consecutive time ranges, e.g. train and validation.
+
+    Args:
+        dataset (WindowDataset): The dataset to split.
+        fractions (Sequence[float]): The share of the bars of every range, oldest first.
+        gap (int): Bars left out between two ranges, e.g. to decorrelate them further.
+
+    Returns:
+        List[WindowDataset]: One dataset per range, sharing the arrays of `dataset`.
+    """
+    total = sum(fractions)
+    splits: List[List[Tuple[int, int]]] = [[] for _ in fractions]
+    for start, end in dataset.bounds:
+        boundary = start
+        for index, fraction in enumerate(fractions):
+            stop = start + math.floor((end - start) * sum(fractions[: index + 1]) / total)
+            splits[index].append((boundary, stop))
+            boundary = stop + gap
+    return [dataset.subset(bounds) for bounds in splits]
+
+
+def make_loader(
+    dataset: WindowDataset,
+    batch_size: int = 256,
+    shuffle: bool = True,
+    workers: int = 0,
+    balanced: bool = False,
+    **options,
+) -> DataLoader:
+    """
+    `DataLoader` of a window dataset. Worker processes map the same feature files, so adding
+    workers does not duplicate the arrays.
+
+    Args:
+        dataset (WindowDataset): The dataset.
+        batch_size (int): Samples per batch.
+        shuffle (bool): Draw the samples in random order.
+        workers (int): Worker processes assembling the batches, 0 to assemble them in this one.
+        balanced (bool): Draw every asset equally often, see `WindowDataset.asset_sampler`.
+        **options: Other keyword arguments of `DataLoader`.
+
+    Returns:
+        DataLoader: Batches of `[batch, window, F]` windows and `[batch]` labels.
+    """
+    if workers:
+        options.setdefault("persistent_workers", True)
+        options.setdefault("prefetch_factor", 4)
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle and not balanced,
+        sampler=dataset.asset_sampler() if balanced else None,
+        num_workers=workers,
+        pin_memory=torch.cuda.is_available(),
+        **options,
+    )
@@ -3,8 +3,14 @@ torchtrader/data/ops_specific.py
 """
 from typing import Any
 from typing import Dict
+from typing import Mapping
+from typing import Sequence
+from typing import Tuple
 from typing import Type
 
+from torchtrader.data.async_database import AsyncGenericDatabase
+from torchtrader.data.cache import REFERENCE_KEYS
+from torchtrader.data.cache import ReferenceCache
 from torchtrader.data.database import GenericDatabase
 from torchtrader.data.schema import Asset
 from torchtrader.data.schema import Base
@@ -14,44 +20,90 @@ from torchtrader.data.schema import TradingProductExchange
 
 
 class Operations(GenericDatabase):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, db_path: str = None, profile: str | Dict[str, Any] | None = None):
+        super().__init__(db_path, profile)
+        self.reference_cache = ReferenceCache()
+        self.reference_cache.warm(self.db_session)
+
+    def _create_cached(self, tableclass: Type[Base], data: Dict[str, Any]) -> int | None:
+        # Names are unique: a cached row with the same data is the existing row, no lookup is
+        # needed. Other data goes through create, which returns -1 for a name already taken.
+        record_id = self.reference_cache.match(tableclass, data)
+        if record_id is not None:
+            return record_id
+        record_id = self.create(tableclass, data)
+        if record_id is not None and record_id > 0:
+            self.reference_cache.put(tableclass, record_id, data)
+        return record_id
+
+    def _update_cached(
+        self, tableclass: Type[Base], record: Dict[str, Any], updates: Dict[str, Any]
+    ) -> None:
+        self.update(tableclass, record, updates)
+        self.reference_cache.invalidate(tableclass)
+
+    def _delete_cached(self, tableclass: Type[Base], data: Dict[str, Any]) -> None:
+        self.delete(tableclass, data)
+        self.reference_cache.invalidate(tableclass)
+
+    def bulk_update(
+        self,
+        tableclass: Type[Base],
+        changes: Sequence[Tuple[Dict[str, Any], Dict[str, Any]]],
+    ) -> Tuple[int, int] | None:
+        result = super().bulk_update(tableclass, changes)
+        if tableclass in REFERENCE_KEYS:
+            self.reference_cache.invalidate(tableclass)
+        return result
+
+    def get_exchange_id(self, name: str) -> int | None:
+        return self.reference_cache.resolve(self.db_session, Exchange, name)
+
+    def get_trading_product_id(self, ticker: str) -> int | None:
+        return self.reference_cache.resolve(self.db_session, TradingProduct, ticker)
+
+    def get_asset_id(self, name: str) -> int | None:
+        return self.reference_cache.resolve(self.db_session, Asset, name)
 
     def create_exchange(self, data: Dict[str, Any]) -> int | None:
-        return self.create(Exchange, data)
+        return self._create_cached(Exchange, data)
 
     def read_exchange(self, filters: Dict[str, Any] = None) -> list[Type[Base]]:
         return self.read(Exchange, filters)
 
     def update_exchange(self, record: Dict[str, Any], updates: Dict[str, Any]) -> None:
-        self.update(Exchange, record, updates)
+        self._update_cached(Exchange, record, updates)
 
     def delete_exchange(self, data: Dict[str, Any]) -> None:
-        self.delete(Exchange, data)
+        self._delete_cached(Exchange, data)
 
     def create_trading_product(self, data: Dict[str, Any]) -> int:
-        return self.create(TradingProduct, data)
+        # Tickers are not unique, so creation keeps the full duplicate check
+        record_id = self.create(TradingProduct, data)
+        if record_id is not None and record_id > 0:
+            self.reference_cache.put(TradingProduct, record_id, data)
+        return record_id
 
     def read_trading_product(self, filters: Dict[str, Any] = None) -> list[Type[Base]]:
         return self.read(TradingProduct, filters)
 
     def update_trading_product(self, record: Dict[str, Any], updates: Dict[str, Any]) -> None:
-        self.update(TradingProduct, record, updates)
+        self._update_cached(TradingProduct, record, updates)
 
     def delete_trading_product(self, data: Dict[str, Any]) -> None:
-        self.delete(TradingProduct, data)
+        self._delete_cached(TradingProduct, data)
 
     def create_asset(self, data: Dict[str, Any]) -> int:
-        return self.create(Asset, data)
+        return self._create_cached(Asset, data)
 
     def read_asset(self, filters: Dict[str, Any] = None) -> list[Type[Base]]:
         return self.read(Asset, filters)
 
     def update_asset(self, record: Dict[str, Any], updates: Dict[str, Any]) -> None:
-        self.update(Asset, record, updates)
+        self._update_cached(Asset, record, updates)
 
     def delete_asset(self, data: Dict[str, Any]) -> None:
-        self.delete(Asset, data)
+        self._delete_cached(Asset, data)
 
     def create_trading_product_exchange(self, data: Dict[str, Any]) -> int:
         return self.create(TradingProductExchange, data)
@@ -66,3 +118,96 @@ class Operations(GenericDatabase):
 
     def delete_trading_product_exchange(self, data: Dict[str, Any]) -> None:
         self.delete(TradingProductExchange, data)
+
+    def create_data_points(
+        self, asset_id: int, timeframe: str, data: Mapping[str, Sequence] | Sequence
+    ) -> Tuple[int, int] | None:
+        return self.insert_ohlcv(asset_id, timeframe, data)
+
+    def read_data_points(
+        self,
+        asset_id: int,
+        timeframe: str,
+        start: Any = None,
+        end: Any = None,
+        as_tensor: bool = False,
+    ) -> Dict[str, Any]:
+        return self.read_ohlcv(asset_id, timeframe, start, end, as_tensor)
+
+
+class AsyncOperations(AsyncGenericDatabase):
+    def __init__(
+        self,
+        db_path: str = None,
+        batch_size: int = 5000,
+        flush_interval: float = 0.5,
+        profile: str | Dict[str, Any] | None = None,
+    ):
+        super().__init__(db_path, batch_size, flush_interval, profile)
+
+    async def create_exchange(self, data: Dict[str, Any]) -> int | None:
+        return await self.create(Exchange, data)
+
+    async def read_exchange(self, filters: Dict[str, Any] = None) -> list[Type[Base]]:
+        return await self.read(Exchange, filters)
+
+    async def update_exchange(self, record: Dict[str, Any], updates: Dict[str, Any]) -> None:
+        await self.update(Exchange, record, updates)
+
+    async def delete_exchange(self, data: Dict[str, Any]) -> None:
+        await self.delete(Exchange, data)
+
+    async def create_trading_product(self, data: Dict[str, Any]) -> int:
+        return await self.create(TradingProduct, data)
+
+    async def read_trading_product(self, filters: Dict[str, Any] = None) -> list[Type[Base]]:
+        return await self.read(TradingProduct, filters)
+
+    async def update_trading_product(self, record: Dict[str, Any], updates: Dict[str, Any]) -> None:
+        await self.update(TradingProduct, record, updates)
+
+    async def delete_trading_product(self, data: Dict[str, Any]) -> None:
+        await self.delete(TradingProduct, data)
+
+    async def create_asset(self, data: Dict[str, Any]) -> int:
+        return await self.create(Asset, data)
+
+    async def read_asset(self, filters: Dict[str, Any] = None) -> list[Type[Base]]:
+        return await self.read(Asset, filters)
+
+    async def update_asset(self, record: Dict[str, Any], updates: Dict[str, Any]) -> None:
+        await self.update(Asset, record, updates)
+
+    async def delete_asset(self, data: Dict[str, Any]) -> None:
+        await self.delete(Asset, data)
+
+    async def create_trading_product_exchange(self, data: Dict[str, Any]) -> int:
+        return await self.create(TradingProductExchange, data)
+
+    async def read_trading_product_exchange(
+        self, filters: Dict[str, Any] = None
+    ) -> list[Type[Base]]:
+        return await self.read(TradingProductExchange, filters)
+
+    async def update_trading_product_exchange(
+        self, record: Dict[str, Any], updates: Dict[str, Any]
+    ) -> None:
+        await self.update(TradingProductExchange, record, updates)
+
+    async def delete_trading_product_exchange(self, data: Dict[str, Any]) -> None:
+        await self.delete(TradingProductExchange, data)
+
+    async def create_data_points(
+        self, asset_id: int, timeframe: str, data: Mapping[str, Sequence] | Sequence
+    ) -> Tuple[int, int] | None:
+        return await self.insert_ohlcv(asset_id, timeframe, data)
+
+    async def read_data_points(
+        self,
+        asset_id: int,
+        timeframe: str,
+        start: Any = None,
+        end: Any = None,
+        as_tensor: bool = False,
+    ) -> Dict[str, Any]:
+        return await self.read_ohlcv(asset_id, timeframe, start, end, as_tensor)
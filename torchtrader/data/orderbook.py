@@ -0,0 +1,371 @@
+"""
+torchtrader/data/orderbook.py
+
+L2 order book of a symbol, kept in sorted NumPy arrays of price levels.
+
+Every side stores its levels in ascending order of key, the price for bids and minus the price
+for asks, so that the best level of both sides is the last one: best bid and ask are read in
+O(1), a level is found by binary search in O(log n), and inserting or removing one only shifts
+the few levels in front of it, as most updates land close to the top of the book. Depth and
+VWAP-to-size queries are vectorized over the top levels.
+
+Books are fed with snapshots and deltas in the `fetch_order_book` format of ccxt (`bids` and
+`asks` as `[[price, amount], ...]`, an amount of 0 removing the level), polled live by
+`order_book_source` or replayed from a JSONL file written by `write_replay`.
+
+```python
+book = OrderBook("BTC/USDT")
+async for snapshot in order_book_source("binance", "BTC", "USDT"):
+    book.apply(snapshot)
+    print(book.best_bid, book.best_ask, book.vwap("buy", 2.5))
+```
+"""
+import asyncio
+import json
+from pathlib import Path
+from typing import Any
+from typing import AsyncIterator
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+TOP_FIELDS = ("timestamp", "bid", "bid_amount", "ask", "ask_amount")
+SIDES = ("bids", "asks")
+
+
+class BookSide:
+    """
+    Price levels of one side of a book, sorted by key, best level last.
+
+    Args:
+        sign (int): 1 for bids, -1 for asks: the key of a level is `sign * price`.
+        capacity (int): Levels allocated initially, doubled when full.
+    """
+
+    def __init__(self, sign: int, capacity: int = 1024):
+        self.sign = sign
+        self.keys = np.empty(capacity)
+        self.amounts = np.empty(capacity)
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def clear(self) -> None:
+        self.count = 0
+
+    def load(self, levels: Sequence[Sequence[float]]) -> None:
+        """
+        Replace the levels, `[[price, amount], ...]` in any order.
+        """
+        levels = np.asarray(levels if levels is not None else (), dtype=np.float64).reshape(-1, 2)
+        levels = levels[levels[:, 1] > 0]
+        self._reserve(len(levels))
+        keys = self.sign * levels[:, 0]
+        order = np.argsort(keys, kind="stable")
+        self.count = len(levels)
+        self.keys[: self.count] = keys[order]
+        self.amounts[: self.count] = levels[order, 1]
+
+    def update(self, price: float, amount: float) -> None:
+        """
+        Set the amount of a level, removing it when the amount is 0.
+        """
+        key = self.sign * price
+        count = self.count
+        index = int(self.keys[:count].searchsorted(key))
+        found = index < count and self.keys[index] == key
+        if amount > 0:
+            if found:
+                self.amounts[index] = amount
+                return
+            if count == len(self.keys):
+                self._reserve(count + 1)
+            # Shift the better levels one slot up, overlapping slices are copied safely
+            self.keys[index + 1 : count + 1] = self.keys[index:count]
+            self.amounts[index + 1 : count + 1] = self.amounts[index:count]
+            self.keys[index] = key
+            self.amounts[index] = amount
+            self.count = count + 1
+        elif found:
+            self.keys[index : count - 1] = self.keys[index + 1 : count]
+            self.amounts[index : count - 1] = self.amounts[index + 1 : count]
+            self.count = count - 1
+
+    def _reserve(self, levels: int) -> None:
+        if levels > len(self.keys):
+            capacity = max(levels, 2 * len(self.keys))
+            for name in ("keys", "amounts"):
+                grown = np.empty(capacity)
+                grown[: self.count] = getattr(self, name)[: self.count]
+                setattr(self, name, grown)
+
+    @property
+    def best(self) -> Tuple[float, float]:
+        """
+        Price and amount of the best level, NaN when the side is empty.
+        """
+        if not self.count:
+            return float("nan"), float("nan")
+        return self.sign * float(self.keys[self.count - 1]), float(self.amounts[self.count - 1])
+
+    def levels(self, depth: int | None = None) -> np.ndarray:
+        """
+        The `[depth, 2]` prices and amounts of the best `depth` levels, best first.
+        """
+        start = 0 if depth is None else max(0, self.count - depth)
+        levels = np.empty((self.count - start, 2))
+        levels[:, 0] = self.sign * self.keys[start : self.count][::-1]
+        levels[:, 1] = self.amounts[start : self.count][::-1]
+        return levels
+
+
+class TopOfBookHistory:
+    """
+    Ring buffer of the best bid and ask of a book after every update, for features.
+
+    Args:
+        capacity (int): Updates kept.
+    """
+
+    def __init__(self, capacity: int = 100_000):
+        self._rows = np.full((capacity, len(TOP_FIELDS)), np.nan)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return min(self.size, len(self._rows))
+
+    def append(
+        self, timestamp: float, bid: float, bid_amount: float, ask: float, ask_amount: float
+    ) -> None:
+        self._rows[self.size % len(self._rows)] = (timestamp, bid, bid_amount, ask, ask_amount)
+        self.size += 1
+
+    def to_array(self) -> np.ndarray:
+        """
+        The `[n, 5]` rows of `TOP_FIELDS` kept, oldest first.
+        """
+        if self.size <= len(self._rows):
+            return self._rows[: self.size].copy()
+        return np.roll(self._rows, -(self.size % len(self._rows)), axis=0)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """
+        The rows kept as a column per field, oldest first.
+        """
+        rows = self.to_array()
+        return {name: rows[:, index] for index, name in enumerate(TOP_FIELDS)}
+
+
+class OrderBook:
+    """
+    L2 order book of a symbol, updated from snapshots and deltas.
+
+    Args:
+        symbol (str): The symbol, e.g. "BTC/USDT".
+        capacity (int): Levels allocated per side initially.
+        history (int): Top-of-book updates kept in `history`, 0 for none.
+    """
+
+    def __init__(self, symbol: str = "", capacity: int = 1024, history: int = 100_000):
+        self.symbol = symbol
+        self.bids = BookSide(1, capacity)
+        self.asks = BookSide(-1, capacity)
+        self.history = TopOfBookHistory(history) if history else None
+        self.timestamp: float | None = None
+        self.nonce: int | None = None
+        self.updates = 0
+
+    def side(self, side: str) -> BookSide:
+        """
+        The levels of "bids" or "asks", or of the side a "buy" or a "sell" order consumes.
+        """
+        if side in ("bids", "sell"):
+            return self.bids
+        if side in ("asks", "buy"):
+            return self.asks
+        raise ValueError(f"Unknown side: {side}")
+
+    def apply(self, message: Dict[str, Any]) -> bool:
+        """
+        Apply a snapshot, or a delta when `message["type"]` is "delta".
+
+        Returns:
+            bool: False when the message is older than the book (its nonce is not greater) and
+            was skipped.
+        """
+        if message.get("type") == "delta":
+            return self.apply_delta(message)
+        return self.apply_snapshot(message)
+
+    def apply_snapshot(self, snapshot: Dict[str, Any]) -> bool:
+        """
+        Replace the book by a `fetch_order_book` snapshot.
+        """
+        if self._stale(snapshot):
+            return False
+        self.bids.load(snapshot.get("bids", ()))
+        self.asks.load(snapshot.get("asks", ()))
+        self._applied(snapshot)
+        return True
+
+    def apply_delta(self, delta: Dict[str, Any]) -> bool:
+        """
+        Update the levels of a delta, `bids` and `asks` as `[[price, amount], ...]`.
+        """
+        if self._stale(delta):
+            return False
+        for price, amount, *_ in delta.get("bids") or ():
+            self.bids.update(price, amount)
+        for price, amount, *_ in delta.get("asks") or ():
+            self.asks.update(price, amount)
+        self._applied(delta)
+        return True
+
+    def update(
+        self, side: str, price: float, amount: float, timestamp: float | None = None
+    ) -> None:
+        """
+        Set the amount of a single level, 0 removing it.
+        """
+        self.side(side).update(price, amount)
+        self._applied({"timestamp": timestamp})
+
+    def _stale(self, message: Dict[str, Any]) -> bool:
+        nonce = message.get("nonce")
+        return nonce is not None and self.nonce is not None and nonce <= self.nonce
+
+    def _applied(self, message: Dict[str, Any]) -> None:
+        self.updates += 1
+        if message.get("nonce") is not None:
+            self.nonce = message["nonce"]
+        if message.get("timestamp") is not None:
+            self.timestamp = message["timestamp"]
+        if self.history is not None:
+            timestamp = np.nan if self.timestamp is None else self.timestamp
+            self.history.append(timestamp, *self.bids.best, *self.asks.best)
+
+    @property
+    def best_bid(self) -> float:
+        return self.bids.best[0]
+
+    @property
+    def best_ask(self) -> float:
+        return self.asks.best[0]
+
+    @property
+    def mid(self) -> float:
+        return (self.best_bid + self.best_ask) / 2
+
+    @property
+    def spread(self) -> float:
+        return self.best_ask - self.best_bid
+
+    def depth(self, side: str, levels: int | None = None) -> np.ndarray:
+        """
+        The `[levels, 2]` prices and amounts of the best levels of a side, best first.
+        """
+        return self.side(side).levels(levels)
+
+    def volume(self, side: str, distance: float) -> float:
+        """
+        Amount resting on a side within `distance` of its best price.
+        """
+        book_side = self.side(side)
+        if not book_side.count:
+            return 0.0
+        keys = book_side.keys[: book_side.count]
+        start = int(keys.searchsorted(keys[-1] - distance))
+        return float(book_side.amounts[start : book_side.count].sum())
+
+    def vwap(self, side: str, size: float) -> float:
+        """
+        Average price of a market order of `size` walking the book, NaN when the book is too thin.
+
+        Args:
+            side (str): "buy" walks the asks, "sell" the bids.
+            size (float): The amount of the order.
+
+        Returns:
+            float: The volume weighted average price of the fills.
+        """
+        book_side = self.side(side)
+        amounts = book_side.amounts[: book_side.count][::-1]
+        cumulative = np.cumsum(amounts)
+        last = int(cumulative.searchsorted(size))
+        if size <= 0 or last >= len(amounts):
+            return float("nan")
+        prices = book_side.sign * book_side.keys[: book_side.count][::-1]
+        filled = cumulative[last - 1] if last else 0.0
+        cost = np.dot(prices[:last], amounts[:last]) + prices[last] * (size - filled)
+        return float(cost / size)
+
+    def imbalance(self, levels: int = 10) -> float:
+        """
+        (bid amount - ask amount) / (bid amount + ask amount) over the best `levels` levels.
+        """
+        bids = self.bids.amounts[max(0, self.bids.count - levels) : self.bids.count].sum()
+        asks = self.asks.amounts[max(0, self.asks.count - levels) : self.asks.count].sum()
+        total = bids + asks
+        return float((bids - asks) / total) if total else 0.0
+
+
+async def order_book_source(
+    market: str,
+    base: str,
+    quote: str,
+    limit: int | None = None,
+    poll_interval: float = 1.0,
+    replay_path: str | Path | None = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Live order book snapshots polled with `fetch_order_book`, on one exchange session.
+
+    Args:
+        market (str): The ccxt exchange id, e.g. "binance".
+        base (str): The base currency, e.g. "BTC".
+        quote (str): The quote currency, e.g. "USDT".
+        limit (int | None): Levels per side, the exchange default when None.
+        poll_interval (float): Seconds between two polls.
+        replay_path (str | Path | None): Also append every snapshot to this replay file.
+    """
+    from torchtrader.data.collection import FETCH_SECONDS
+    from torchtrader.data.collection import MarketData
+
+    market_data = MarketData(market)
+    async with market_data.setup_exchange():
+        while True:
+            with FETCH_SECONDS.time():
+                snapshot = await market_data.exchange.fetch_order_book(f"{base}/{quote}", limit)
+            if replay_path is not None:
+                write_replay(replay_path, [snapshot])
+            yield snapshot
+            await asyncio.sleep(poll_interval)
+
+
+def write_replay(path: str | Path, messages: Iterable[Dict[str, Any]]) -> None:
+    """
+    Append snapshots and deltas to a JSONL replay file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a") as file:
+        for message in messages:
+            levels = {side: message.get(side) or [] for side in SIDES}
+            fields = ("type", "symbol", "timestamp", "nonce")
+            record = {key: message[key] for key in fields if message.get(key) is not None}
+            file.write(json.dumps({**record, **levels}) + "\n")
+
+
+def read_replay(path: str | Path) -> Iterator[Dict[str, Any]]:
+    """
+    The snapshots and deltas of a replay file, in order.
+    """
+    with Path(path).open() as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
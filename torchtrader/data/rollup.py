@@ -0,0 +1,180 @@
+"""
+torchtrader/data/rollup.py
+
+Materialized OHLCV rollups. Candles of coarser timeframes (e.g. 1h, 1d) are aggregated from the
+stored base candles (e.g. 1m) into `DataPoint` rows of their own timeframe, so reading them is a
+plain `read_ohlcv(asset_id, "1h")`.
+
+Rollups are maintained incrementally: a watermark per (asset, timeframe) remembers the highest
+base `DataPoint` id already aggregated, and a refresh only recomputes the buckets touched by base
+candles inserted after it, including late or backfilled ones. Candles corrected in place keep
+their id, so `GenericDatabase.bulk_update` refreshes the buckets they left and moved to.
+"""
+from typing import Dict
+from typing import List
+from typing import Sequence
+
+import numpy as np
+from sqlalchemy import delete
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from torchtrader.config import get_section
+from torchtrader.data.database import GenericDatabase
+from torchtrader.data.database import ohlcv_arrays
+from torchtrader.data.database import OHLCV_COLUMNS
+from torchtrader.data.database import OHLCV_KEY
+from torchtrader.data.database import ohlcv_params
+from torchtrader.data.database import ohlcv_select
+from torchtrader.data.database import timestamp_ms
+from torchtrader.data.database import to_datetime
+from torchtrader.data.schema import DataPoint
+from torchtrader.data.schema import RollupWatermark
+from torchtrader.logs.logger import app_logger
+from torchtrader.utils import timeframe_to_seconds
+
+
+def aggregate_ohlcv(data: Dict[str, np.ndarray], step_ms: int) -> Dict[str, np.ndarray]:
+    """
+    Aggregate time-sorted candles into buckets of `step_ms` milliseconds aligned on the epoch.
+
+    Args:
+        data (Dict[str, np.ndarray]): Candles in the `read_ohlcv` format.
+        step_ms (int): The bucket width in milliseconds.
+
+    Returns:
+        Dict[str, np.ndarray]: One candle per non-empty bucket, stamped with the bucket start.
+    """
+    buckets = data["timestamp"] // step_ms
+    if len(buckets) == 0:
+        return {name: values[:0] for name, values in data.items()}
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    return {
+        "timestamp": buckets[starts] * step_ms,
+        "open": data["open"][starts],
+        "high": np.maximum.reduceat(data["high"], starts),
+        "low": np.minimum.reduceat(data["low"], starts),
+        "close": data["close"][ends],
+        "volume": np.add.reduceat(data["volume"], starts),
+    }
+
+
+class RollupManager:
+    """
+    Keep the rollup timeframes of the candles stored in a `GenericDatabase` up to date.
+
+    Args:
+        database (GenericDatabase): The database storing the candles as `DataPoint` rows.
+        base_timeframe (str | None): The timeframe rollups are computed from. Defaults to
+            `rollups.base_timeframe` in the configuration, or "1m".
+        timeframes (Sequence[str] | None): The rollup timeframes. Defaults to
+            `rollups.timeframes` in the configuration, or ["1h", "1d"].
+    """
+
+    def __init__(
+        self,
+        database: GenericDatabase,
+        base_timeframe: str | None = None,
+        timeframes: Sequence[str] | None = None,
+    ):
+        config = get_section("rollups")
+        self.database = database
+        self.base_timeframe = base_timeframe or config.get("base_timeframe", "1m")
+        self.timeframes: List[str] = list(timeframes or config.get("timeframes", ["1h", "1d"]))
+
+    def refresh(self, asset_id: int, timestamps: Sequence[int] = ()) -> Dict[str, int] | None:
+        """
+        Recompute the rollup buckets touched by base candles inserted since the last refresh.
+
+        Args:
+            asset_id (int): The asset to refresh.
+            timestamps (Sequence[int]): Epoch milliseconds of base candles changed in place or
+                removed, whose buckets are recomputed too.
+
+        Returns:
+            Dict[str, int] | None: The number of recomputed buckets per rollup timeframe, or None
+            on error.
+        """
+        table = DataPoint.__table__
+        session = self.database.db_session
+        try:
+            refreshed = {}
+            for timeframe in self.timeframes:
+                step_ms = timeframe_to_seconds(timeframe) * 1000
+                watermark = session.execute(
+                    select(RollupWatermark).filter_by(asset_id=asset_id, timeframe=timeframe)
+                ).scalar()
+                if watermark is None:
+                    watermark = RollupWatermark(asset_id=asset_id, timeframe=timeframe)
+                    session.add(watermark)
+                last_id = watermark.data_point_id or 0
+
+                new_rows = (
+                    table.c.asset_id == asset_id,
+                    table.c.timeframe == self.base_timeframe,
+                    table.c.id > last_id,
+                )
+                max_id = session.execute(select(func.max(table.c.id)).where(*new_rows)).scalar()
+                buckets = {int(timestamp) // step_ms for timestamp in timestamps}
+                if max_id is not None:
+                    bucket = timestamp_ms(table.c.date_time).op("/")(step_ms)
+                    buckets.update(
+                        session.execute(select(bucket).where(*new_rows).distinct()).scalars()
+                    )
+
+                n_buckets = 0
+                for first, last in _runs(sorted(buckets)):
+                    start, end = first * step_ms, (last + 1) * step_ms
+                    rows = session.execute(
+                        ohlcv_select(asset_id, self.base_timeframe, start, end)
+                    ).all()
+                    rollup = aggregate_ohlcv(ohlcv_arrays(rows), step_ms)
+                    self._replace(asset_id, timeframe, start, end, rollup)
+                    n_buckets += len(rollup["timestamp"])
+
+                if max_id is not None:
+                    watermark.data_point_id = max_id
+                refreshed[timeframe] = n_buckets
+            session.commit()
+            app_logger.info("Refreshed rollups of asset %s: %s", asset_id, refreshed)
+            return refreshed
+        except Exception as e:
+            app_logger.error("Error refreshing rollups of asset %s: %s", asset_id, e)
+            session.rollback()
+            return None
+
+    def _replace(
+        self, asset_id: int, timeframe: str, start: int, end: int, rollup: Dict[str, np.ndarray]
+    ) -> None:
+        # Drop the rollup candles of [start, end) the base candles no longer fill, upsert the rest
+        table = DataPoint.__table__
+        self.database.db_session.execute(
+            delete(table).where(
+                table.c.asset_id == asset_id,
+                table.c.timeframe == timeframe,
+                table.c.date_time >= to_datetime(start),
+                table.c.date_time < to_datetime(end),
+                timestamp_ms(table.c.date_time).not_in(rollup["timestamp"].tolist()),
+            )
+        )
+        if len(rollup["timestamp"]) == 0:
+            return
+        statement = insert(DataPoint.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=OHLCV_KEY,
+            set_={column: statement.excluded[column] for column in OHLCV_COLUMNS},
+        )
+        self.database.db_session.execute(statement, ohlcv_params(asset_id, timeframe, rollup))
+
+
+def _runs(values: List[int]) -> List[tuple]:
+    # Group sorted integers into (first, last) runs of consecutive values
+    runs = []
+    for value in values:
+        if runs and value == runs[-1][1] + 1:
+            runs[-1][1] = value
+        else:
+            runs.append([value, value])
+    return [tuple(run) for run in runs]
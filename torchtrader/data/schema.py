@@ -6,8 +6,13 @@ from datetime import datetime
 from sqlalchemy import DateTime
 from sqlalchemy import Float
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
+from sqlalchemy import inspect
 from sqlalchemy import Integer
 from sqlalchemy import String
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
@@ -71,8 +76,18 @@ class Asset(Base):
 
 class DataPoint(Base):
     __tablename__ = "data_points"
+    __table_args__ = (
+        Index(
+            "ix_data_points_asset_timeframe_date_time",
+            "asset_id",
+            "timeframe",
+            "date_time",
+            unique=True,
+        ),
+    )
     id: Mapped[int] = mapped_column(Integer(), primary_key=True, autoincrement=True)
     asset_id: Mapped[int] = mapped_column(Integer(), ForeignKey("assets.id"), nullable=False)
+    timeframe: Mapped[str] = mapped_column(String(5), nullable=False, default="1m")
     date_time: Mapped[datetime] = mapped_column(DateTime(), nullable=False)
     open: Mapped[float] = mapped_column(Float(), nullable=False)
     high: Mapped[float] = mapped_column(Float(), nullable=False)
@@ -80,3 +95,59 @@ class DataPoint(Base):
     close: Mapped[float] = mapped_column(Float(), nullable=False)
     volume: Mapped[float] = mapped_column(Float(), nullable=False)
     asset = relationship("Asset", back_populates="data_points")
+
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+    __table_args__ = (
+        Index("ix_rollup_watermarks_asset_timeframe", "asset_id", "timeframe", unique=True),
+    )
+    id: Mapped[int] = mapped_column(Integer(), primary_key=True, autoincrement=True)
+    asset_id: Mapped[int] = mapped_column(Integer(), ForeignKey("assets.id"), nullable=False)
+    timeframe: Mapped[str] = mapped_column(String(5), nullable=False)
+    # Highest base DataPoint id already aggregated into this timeframe
+    data_point_id: Mapped[int] = mapped_column(Integer(), nullable=False, default=0)
+
+
+def create_schema(connection: Connection, read_only: bool = False) -> None:
+    """
+    Create the missing tables and upgrade the ones of a database created by an older version.
+
+    `data_points` gained a `timeframe` column and the unique index
+    `ix_data_points_asset_timeframe_date_time`: the column is added with the "1m" default, the
+    timeframe of the candles collected before, and the index is then built.
+
+    Args:
+        connection (Connection): A connection in a transaction, e.g. from `engine.begin()`.
+        read_only (bool): Only check the schema, the database cannot be upgraded.
+
+    Raises:
+        RuntimeError: The database is read-only and not up to date, or holds duplicate candles
+            the unique index cannot be built on.
+    """
+    tables = inspect(connection).get_table_names()
+    if "data_points" in tables:
+        columns = {column["name"] for column in inspect(connection).get_columns("data_points")}
+        if "timeframe" not in columns:
+            if read_only:
+                raise RuntimeError(
+                    "data_points has no timeframe column, open the database once without "
+                    "read_only to upgrade it"
+                )
+            connection.execute(
+                text(
+                    "ALTER TABLE data_points ADD COLUMN timeframe VARCHAR(5) NOT NULL DEFAULT '1m'"
+                )
+            )
+    if read_only:
+        return
+
+    Base.metadata.create_all(connection)
+    for index in DataPoint.__table__.indexes:
+        try:
+            index.create(connection, checkfirst=True)
+        except IntegrityError as error:
+            raise RuntimeError(
+                f"Cannot build {index.name}: data_points holds duplicate candles of an asset and "
+                "timeframe, remove them first"
+            ) from error
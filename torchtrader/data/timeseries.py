@@ -0,0 +1,366 @@
+"""
+torchtrader/data/timeseries.py
+
+Storage backends for OHLCV candles. SQLite keeps the reference tables (`Exchange`, `Asset`,
+`TradingProduct`, ...) while candles can live in a memory-mapped columnar store instead of
+`DataPoint` rows, see `GenericDatabase(timeseries="columnar")`.
+
+Layout of the columnar store:
+
+```
+<root>/<asset_id>/<timeframe>/manifest.json
+<root>/<asset_id>/<timeframe>/<period>/timestamp.bin   int64 epoch milliseconds
+<root>/<asset_id>/<timeframe>/<period>/open.bin        float64, same for high/low/close/volume
+```
+
+Periods are months for intraday timeframes and years for daily and longer ones. The manifest
+records the number of committed rows of every partition, anything past it in the column files is
+the tail of an interrupted append and is discarded. Backfilled partitions are rewritten to a new
+`<period>.v<n>` directory, which the manifest points to once complete.
+"""
+import json
+import os
+import shutil
+from abc import ABC
+from abc import abstractmethod
+from datetime import datetime
+from datetime import timedelta
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+from torchtrader.data.database import DATA_DIR
+from torchtrader.data.database import EPOCH
+from torchtrader.data.database import OHLCV_COLUMNS
+from torchtrader.data.database import ohlcv_row
+from torchtrader.logs.logger import app_logger
+from torchtrader.utils import timeframe_to_seconds
+
+DEFAULT_COLUMNAR_ROOT = DATA_DIR / "processed" / "ohlcv"
+COLUMN_DTYPES = {"timestamp": np.int64, **{column: np.float64 for column in OHLCV_COLUMNS}}
+
+
+class TimeSeriesStore(ABC):
+    """
+    Interface of the OHLCV storage backends.
+    """
+
+    @abstractmethod
+    def insert_ohlcv(
+        self, asset_id: int, timeframe: str, data: Mapping[str, Sequence] | Sequence
+    ) -> Tuple[int, int] | None:
+        """
+        Store candles of an asset, skipping the ones already stored.
+
+        Returns:
+            Tuple[int, int] | None: The number of inserted and skipped candles, or None on error.
+        """
+
+    @abstractmethod
+    def read_ohlcv(
+        self,
+        asset_id: int,
+        timeframe: str,
+        start: Any = None,
+        end: Any = None,
+        as_tensor: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Read the candles of an asset in the time range [start, end) as column arrays.
+
+        Returns:
+            Dict[str, Any]: "timestamp" in epoch milliseconds plus one array per OHLCV column.
+        """
+
+
+def to_milliseconds(value: Any) -> int:
+    """
+    Convert a datetime (naive UTC or aware) or epoch milliseconds into epoch milliseconds.
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return (value - EPOCH) // timedelta(milliseconds=1)
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+
+def ohlcv_columns(data: Mapping[str, Sequence] | Sequence) -> Dict[str, np.ndarray]:
+    """
+    Normalize OHLCV candles into column arrays sorted by time, without duplicated timestamps.
+
+    Args:
+        data (Mapping[str, Sequence] | Sequence): Columnar arrays or a list of rows, in any of the
+            formats accepted by `torchtrader.data.database.ohlcv_params`.
+
+    Returns:
+        Dict[str, np.ndarray]: "timestamp" in epoch milliseconds plus one array per OHLCV column.
+    """
+    if isinstance(data, Mapping):
+        times = data["timestamp"] if "timestamp" in data else data["date_time"]
+        columns = {column: np.asarray(data[column], dtype=np.float64) for column in OHLCV_COLUMNS}
+    else:
+        rows = [ohlcv_row(row) if isinstance(row, Mapping) else row for row in data]
+        times = [row[0] for row in rows]
+        values = np.asarray([row[1:] for row in rows], dtype=np.float64).reshape(-1, 5)
+        columns = dict(zip(OHLCV_COLUMNS, values.T))
+
+    if len(times) and isinstance(times[0], datetime):
+        times = [to_milliseconds(time) for time in times]
+    timestamps = np.asarray(times, dtype=np.int64)
+
+    # Sort and keep the first occurrence of every timestamp
+    timestamps, index = np.unique(timestamps, return_index=True)
+    result = {"timestamp": timestamps}
+    result.update({column: np.ascontiguousarray(columns[column][index]) for column in columns})
+    return result
+
+
+class ColumnarStore(TimeSeriesStore):
+    """
+    Append-only columnar OHLCV store with fixed-width binary columns and memory-mapped reads.
+
+    Candles are appended per (asset, timeframe) series in time order, so an append costs O(new
+    rows). Candles at or before the last stored timestamp, e.g. backfills and gap fills, are
+    merged into their partitions instead, which are rewritten; the timestamps already stored are
+    skipped as duplicates, as by the SQLite backend. Reads within one partition are zero-copy
+    views of the mapped files.
+
+    Args:
+        root (str | Path | None): The store directory. Defaults to `data/processed/ohlcv`.
+    """
+
+    def __init__(self, root: str | Path | None = None):
+        self.root = Path(root) if root is not None else DEFAULT_COLUMNAR_ROOT
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def series_dir(self, asset_id: int, timeframe: str) -> Path:
+        return self.root / str(asset_id) / timeframe
+
+    def read_manifest(self, asset_id: int, timeframe: str) -> Dict[str, Any]:
+        manifest_path = self.series_dir(asset_id, timeframe) / "manifest.json"
+        if not manifest_path.is_file():
+            return {"asset_id": asset_id, "timeframe": timeframe, "partitions": []}
+        return json.loads(manifest_path.read_text())
+
+    def write_manifest(self, asset_id: int, timeframe: str, manifest: Dict[str, Any]) -> None:
+        series_dir = self.series_dir(asset_id, timeframe)
+        tmp_path = series_dir / "manifest.json.tmp"
+        tmp_path.write_text(json.dumps(manifest, indent=1))
+        # Atomic swap, readers see either the old or the new manifest
+        os.replace(tmp_path, series_dir / "manifest.json")
+
+    @staticmethod
+    def partition_keys(timeframe: str, timestamps: np.ndarray) -> np.ndarray:
+        """
+        Name the partition of every timestamp: "YYYY-MM" for intraday timeframes, else "YYYY".
+        """
+        unit = "M" if timeframe_to_seconds(timeframe) < 86_400 else "Y"
+        return timestamps.astype("datetime64[ms]").astype(f"datetime64[{unit}]").astype(str)
+
+    def insert_ohlcv(
+        self, asset_id: int, timeframe: str, data: Mapping[str, Sequence] | Sequence
+    ) -> Tuple[int, int] | None:
+        try:
+            columns = ohlcv_columns(data)
+            n_received = len(data["close"] if isinstance(data, Mapping) else data)
+
+            manifest = self.read_manifest(asset_id, timeframe)
+            partitions: List[Dict[str, Any]] = manifest["partitions"]
+            merged, replaced = 0, []
+            if partitions:
+                new = columns["timestamp"] > partitions[-1]["last"]
+                if not new.all():
+                    backfill = {name: values[~new] for name, values in columns.items()}
+                    merged, replaced = self._merge(asset_id, timeframe, partitions, backfill)
+                columns = {name: values[new] for name, values in columns.items()}
+
+            timestamps = columns["timestamp"]
+            if len(timestamps):
+                keys = self.partition_keys(timeframe, timestamps)
+                # Keys are sorted along with the timestamps, so each partition is one slice
+                boundaries = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+                for begin, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(keys)]):
+                    self._append_partition(
+                        asset_id,
+                        timeframe,
+                        partitions,
+                        str(keys[begin]),
+                        {name: values[begin:end] for name, values in columns.items()},
+                    )
+            if len(timestamps) or merged:
+                self.write_manifest(asset_id, timeframe, manifest)
+            # Rewritten partitions are only dropped once the manifest no longer points to them
+            for partition_dir in replaced:
+                shutil.rmtree(partition_dir, ignore_errors=True)
+
+            inserted = len(timestamps) + merged
+            skipped = n_received - inserted
+            app_logger.info(
+                "Appended %s candles for asset %s (%s), %s skipped",
+                inserted,
+                asset_id,
+                timeframe,
+                skipped,
+            )
+            return inserted, skipped
+        except Exception as e:
+            app_logger.error(
+                "Error appending candles for asset %s (%s): %s", asset_id, timeframe, e
+            )
+            return None
+
+    def _merge(
+        self,
+        asset_id: int,
+        timeframe: str,
+        partitions: List[Dict[str, Any]],
+        columns: Dict[str, np.ndarray],
+    ) -> Tuple[int, List[Path]]:
+        # Candles at or before the last stored one: every partition they fall in is rewritten
+        # to a new directory with them, skipping the timestamps already stored
+        series_dir = self.series_dir(asset_id, timeframe)
+        by_period = {partition["period"]: partition for partition in partitions}
+        keys = self.partition_keys(timeframe, columns["timestamp"])
+        merged, replaced = 0, []
+        for key in np.unique(keys):
+            rows = {name: values[keys == key] for name, values in columns.items()}
+            partition = by_period.get(str(key))
+            if partition is not None:
+                stored = self._read_partition(series_dir, partition)
+                new = ~np.isin(rows["timestamp"], stored["timestamp"])
+                if not new.any():
+                    continue
+                rows = {
+                    name: np.concatenate([stored[name], values[new]])
+                    for name, values in rows.items()
+                }
+                order = np.argsort(rows["timestamp"], kind="stable")
+                rows = {name: values[order] for name, values in rows.items()}
+                merged += int(new.sum())
+                replaced.append(series_dir / partition.get("dir", partition["period"]))
+            else:
+                partition = {"period": str(key)}
+                partitions.append(partition)
+                partitions.sort(key=lambda entry: entry["period"])
+                merged += len(rows["timestamp"])
+
+            partition["version"] = partition.get("version", 0) + 1
+            partition["dir"] = f"{key}.v{partition['version']}"
+            partition_dir = series_dir / partition["dir"]
+            partition_dir.mkdir(parents=True, exist_ok=True)
+            for name, dtype in COLUMN_DTYPES.items():
+                rows[name].astype(dtype, copy=False).tofile(partition_dir / f"{name}.bin")
+            partition["rows"] = len(rows["timestamp"])
+            partition["first"] = int(rows["timestamp"][0])
+            partition["last"] = int(rows["timestamp"][-1])
+        return merged, replaced
+
+    @staticmethod
+    def _read_partition(series_dir: Path, partition: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        partition_dir = series_dir / partition.get("dir", partition["period"])
+        return {
+            name: np.fromfile(partition_dir / f"{name}.bin", dtype=dtype, count=partition["rows"])
+            for name, dtype in COLUMN_DTYPES.items()
+        }
+
+    def _append_partition(
+        self,
+        asset_id: int,
+        timeframe: str,
+        partitions: List[Dict[str, Any]],
+        key: str,
+        columns: Dict[str, np.ndarray],
+    ) -> None:
+        if not partitions or partitions[-1]["period"] != key:
+            partitions.append({"period": key, "rows": 0, "first": None, "last": None})
+        partition = partitions[-1]
+        partition_dir = self.series_dir(asset_id, timeframe) / partition.get("dir", key)
+        partition_dir.mkdir(parents=True, exist_ok=True)
+
+        for name, dtype in COLUMN_DTYPES.items():
+            with open(partition_dir / f"{name}.bin", "ab") as column_file:
+                # Drop the tail of an append interrupted before its manifest was written
+                column_file.truncate(partition["rows"] * np.dtype(dtype).itemsize)
+                column_file.write(columns[name].astype(dtype, copy=False).tobytes())
+
+        timestamps = columns["timestamp"]
+        partition["rows"] += len(timestamps)
+        if partition["first"] is None:
+            partition["first"] = int(timestamps[0])
+        partition["last"] = int(timestamps[-1])
+
+    def read_ohlcv(
+        self,
+        asset_id: int,
+        timeframe: str,
+        start: Any = None,
+        end: Any = None,
+        as_tensor: bool = False,
+    ) -> Dict[str, Any]:
+        start_ms = to_milliseconds(start) if start is not None else None
+        end_ms = to_milliseconds(end) if end is not None else None
+        series_dir = self.series_dir(asset_id, timeframe)
+
+        chunks = []
+        for partition in self.read_manifest(asset_id, timeframe)["partitions"]:
+            if partition["rows"] == 0:
+                continue
+            if start_ms is not None and partition["last"] < start_ms:
+                continue
+            if end_ms is not None and partition["first"] >= end_ms:
+                continue
+            columns = {
+                name: np.memmap(
+                    series_dir / partition.get("dir", partition["period"]) / f"{name}.bin",
+                    dtype=dtype,
+                    mode="c",
+                    shape=(partition["rows"],),
+                )
+                for name, dtype in COLUMN_DTYPES.items()
+            }
+            timestamps = columns["timestamp"]
+            begin = 0 if start_ms is None else np.searchsorted(timestamps, start_ms, "left")
+            stop = len(timestamps)
+            if end_ms is not None:
+                stop = np.searchsorted(timestamps, end_ms, "left")
+            chunks.append({name: values[begin:stop] for name, values in columns.items()})
+
+        if len(chunks) == 1:
+            arrays = {name: np.asarray(values) for name, values in chunks[0].items()}
+        else:
+            arrays = {
+                name: np.concatenate([chunk[name] for chunk in chunks])
+                if chunks
+                else np.empty(0, dtype=dtype)
+                for name, dtype in COLUMN_DTYPES.items()
+            }
+
+        if as_tensor:
+            import torch
+
+            return {name: torch.from_numpy(array) for name, array in arrays.items()}
+        return arrays
+
+
+def make_timeseries_store(backend: str | TimeSeriesStore | None, **options) -> TimeSeriesStore:
+    """
+    Build the OHLCV backend selected by name.
+
+    Args:
+        backend (str | TimeSeriesStore | None): "columnar", or an already built store.
+        **options: Keyword arguments of the store, e.g. `root` for "columnar".
+
+    Returns:
+        TimeSeriesStore: The store.
+    """
+    if isinstance(backend, TimeSeriesStore):
+        return backend
+    if backend == "columnar":
+        return ColumnarStore(**options)
+    raise ValueError(f"Unknown time series backend: {backend}")
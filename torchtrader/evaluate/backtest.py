@@ -0,0 +1,218 @@
+"""
+torchtrader/evaluate/backtest.py
+
+Vectorized backtester evaluating many parameter sets of a strategy on many assets at once.
+
+Signals are target positions shaped `[P, N, T]` (parameter sets x assets x bars), e.g. +1 long,
+-1 short, 0 flat, or any fraction in between. A signal computed on the close of bar t is held from
+that close to the close of bar t + `delay`, so strategies cannot trade on the bar they observe.
+Everything is computed with tensor ops over the time axis, without a Python loop over the bars.
+"""
+from dataclasses import dataclass
+from typing import Iterable
+from typing import Iterator
+from typing import Sequence
+
+import torch
+from torch import Tensor
+
+from torchtrader.profiling import profiled
+
+# Elements of a [P, N, T] chunk, bounding the memory of the intermediate tensors (64 MiB each)
+CHUNK_ELEMENTS = 1 << 24
+
+
+@dataclass
+class BacktestResult:
+    """
+    Statistics of every (parameter set, asset) pair, all shaped `[P, N]`. The curves shaped
+    `[P, N, T]` are only kept when the backtest runs with `keep_curves=True`.
+    """
+
+    total_return: Tensor
+    sharpe: Tensor
+    max_drawdown: Tensor
+    trades: Tensor
+    turnover: Tensor
+    costs: Tensor
+    positions: Tensor | None = None
+    returns: Tensor | None = None
+    equity: Tensor | None = None
+
+
+def asset_returns(prices: Tensor) -> Tensor:
+    """
+    Simple returns of every bar, shaped like `prices` `[N, T]`, with 0 on the first bar.
+    """
+    returns = torch.zeros_like(prices)
+    returns[..., 1:] = prices[..., 1:] / prices[..., :-1] - 1
+    return returns
+
+
+@profiled("evaluate")
+def backtest(
+    signals: Tensor | Iterable[Tensor],
+    prices: Tensor,
+    fee: float = 0.001,
+    slippage: float = 0.0,
+    delay: int = 1,
+    initial_capital: float = 1.0,
+    periods_per_year: float | None = None,
+    keep_curves: bool = False,
+    chunk_size: int | None = None,
+) -> BacktestResult:
+    """
+    Backtest target position signals on close prices.
+
+    Args:
+        signals (Tensor | Iterable[Tensor]): Target positions `[P, N, T]`, or `[N, T]` for a
+            single parameter set. Grids too large for memory can be given as an iterable of
+            `[p, N, T]` chunks, see `crossover_signal_chunks`.
+        prices (Tensor): Close prices `[N, T]`.
+        fee (float): Fee paid on every traded notional, as a fraction (0.001 = 10 bps).
+        slippage (float): Execution price slippage on every traded notional, as a fraction.
+        delay (int): Bars between a signal and the position taking it, 0 to trade on the close
+            the signal was computed on.
+        initial_capital (float): Starting equity of every curve.
+        periods_per_year (float | None): Bars per year used to annualize the Sharpe ratio, e.g.
+            525_600 for 1m candles. The Sharpe ratio is per bar when not given.
+        keep_curves (bool): Also return the positions, net returns and equity curves.
+        chunk_size (int | None): Parameter sets of a signals tensor evaluated together. Defaults
+            to as many as fit in `CHUNK_ELEMENTS` elements per intermediate tensor.
+
+    Returns:
+        BacktestResult: The statistics of every (parameter set, asset) pair.
+    """
+    n_assets, n_bars = prices.shape
+    if not 0 <= delay < n_bars:
+        raise ValueError(f"Delay {delay} must be in [0, {n_bars}), the number of bars")
+    if isinstance(signals, Tensor):
+        if signals.dim() == 2:
+            signals = signals.unsqueeze(0)
+        chunk_size = chunk_size or max(1, CHUNK_ELEMENTS // (n_assets * n_bars))
+        signals = signals.split(chunk_size)
+
+    returns = asset_returns(prices)
+    cost_rate = fee + slippage
+    annualization = periods_per_year**0.5 if periods_per_year else 1.0
+
+    chunks = []
+    for chunk in signals:
+        if chunk.shape[1:] != prices.shape:
+            raise ValueError(
+                f"Signals {tuple(chunk.shape)} do not match prices {tuple(prices.shape)}"
+            )
+        # Position held over bar t, taken on the close of bar t - delay
+        positions = torch.empty(chunk.shape, dtype=prices.dtype, device=prices.device)
+        positions[..., :delay] = 0
+        positions[..., delay:] = chunk[..., : n_bars - delay]
+        turnover = positions.clone()
+        turnover[..., 1:] -= positions[..., :-1]
+        turnover.abs_()
+        total_turnover = turnover.sum(dim=-1)
+
+        net = positions * returns if keep_curves else positions.mul_(returns)
+        net.sub_(turnover, alpha=cost_rate)
+        # Turnover is non-negative, so its sign counts the bars with a trade
+        trades = turnover.sign_().sum(dim=-1).long()
+        del turnover
+
+        mean = net.mean(dim=-1)
+        # Population variance from the sum of squares, a single pass without a temporary
+        squares = torch.linalg.vector_norm(net, dim=-1).square_() / n_bars
+        std = (squares - mean.square()).clamp_(0).sqrt_()
+        sharpe = torch.where(std > 0, mean / std, torch.zeros_like(std))
+
+        equity = torch.add(net, 1).cumprod_(dim=-1).mul_(initial_capital)
+        peaks = torch.cummax(equity, dim=-1).values
+        lowest = torch.div(equity, peaks, out=peaks).amin(dim=-1)
+        chunk_result = BacktestResult(
+            total_return=equity[..., -1] / initial_capital - 1,
+            sharpe=sharpe * annualization,
+            max_drawdown=1 - lowest,
+            trades=trades,
+            turnover=total_turnover,
+            costs=total_turnover * cost_rate,
+        )
+        if keep_curves:
+            chunk_result.positions = positions
+            chunk_result.returns = net
+            chunk_result.equity = equity
+        chunks.append(chunk_result)
+
+    return BacktestResult(
+        **{
+            name: torch.cat([getattr(chunk, name) for chunk in chunks])
+            if getattr(chunks[0], name) is not None
+            else None
+            for name in BacktestResult.__dataclass_fields__
+        }
+    )
+
+
+def moving_averages(prices: Tensor, windows: Sequence[int]) -> Tensor:
+    """
+    Simple moving averages of the prices for every window, from cumulative sums.
+
+    Args:
+        prices (Tensor): Close prices `[N, T]`.
+        windows (Sequence[int]): The window lengths in bars.
+
+    Returns:
+        Tensor: The averages `[W, N, T]`, NaN while a window is not full.
+    """
+    padded = torch.nn.functional.pad(prices.double().cumsum(dim=-1), (1, 0))
+    averages = torch.full(
+        (len(windows), *prices.shape), float("nan"), dtype=prices.dtype, device=prices.device
+    )
+    for index, window in enumerate(windows):
+        sums = padded[..., window:] - padded[..., :-window]
+        averages[index, :, window - 1 :] = (sums / window).to(prices.dtype)
+    return averages
+
+
+def crossover_signal_chunks(
+    prices: Tensor,
+    fast_windows: Sequence[int],
+    slow_windows: Sequence[int],
+    long_only: bool = False,
+    chunk_size: int | None = None,
+) -> Iterator[Tensor]:
+    """
+    Signals of a moving average crossover strategy for every (fast, slow) window pair: long when
+    the fast average is above the slow one, short (or flat when `long_only`) otherwise.
+
+    Args:
+        prices (Tensor): Close prices `[N, T]`.
+        fast_windows (Sequence[int]): The fast window lengths.
+        slow_windows (Sequence[int]): The slow window lengths.
+        long_only (bool): Stay flat instead of short.
+        chunk_size (int | None): Window pairs per chunk, see `backtest`.
+
+    Yields:
+        Tensor: The signals of `chunk_size` pairs `[p, N, T]`, pairs ordered fast-major, flat
+        until both averages are defined.
+    """
+    fast = moving_averages(prices, fast_windows)
+    slow = moving_averages(prices, slow_windows)
+    pairs = torch.cartesian_prod(
+        torch.arange(len(fast_windows)), torch.arange(len(slow_windows))
+    ).reshape(-1, 2)
+    chunk_size = chunk_size or max(1, CHUNK_ELEMENTS // prices.numel())
+    for chunk in pairs.split(chunk_size):
+        signals = torch.sign(fast[chunk[:, 0]] - slow[chunk[:, 1]]).nan_to_num_(0.0)
+        if long_only:
+            signals.clamp_(min=0)
+        yield signals
+
+
+def crossover_signals(
+    prices: Tensor,
+    fast_windows: Sequence[int],
+    slow_windows: Sequence[int],
+    long_only: bool = False,
+) -> Tensor:
+    """
+    All the signals of `crossover_signal_chunks` in a single `[F * S, N, T]` tensor.
+    """
+    return torch.cat(list(crossover_signal_chunks(prices, fast_windows, slow_windows, long_only)))
@@ -0,0 +1,343 @@
+"""
+torchtrader/features/build_features.py
+
+Persistent store of computed feature columns, so training and backtests stop recomputing every
+indicator from raw prices.
+
+Every feature is identified by the hash of its `FeatureSpec` (kind, parameters, source column
+and `FEATURE_VERSION`), and stored per (asset, timeframe, hash) next to the timestamps of its
+rows:
+
+```
+<root>/<asset_id>/<timeframe>/<name>-<hash>/manifest.json   spec, rows, last timestamp, state
+<root>/<asset_id>/<timeframe>/<name>-<hash>/timestamp.bin   int64 epoch milliseconds
+<root>/<asset_id>/<timeframe>/<name>-<hash>/<output>.bin    float64, one file per output
+```
+
+A refresh only reads the candles after the last stored one and computes them from the indicator
+state saved in the manifest (EMA values, trailing window of the prices), so appended values are
+the same as those of a full recomputation. Reads memory-map only the requested features.
+"""
+import hashlib
+import json
+import math
+import os
+from dataclasses import dataclass
+from dataclasses import field
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from torchtrader.config import get_section
+from torchtrader.data.database import DATA_DIR
+from torchtrader.data.timeseries import to_milliseconds
+from torchtrader.logs.logger import app_logger
+from torchtrader.metrics import indicator_seconds
+from torchtrader.profiling import profiled
+
+DEFAULT_FEATURES_ROOT = DATA_DIR / "processed" / "features"
+# Bump whenever the computation of a feature kind changes, stored features are then rebuilt
+FEATURE_VERSION = 1
+
+State = Dict[str, Any]
+
+
+def _ema_run(values: np.ndarray, alpha: float, last: float | None) -> Tuple[np.ndarray, float]:
+    # EMA seeded with the first value, like torchtrader.ta.ema.ExponentialMovingAverage
+    result = np.empty(len(values))
+    for index, value in enumerate(values.tolist()):
+        last = value if last is None else last + alpha * (value - last)
+        result[index] = last
+    return result, last
+
+
+def _trailing(state: State, values: np.ndarray) -> np.ndarray:
+    # The new values preceded by the last ones of the previous refresh
+    return np.concatenate([np.asarray(state.get("tail", []), dtype=np.float64), values])
+
+
+def _window_means(values: np.ndarray, window: int, n_new: int) -> np.ndarray:
+    # Mean of the window ending on each of the last n_new values, NaN while it is not full.
+    # Every mean only depends on its own window, so appended values match a full recomputation
+    result = np.full(n_new, math.nan)
+    if len(values) >= window:
+        means = sliding_window_view(values, window).mean(axis=-1)
+        count = min(n_new, len(means))
+        result[n_new - count :] = means[len(means) - count :]
+    return result
+
+
+def log_return(values: np.ndarray, state: State) -> Tuple[Dict[str, np.ndarray], State]:
+    extended = _trailing(state, values)
+    returns = np.full(len(values), math.nan)
+    changes = np.log(extended[1:] / extended[:-1])
+    returns[len(values) - len(changes) :] = changes
+    return {"value": returns}, {"tail": extended[-1:].tolist()}
+
+
+def sma(values: np.ndarray, state: State, window: int) -> Tuple[Dict[str, np.ndarray], State]:
+    extended = _trailing(state, values)
+    means = _window_means(extended, window, len(values))
+    return {"value": means}, {"tail": extended[len(extended) - (window - 1) :].tolist()}
+
+
+def ema(values: np.ndarray, state: State, period: float) -> Tuple[Dict[str, np.ndarray], State]:
+    averages, last = _ema_run(values, 2 / (period + 1), state.get("last"))
+    return {"value": averages}, {"last": last}
+
+
+def rsi(values: np.ndarray, state: State, window: int) -> Tuple[Dict[str, np.ndarray], State]:
+    # Simple averages of the gains and losses, as in torchtrader.ta.rsi.RSI
+    extended = _trailing(state, values)
+    changes = np.diff(extended)
+    gains = _window_means(np.where(changes > 0, changes, 0.0), window, len(values))
+    losses = _window_means(np.where(changes < 0, -changes, 0.0), window, len(values))
+    relative_strength = gains / (losses + 1e-10)
+    return {"value": 100 - 100 / (1 + relative_strength)}, {
+        "tail": extended[len(extended) - window :].tolist()
+    }
+
+
+def macd(
+    values: np.ndarray, state: State, fast: float, slow: float, signal: float
+) -> Tuple[Dict[str, np.ndarray], State]:
+    fast_ema, fast_last = _ema_run(values, 2 / (fast + 1), state.get("fast"))
+    slow_ema, slow_last = _ema_run(values, 2 / (slow + 1), state.get("slow"))
+    line = fast_ema - slow_ema
+    signal_line, signal_last = _ema_run(line, 2 / (signal + 1), state.get("signal"))
+    outputs = {"value": line, "signal": signal_line, "histogram": line - signal_line}
+    return outputs, {"fast": fast_last, "slow": slow_last, "signal": signal_last}
+
+
+# Incremental computation of every feature kind: (new source values, state, **params) to the new
+# values of every output and the state after them. A missing state means the series starts.
+FEATURE_KINDS: Dict[str, Callable[..., Tuple[Dict[str, np.ndarray], State]]] = {
+    "log_return": log_return,
+    "sma": sma,
+    "ema": ema,
+    "rsi": rsi,
+    "macd": macd,
+}
+OUTPUTS = {"macd": ("value", "signal", "histogram")}
+
+
+@dataclass(frozen=True)
+class FeatureSpec:
+    """
+    A feature: its kind in `FEATURE_KINDS`, parameters and the OHLCV column it is computed on.
+    """
+
+    kind: str
+    params: Dict[str, Any] = field(default_factory=dict, hash=False)
+    source: str = "close"
+
+    def __post_init__(self):
+        if self.kind not in FEATURE_KINDS:
+            raise ValueError(f"Unknown feature kind: {self.kind}")
+
+    @property
+    def name(self) -> str:
+        # Values in the order of their parameter names, whatever the order they were given in
+        values = "_".join(str(value) for _, value in sorted(self.params.items()))
+        return "_".join(part for part in (self.kind, values) if part)
+
+    @property
+    def outputs(self) -> Tuple[str, ...]:
+        return OUTPUTS.get(self.kind, ("value",))
+
+    @property
+    def columns(self) -> List[str]:
+        """
+        The names of the feature columns, e.g. "ema_12" or "macd_12_9_26_signal", the values of
+        the parameters sorted by name.
+        """
+        return [
+            self.name if output == "value" else f"{self.name}_{output}" for output in self.outputs
+        ]
+
+    @property
+    def key(self) -> str:
+        canonical = {
+            "kind": self.kind,
+            "params": self.params,
+            "source": self.source,
+            "version": FEATURE_VERSION,
+        }
+        digest = hashlib.sha1(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+        return f"{self.name}-{digest[:12]}"
+
+
+class FeatureStore:
+    """
+    Columnar store of feature columns per (asset, timeframe, feature spec), refreshed
+    incrementally from the candles of a `read_ohlcv` source.
+
+    Args:
+        root (str | Path | None): The store directory. Defaults to `features.root` in the
+            configuration, or `data/processed/features`.
+    """
+
+    def __init__(self, root: str | Path | None = None):
+        self.root = Path(root or get_section("features").get("root") or DEFAULT_FEATURES_ROOT)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def feature_dir(self, asset_id: int, timeframe: str, spec: FeatureSpec) -> Path:
+        return self.root / str(asset_id) / timeframe / spec.key
+
+    def read_manifest(self, asset_id: int, timeframe: str, spec: FeatureSpec) -> Dict[str, Any]:
+        manifest_path = self.feature_dir(asset_id, timeframe, spec) / "manifest.json"
+        if not manifest_path.is_file():
+            return {"kind": spec.kind, "params": spec.params, "source": spec.source, "rows": 0}
+        return json.loads(manifest_path.read_text())
+
+    @profiled("features")
+    def refresh(
+        self, source: Any, asset_id: int, timeframe: str, specs: Sequence[FeatureSpec]
+    ) -> int:
+        """
+        Compute and append the features of the candles stored since the last refresh.
+
+        Args:
+            source (Any): Anything with a `read_ohlcv(asset_id, timeframe, start)` method, e.g. a
+                `GenericDatabase` or a `ColumnarStore`.
+            asset_id (int): The asset.
+            timeframe (str): The candle timeframe, e.g. "1m".
+            specs (Sequence[FeatureSpec]): The features to refresh.
+
+        Returns:
+            int: The number of candles read from the source.
+        """
+        manifests = [self.read_manifest(asset_id, timeframe, spec) for spec in specs]
+        lasts = [manifest.get("last") for manifest in manifests]
+        # Read once from the oldest feature, a feature added later is built from the start
+        start = None if None in lasts else min(lasts) + 1
+        candles = source.read_ohlcv(asset_id, timeframe, start)
+        timestamps = np.asarray(candles["timestamp"], dtype=np.int64)
+
+        for spec, manifest in zip(specs, manifests):
+            new = slice(None) if manifest.get("last") is None else timestamps > manifest["last"]
+            new_timestamps = timestamps[new]
+            if not len(new_timestamps):
+                continue
+            values = np.asarray(candles[spec.source], dtype=np.float64)[new]
+            state = manifest.get("state") or {}
+            with indicator_seconds(spec.name).time():
+                outputs, state = FEATURE_KINDS[spec.kind](values, state, **spec.params)
+            self._append(asset_id, timeframe, spec, manifest, new_timestamps, outputs, state)
+
+        app_logger.info(
+            "Refreshed %s features of asset %s (%s) from %s candles",
+            len(specs),
+            asset_id,
+            timeframe,
+            len(timestamps),
+        )
+        return len(timestamps)
+
+    def _append(
+        self,
+        asset_id: int,
+        timeframe: str,
+        spec: FeatureSpec,
+        manifest: Dict[str, Any],
+        timestamps: np.ndarray,
+        outputs: Dict[str, np.ndarray],
+        state: State,
+    ) -> None:
+        feature_dir = self.feature_dir(asset_id, timeframe, spec)
+        feature_dir.mkdir(parents=True, exist_ok=True)
+        rows = manifest["rows"]
+        columns = {"timestamp": timestamps, **outputs}
+        for name, values in columns.items():
+            dtype = np.int64 if name == "timestamp" else np.float64
+            with open(feature_dir / f"{name}.bin", "ab") as column_file:
+                # Drop the tail of an append interrupted before its manifest was written
+                column_file.truncate(rows * np.dtype(dtype).itemsize)
+                column_file.write(values.astype(dtype, copy=False).tobytes())
+
+        manifest.update(
+            rows=rows + len(timestamps),
+            last=int(timestamps[-1]),
+            version=FEATURE_VERSION,
+            state=state,
+        )
+        tmp_path = feature_dir / "manifest.json.tmp"
+        tmp_path.write_text(json.dumps(manifest))
+        # Atomic swap, readers see either the old or the new rows
+        os.replace(tmp_path, feature_dir / "manifest.json")
+
+    def read(
+        self,
+        asset_id: int,
+        timeframe: str,
+        specs: Sequence[FeatureSpec],
+        start: Any = None,
+        end: Any = None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Read some features of an asset in the time range [start, end), as memory-mapped views.
+
+        Args:
+            asset_id (int): The asset.
+            timeframe (str): The candle timeframe.
+            specs (Sequence[FeatureSpec]): The features to read, only their files are opened.
+            start (Any): Inclusive lower bound, a datetime or epoch milliseconds.
+            end (Any): Exclusive upper bound, a datetime or epoch milliseconds.
+
+        Returns:
+            Dict[str, np.ndarray]: "timestamp" plus one array per column of every feature, see
+            `FeatureSpec.columns`, aligned on the rows all the features have.
+        """
+        start_ms = to_milliseconds(start) if start is not None else None
+        end_ms = to_milliseconds(end) if end is not None else None
+        result: Dict[str, np.ndarray] = {}
+        for spec in specs:
+            manifest = self.read_manifest(asset_id, timeframe, spec)
+            feature_dir = self.feature_dir(asset_id, timeframe, spec)
+            rows = manifest["rows"]
+            if not rows:
+                timestamps = np.empty(0, dtype=np.int64)
+                columns = {column: np.empty(0) for column in spec.columns}
+            else:
+                timestamps = np.memmap(
+                    feature_dir / "timestamp.bin", dtype=np.int64, mode="r", shape=(rows,)
+                )
+                columns = {
+                    column: np.memmap(
+                        feature_dir / f"{output}.bin", dtype=np.float64, mode="r", shape=(rows,)
+                    )
+                    for column, output in zip(spec.columns, spec.outputs)
+                }
+            begin, stop = 0, len(timestamps)
+            if start_ms is not None:
+                begin = np.searchsorted(timestamps, start_ms, "left")
+            if end_ms is not None:
+                stop = np.searchsorted(timestamps, end_ms, "left")
+            if "timestamp" not in result or stop - begin < len(result["timestamp"]):
+                result["timestamp"] = timestamps[begin:stop]
+            result.update({name: values[begin:stop] for name, values in columns.items()})
+        # Features refreshed at different times are cut to the rows they all have
+        n_rows = len(result.get("timestamp", ()))
+        return {name: values[:n_rows] for name, values in result.items()}
+
+    def matrix(
+        self,
+        asset_id: int,
+        timeframe: str,
+        specs: Sequence[FeatureSpec],
+        start: Any = None,
+        end: Any = None,
+    ) -> np.ndarray:
+        """
+        The columns of `read` without the timestamps as a `[T, F]` array, e.g. for
+        `torchtrader.data.make_dataset.save_features`.
+        """
+        columns = self.read(asset_id, timeframe, specs, start, end)
+        return np.stack([columns[name] for name in columns if name != "timestamp"], axis=1)
@@ -0,0 +1,481 @@
+"""
+torchtrader/fleet.py
+
+Long-running orchestrator of the fleet of bots defined in the `fleet` configuration.
+
+```
+exchange session -> market data feed -> bots of the symbol -> order intents -> risk -> ledger
+```
+
+All the bots of a fleet run in one `StrategyRuntime`, on one asyncio loop. Bots trading the same
+symbol and timeframe on the same exchange share one market data feed, and all the feeds of an
+exchange share one exchange session. Bots using a model share its checkpoint and its inference
+service. Orders are booked in a `PortfolioLedger` and the trade journal once filled.
+
+With `shard_by_exchange`, every exchange gets a worker process running its bots. Sending SIGHUP to
+the orchestrator reloads the fleet configuration: bots added to it are started, bots removed from
+it are stopped and changed ones are restarted, without stopping the others.
+"""
+import asyncio
+import importlib
+import inspect
+import math
+import multiprocessing
+import os
+import signal
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import AsyncIterator
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Set
+
+from torchtrader.config import get_section
+from torchtrader.config import load_config
+from torchtrader.logs.logger import app_logger
+from torchtrader.portfolio import PortfolioLedger
+from torchtrader.portfolio import SIDES
+from torchtrader.runtime import OrderIntent
+from torchtrader.runtime import StrategyRuntime
+from torchtrader.utils import timeframe_to_seconds
+
+
+@dataclass
+class BotSpec:
+    """
+    A bot of the fleet configuration.
+
+    Strategies are built with `params` as keyword arguments, plus `service`, the shared
+    `InferenceService` of the model, when the bot has a `model`.
+    """
+
+    name: str
+    symbol: str
+    strategy: str
+    exchange: str = "binance"
+    timeframe: str = "1m"
+    params: Dict[str, Any] = field(default_factory=dict)
+    cash: float | None = None
+    asset_type: str = "crypto"
+    model: str | None = None
+    model_factory: str | None = None
+
+
+def load_fleet(path: str | None = None, exchange: str | None = None) -> List[BotSpec]:
+    """
+    The bots of the `fleet` configuration.
+
+    Args:
+        path (str | None): The YAML file to load, see `load_config`.
+        exchange (str | None): Only the bots trading on this exchange.
+    """
+    specs = [BotSpec(**entry) for entry in get_section("fleet", path).get("bots") or []]
+    names = [spec.name for spec in specs]
+    if len(set(names)) < len(names):
+        raise ValueError("Bot names of the fleet must be unique")
+    return [spec for spec in specs if exchange is None or spec.exchange == exchange]
+
+
+def import_object(path: str) -> Any:
+    """
+    The object at an import path, "package.module:name" or "package.module.name".
+    """
+    module, _, name = path.rpartition(":") if ":" in path else path.rpartition(".")
+    return getattr(importlib.import_module(module), name)
+
+
+def asset_key(exchange: str, symbol: str) -> str:
+    """
+    The asset of a symbol in the ledger, e.g. "binance:BTC/USDT".
+    """
+    return f"{exchange}:{symbol}"
+
+
+@dataclass
+class Feed:
+    """
+    The bars of a symbol polled once for all its subscribers.
+    """
+
+    subscribers: Set[asyncio.Queue] = field(default_factory=set)
+    task: asyncio.Task | None = None
+    last_timestamp: int = -1
+
+
+class MarketDataHub:
+    """
+    Exchange sessions and bar feeds shared by the bots of a process.
+
+    Args:
+        poll_interval (float | None): Seconds between two polls of a feed, a tenth of the
+            timeframe by default.
+        on_bar (Callable[[str, str, tuple], Any] | None): Called with the exchange, the symbol
+            and every bar, once per feed.
+    """
+
+    def __init__(
+        self,
+        poll_interval: float | None = None,
+        on_bar: Callable[[str, str, tuple], Any] | None = None,
+    ):
+        self.poll_interval = poll_interval
+        self.on_bar = on_bar
+        self.feeds: Dict[tuple, Feed] = {}
+        self._exchanges: Dict[str, Any] = {}
+        self._lock = asyncio.Lock()
+        self._stack = AsyncExitStack()
+
+    def add_exchange(self, market: str, exchange: Any) -> None:
+        """
+        Share an exchange session opened elsewhere, e.g. a ccxt exchange or a test double.
+        """
+        self._exchanges[market] = exchange
+
+    async def exchange(self, market: str) -> Any:
+        """
+        The session of an exchange, opened on first use and closed by `close`.
+        """
+        async with self._lock:
+            if market not in self._exchanges:
+                from torchtrader.data.collection import MarketData
+
+                market_data = MarketData(market)
+                await self._stack.enter_async_context(market_data.setup_exchange())
+                self._exchanges[market] = market_data.exchange
+                app_logger.info("Opened exchange session of %s", market)
+        return self._exchanges[market]
+
+    async def subscribe(self, market: str, symbol: str, timeframe: str) -> AsyncIterator:
+        """
+        Bar source of a symbol for `StrategyRuntime.add_bot`, emitting every bar once closed.
+        The feed is polled while it has subscribers.
+        """
+        key = (market, symbol, timeframe)
+        feed = self.feeds.get(key)
+        if feed is None:
+            feed = self.feeds[key] = Feed()
+            feed.task = asyncio.create_task(self._poll(key, feed))
+        queue: asyncio.Queue = asyncio.Queue()
+        feed.subscribers.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            feed.subscribers.discard(queue)
+            if not feed.subscribers and self.feeds.get(key) is feed:
+                feed.task.cancel()
+                del self.feeds[key]
+
+    async def _poll(self, key: tuple, feed: Feed) -> None:
+        from torchtrader.data.collection import CANDLES_FETCHED
+        from torchtrader.data.collection import FETCH_SECONDS
+
+        market, symbol, timeframe = key
+        exchange = await self.exchange(market)
+        interval = self.poll_interval or timeframe_to_seconds(timeframe) / 10
+        while True:
+            try:
+                with FETCH_SECONDS.time():
+                    candles = await exchange.fetch_ohlcv(symbol, timeframe, limit=2)
+            except Exception as e:
+                app_logger.warning("Polling %s %s on %s failed: %s", symbol, timeframe, market, e)
+                candles = []
+            CANDLES_FETCHED.inc(len(candles))
+            # The last candle is still open
+            for candle in candles[:-1]:
+                if candle[0] > feed.last_timestamp:
+                    feed.last_timestamp = candle[0]
+                    bar = tuple(candle[:6])
+                    if self.on_bar is not None:
+                        self.on_bar(market, symbol, bar)
+                    for queue in feed.subscribers:
+                        queue.put_nowait(bar)
+            await asyncio.sleep(interval)
+
+    async def close(self) -> None:
+        """
+        Stop the feeds and close the exchange sessions.
+        """
+        for feed in self.feeds.values():
+            feed.task.cancel()
+        self.feeds.clear()
+        await self._stack.aclose()
+
+
+class Fleet:
+    """
+    Run bots on one asyncio loop, with shared market data, models and portfolio ledger.
+
+    Args:
+        specs (Sequence[BotSpec]): The bots started by `run`.
+        exchange (str | None): The exchange of a shard, whose bots only are loaded on reload.
+        runtime (StrategyRuntime | None): Runs the bots, see the `runtime` configuration.
+        hub (MarketDataHub | None): Feeds the bots, see the `fleet.poll_interval` option.
+        ledger (PortfolioLedger | None): Books the fills, see the `portfolio` configuration.
+        journal (Any): The trade journal of the fills, the process-wide one by default.
+        execute (Callable[[OrderIntent], Any] | None): Places the order of an intent and returns
+            its fill price, None when not filled. May be a coroutine function. Defaults to paper
+            trading at the price of the intent.
+    """
+
+    def __init__(
+        self,
+        specs: Sequence[BotSpec] = (),
+        exchange: str | None = None,
+        runtime: StrategyRuntime | None = None,
+        hub: MarketDataHub | None = None,
+        ledger: PortfolioLedger | None = None,
+        journal: Any = None,
+        execute: Callable[[OrderIntent], Any] | None = None,
+    ):
+        self.config = get_section("fleet")
+        self.exchange = exchange
+        self.runtime = runtime or StrategyRuntime()
+        self.runtime.on_intent = self.on_intent
+        self.hub = hub or MarketDataHub(self.config.get("poll_interval"))
+        self.hub.on_bar = self.on_bar
+        self.ledger = ledger or PortfolioLedger()
+        self.journal = journal
+        self.execute = execute or (lambda intent: intent.price)
+        self.specs: Dict[str, BotSpec] = {}
+        self.services: Dict[tuple, Any] = {}
+        self._initial = list(specs)
+        self._registry = None
+        self._reload_lock = asyncio.Lock()
+        self._reloads: Set[asyncio.Task] = set()
+
+    async def add(self, spec: BotSpec) -> None:
+        """
+        Start a bot, on the running fleet or when it starts.
+        """
+        if spec.name in self.specs:
+            raise ValueError(f"Bot {spec.name} already exists")
+        params = dict(spec.params)
+        if spec.model is not None:
+            params["service"] = await self._service(spec)
+        strategy = import_object(spec.strategy)(**params)
+        self.ledger.add_bot(spec.name, spec.cash)
+        self.ledger.add_asset(asset_key(spec.exchange, spec.symbol))
+        source = self.hub.subscribe(spec.exchange, spec.symbol, spec.timeframe)
+        self.runtime.add_bot(spec.name, spec.symbol, strategy, source)
+        self.specs[spec.name] = spec
+        app_logger.info("Started bot %s on %s %s", spec.name, spec.exchange, spec.symbol)
+
+    def remove(self, name: str) -> None:
+        """
+        Stop a bot. Its positions stay booked in the ledger.
+        """
+        self.runtime.remove_bot(name)
+        del self.specs[name]
+        app_logger.info("Stopped bot %s", name)
+
+    async def reload(self, specs: Sequence[BotSpec] | None = None) -> None:
+        """
+        Apply a new fleet definition, the `fleet` configuration re-read by default: start the new
+        bots, stop the removed ones and restart the changed ones. The inference services no bot
+        uses any more are stopped. Reloads run one at a time.
+        """
+        async with self._reload_lock:
+            if specs is None:
+                load_config.cache_clear()
+                specs = load_fleet(exchange=self.exchange)
+            wanted = {spec.name: spec for spec in specs}
+            for name, spec in list(self.specs.items()):
+                if wanted.get(name) != spec:
+                    self.remove(name)
+            for name, spec in wanted.items():
+                if name not in self.specs:
+                    await self.add(spec)
+            used = {(spec.model, spec.model_factory) for spec in self.specs.values()}
+            for key in [key for key in self.services if key not in used]:
+                await self.services.pop(key).stop()
+                app_logger.info("Stopped the inference service of %s", key[0])
+            app_logger.info("Fleet reloaded, %d bots running", len(self.specs))
+
+    def _reload_on_signal(self) -> None:
+        # Signal handlers cannot await: run the reload as a task, logging its errors
+        async def reload() -> None:
+            try:
+                await self.reload()
+            except Exception as e:
+                app_logger.error("Fleet reload failed: %s", e)
+
+        task = asyncio.ensure_future(reload())
+        self._reloads.add(task)
+        task.add_done_callback(self._reloads.discard)
+
+    async def _service(self, spec: BotSpec) -> Any:
+        # One model and one inference service per checkpoint, shared by its bots
+        key = (spec.model, spec.model_factory)
+        if key not in self.services:
+            from torchtrader.models.predict_model import InferenceService
+            from torchtrader.models.registry import CheckpointRegistry
+
+            if self._registry is None:
+                self._registry = CheckpointRegistry()
+            model = self._registry.load(spec.model, import_object(spec.model_factory))
+            service = InferenceService(model, name=spec.model, **self.config.get("inference", {}))
+            await service.start()
+            self.services[key] = service
+        return self.services[key]
+
+    def on_bar(self, exchange: str, symbol: str, bar: tuple) -> None:
+        """
+        Mark the ledger to market with the close of every new bar.
+        """
+        self.ledger.mark({asset_key(exchange, symbol): bar[4]})
+
+    async def on_intent(self, intent: OrderIntent) -> None:
+        """
+        Check an order intent against the risk limits of its bot, execute it and book the fill.
+        """
+        spec = self.specs.get(intent.bot)
+        if spec is None:
+            return
+        asset = asset_key(spec.exchange, intent.symbol)
+        row = self.ledger.bots[intent.bot]
+        report = self.ledger.check_risk()
+        position = float(self.ledger.position[row, self.ledger.assets[asset]])
+        increasing = position * SIDES[intent.side] >= 0
+        if report.drawdown[row] or (report.exposure[row] and increasing):
+            app_logger.warning(
+                "Order intent of %s over its risk limits dropped: %s %s %s",
+                intent.bot,
+                intent.side,
+                intent.quantity,
+                intent.symbol,
+            )
+            return
+
+        if not math.isfinite(intent.price):
+            # Intents without a price are priced at the last close of their bot
+            intent.price = self.runtime.bots[intent.bot].bars.last("close")
+        price = self.execute(intent)
+        if inspect.isawaitable(price):
+            price = await price
+        if price is None:
+            return
+        if not math.isfinite(price):
+            app_logger.warning("Order intent of %s without a valid fill price dropped", intent.bot)
+            return
+        self.ledger.fill(intent.bot, asset, intent.side, intent.quantity, price)
+        journal = self.journal
+        if journal is None:
+            from torchtrader.logs.journal import trade_journal
+
+            journal = trade_journal()
+        journal.append(intent.symbol, intent.side, intent.quantity, price, spec.asset_type)
+
+    async def run(self, stop_event: asyncio.Event | None = None, handle_signals: bool = True):
+        """
+        Run the fleet until `stop_event` is set.
+
+        Args:
+            stop_event (asyncio.Event | None): Stops the fleet once set.
+            handle_signals (bool): Stop on SIGINT and SIGTERM and reload the fleet configuration
+                on SIGHUP. Only on POSIX systems, from the main thread.
+        """
+        stop_event = stop_event or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        signals = []
+        if handle_signals and hasattr(signal, "SIGHUP"):
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signum, stop_event.set)
+            loop.add_signal_handler(signal.SIGHUP, self._reload_on_signal)
+            signals = [signal.SIGINT, signal.SIGTERM, signal.SIGHUP]
+
+        try:
+            for spec in self._initial:
+                await self.add(spec)
+            app_logger.info("Fleet running %d bots", len(self.specs))
+            await self.runtime.run(stop_event, persistent=True)
+        finally:
+            for signum in signals:
+                loop.remove_signal_handler(signum)
+            for service in self.services.values():
+                await service.stop()
+            await self.hub.close()
+            for name in self.specs:
+                app_logger.info("Bot %s: %s", name, self.ledger.summary(name))
+
+
+def _run_shard(exchange: str | None, profile: str | None = None) -> None:
+    profiler = None
+    if profile:
+        from torchtrader.profiling import enable_profiling
+
+        profiler = enable_profiling(mode=profile)
+        if hasattr(signal, "SIGUSR1"):
+            profiler.install_signal_handler()
+    try:
+        asyncio.run(Fleet(load_fleet(exchange=exchange), exchange=exchange).run())
+    finally:
+        if profiler is not None:
+            profiler.close()
+
+
+def run_fleet(shard_by_exchange: bool | None = None, profile: str | None = None) -> None:
+    """
+    Run the fleet of the configuration until SIGINT or SIGTERM.
+
+    Args:
+        shard_by_exchange (bool | None): Run the bots of every exchange in their own worker
+            process, `fleet.shard_by_exchange` by default.
+        profile (str | None): Profile every process with this `StageProfiler` mode. Their
+            stacks can then be sampled live with SIGUSR1.
+    """
+    if shard_by_exchange is None:
+        shard_by_exchange = get_section("fleet").get("shard_by_exchange", False)
+    if not shard_by_exchange:
+        _run_shard(None, profile)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    shards: Dict[str, multiprocessing.Process] = {}
+    stopping = False
+
+    def start_shards() -> None:
+        for exchange in sorted({spec.exchange for spec in load_fleet()} - set(shards)):
+            shard = context.Process(
+                target=_run_shard, args=(exchange, profile), name=f"fleet-{exchange}"
+            )
+            shard.start()
+            shards[exchange] = shard
+            app_logger.info("Started shard %s, pid %s", exchange, shard.pid)
+
+    def signal_shards(signum: int) -> None:
+        # Dead shards are forgotten, a reload starts them again
+        for exchange, shard in list(shards.items()):
+            if not shard.is_alive():
+                app_logger.warning("Shard %s exited with code %s", exchange, shard.exitcode)
+                del shards[exchange]
+                continue
+            try:
+                os.kill(shard.pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def reload(*_) -> None:
+        load_config.cache_clear()
+        signal_shards(signal.SIGHUP)
+        start_shards()
+
+    def stop(*_) -> None:
+        nonlocal stopping
+        stopping = True
+        signal_shards(signal.SIGTERM)
+
+    start_shards()
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, reload)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    while not stopping and any(shard.is_alive() for shard in shards.values()):
+        time.sleep(0.5)
+    for shard in shards.values():
+        shard.join()
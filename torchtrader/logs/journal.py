@@ -0,0 +1,288 @@
+"""
+torchtrader/logs/journal.py
+
+Append-only binary journal of the executed trades, the audit record used for P&L reconstruction
+and replay.
+
+Layout of a journal file:
+
+```
+header   64 bytes   magic, version, record size, committed record count
+records  48 bytes   timestamp_ns, symbol, quantity, price, asset_type, side, crc32
+```
+
+Records are written into a memory-mapped, pre-allocated file. The header count is only updated
+on flush, every `flush_every` records or `flush_interval` seconds. After a crash, the records
+past the header count are kept as long as their checksum is valid, and the torn tail after them
+is discarded.
+
+Several processes can append to the same journal, e.g. the shards of a fleet: every append and
+flush holds an exclusive `flock` on the file and picks up the records of the other writers first.
+"""
+import atexit
+import fcntl
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+from torchtrader.config import get_section
+from torchtrader.config import PROJECT_DIR
+
+MAGIC = b"TTJRNL01"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQ")
+HEADER_SIZE = 64
+RECORD = struct.Struct("<q16sddBb2xI")
+# Same layout as RECORD, used to read a whole journal at once
+RECORD_DTYPE = np.dtype(
+    [
+        ("timestamp_ns", "<i8"),
+        ("symbol", "S16"),
+        ("quantity", "<f8"),
+        ("price", "<f8"),
+        ("asset_type", "u1"),
+        ("side", "i1"),
+        ("padding", "V2"),
+        ("crc", "<u4"),
+    ]
+)
+ASSET_TYPES = ("stock", "crypto")
+SIDES = {"buy": 1, "sell": -1}
+DEFAULT_JOURNAL_PATH = PROJECT_DIR / "logs" / "trades.journal"
+
+
+def _checksum(record: bytes) -> int:
+    # CRC of everything but the trailing checksum field
+    return zlib.crc32(record[: RECORD.size - 4])
+
+
+def _valid_records(buffer, start: int, capacity: int) -> int:
+    # Count the records with a valid checksum from `start`, i.e. written but not yet committed
+    count = start
+    while count < capacity:
+        offset = HEADER_SIZE + count * RECORD.size
+        record = bytes(buffer[offset : offset + RECORD.size])
+        if record == bytes(RECORD.size) or _checksum(record) != RECORD.unpack(record)[-1]:
+            break
+        count += 1
+    return count
+
+
+def _read_header(header: bytes, path: Path) -> int:
+    magic, version, record_size, count = HEADER.unpack_from(header)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a version {VERSION} trade journal")
+    return count
+
+
+class TradeJournal:
+    """
+    Memory-mapped append-only writer of a trade journal.
+
+    Args:
+        path (str | Path | None): The journal file, created if missing. Defaults to
+            `journal.path` in the configuration, or `logs/trades.journal`.
+        flush_every (int): Records appended between two flushes.
+        flush_interval (float): Maximum seconds between two flushes.
+        chunk_records (int): Records the file grows by when it is full.
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        flush_every: int = 1024,
+        flush_interval: float = 1.0,
+        chunk_records: int = 65_536,
+    ):
+        self.path = Path(path or get_section("journal").get("path") or DEFAULT_JOURNAL_PATH)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.chunk_records = chunk_records
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Created without truncating, another process may be opening the same journal
+        self._file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._file.fileno()).st_size < HEADER_SIZE:
+                self._file.truncate(0)
+                self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, 0))
+                self._file.truncate(HEADER_SIZE + chunk_records * RECORD.size)
+                self._file.flush()
+
+            self._map = mmap.mmap(self._file.fileno(), 0)
+            self.capacity = (len(self._map) - HEADER_SIZE) // RECORD.size
+            committed = _read_header(self._map[:HEADER_SIZE], self.path)
+            self.count = _valid_records(self._map, committed, self.capacity)
+            # Discard the torn tail left by a crash, records after it are not trustworthy either
+            tail = HEADER_SIZE + self.count * RECORD.size
+            self._map[tail:] = bytes(len(self._map) - tail)
+            self._flushed = self.count
+            self._flushed_at = time.monotonic()
+            self._flush()
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "TradeJournal":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def append(
+        self,
+        symbol: str,
+        side: str,
+        quantity: float,
+        price: float = math.nan,
+        asset_type: str = "crypto",
+        timestamp_ns: int | None = None,
+    ) -> int:
+        """
+        Append a trade to the journal.
+
+        Args:
+            symbol (str): The traded symbol, at most 16 bytes once UTF-8 encoded.
+            side (str): "buy" or "sell".
+            quantity (float): The traded quantity.
+            price (float): The execution price, NaN when unknown.
+            asset_type (str): "stock" or "crypto".
+            timestamp_ns (int | None): Epoch nanoseconds of the trade. Defaults to now.
+
+        Returns:
+            int: The index of the record in the journal.
+        """
+        encoded_symbol = symbol.encode()
+        if len(encoded_symbol) > 16:
+            raise ValueError(f"Symbol too long for the trade journal: {symbol}")
+        record = bytearray(
+            RECORD.pack(
+                time.time_ns() if timestamp_ns is None else timestamp_ns,
+                encoded_symbol,
+                quantity,
+                price,
+                ASSET_TYPES.index(asset_type),
+                SIDES[side],
+                0,
+            )
+        )
+        struct.pack_into("<I", record, RECORD.size - 4, _checksum(record))
+
+        with self._lock, self._file_lock():
+            if self.count == self.capacity:
+                self._grow()
+            offset = HEADER_SIZE + self.count * RECORD.size
+            self._map[offset : offset + RECORD.size] = record
+            index = self.count
+            self.count += 1
+            if (
+                self.count - self._flushed >= self.flush_every
+                or time.monotonic() - self._flushed_at >= self.flush_interval
+            ):
+                self._flush()
+        return index
+
+    def flush(self) -> None:
+        """
+        Commit the appended records: sync them to disk, then update the header count.
+        """
+        with self._lock, self._file_lock():
+            self._flush()
+
+    @contextmanager
+    def _file_lock(self):
+        # Excludes the other processes appending to the journal, and picks up their records
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            self._sync()
+            yield
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def _sync(self) -> None:
+        if os.fstat(self._file.fileno()).st_size > len(self._map):
+            self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0)
+            self.capacity = (len(self._map) - HEADER_SIZE) // RECORD.size
+        committed = _read_header(self._map[:HEADER_SIZE], self.path)
+        self.count = _valid_records(self._map, max(self.count, committed), self.capacity)
+
+    def _flush(self) -> None:
+        self._map.flush()
+        self._map[:HEADER_SIZE] = HEADER.pack(MAGIC, VERSION, RECORD.size, self.count).ljust(
+            HEADER_SIZE, b"\0"
+        )
+        self._map.flush(0, HEADER_SIZE)
+        self._flushed = self.count
+        self._flushed_at = time.monotonic()
+
+    def _grow(self) -> None:
+        self._flush()
+        self._map.close()
+        self.capacity += self.chunk_records
+        self._file.truncate(HEADER_SIZE + self.capacity * RECORD.size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map.closed:
+                return
+            with self._file_lock():
+                self._flush()
+                self._map.close()
+            self._file.close()
+
+
+def read_journal(path: str | Path | None = None) -> Dict[str, np.ndarray]:
+    """
+    Load a whole trade journal into column arrays, including the valid records not yet
+    committed by the writer.
+
+    Args:
+        path (str | Path | None): The journal file, see `TradeJournal`.
+
+    Returns:
+        Dict[str, np.ndarray]: "timestamp_ns", "symbol" (str), "quantity", "price",
+        "asset_type" (index in `ASSET_TYPES`) and "side" (+1 buy, -1 sell).
+    """
+    path = Path(path or get_section("journal").get("path") or DEFAULT_JOURNAL_PATH)
+    data = np.fromfile(path, dtype=np.uint8)
+    committed = _read_header(data[:HEADER_SIZE].tobytes(), path)
+    capacity = (len(data) - HEADER_SIZE) // RECORD.size
+    count = _valid_records(data, committed, capacity)
+
+    records = data[HEADER_SIZE : HEADER_SIZE + count * RECORD.size].view(RECORD_DTYPE)
+    columns = {name: records[name].copy() for name in ("timestamp_ns", "quantity", "price")}
+    columns["symbol"] = np.char.decode(records["symbol"])
+    columns["asset_type"] = records["asset_type"].copy()
+    columns["side"] = records["side"].copy()
+    return columns
+
+
+@lru_cache(maxsize=None)
+def trade_journal() -> TradeJournal:
+    """
+    The process-wide trade journal configured by the `journal` section, closed at exit.
+    """
+    config = get_section("journal")
+    journal = TradeJournal(
+        config.get("path"),
+        flush_every=config.get("flush_every", 1024),
+        flush_interval=config.get("flush_interval", 1.0),
+    )
+    atexit.register(journal.close)
+    return journal
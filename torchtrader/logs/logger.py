@@ -5,35 +5,135 @@ Torchtrader Logging Module
 
 This module sets up loggers for different parts of the Torchtrader app. The loggers can
 be imported and used in other modules to log messages with different levels of severity.
+
+Logging never blocks the caller on I/O: loggers only put records on a queue, and a background
+listener thread formats them and writes them to the console and to rotating log files. Records
+are formatted in the listener, so pass arguments %-style (`logger.info("Read %s rows", n)`) and
+do not mutate them after the call.
 """
+import atexit
 import logging
 import pathlib
+import queue
+import threading
+from logging.handlers import QueueHandler
+from logging.handlers import QueueListener
+from logging.handlers import RotatingFileHandler
+from typing import Dict
+from typing import Tuple
 
 import colorlog
 
+from torchtrader.config import get_section
+
+# Listeners of the loggers set up so far, stopped at exit to flush the queued records
+_listeners: Dict[str, QueueListener] = {}
+
+
+class LazyFileHandler(RotatingFileHandler):
+    """
+    Rotating file handler that creates its directory and opens the log file on the first record,
+    so importing the loggers costs no file system access.
+    """
+
+    def __init__(self, filename: pathlib.Path, max_bytes: int = 0, backup_count: int = 0):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+
+    def _open(self):
+        pathlib.Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
 
-def setup_logger(logger_name: str, log_file: str, level: int = logging.INFO) -> logging.Logger:
+class ThreadQueueHandler(QueueHandler):
+    """
+    Queue handler for a listener running in the same process: records are queued untouched, so
+    their message is only formatted in the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limit the records of every call site (file and line) to a token bucket of `burst` records
+    refilled at `rate` records per second. Suppressed records are counted and reported on the
+    next record let through.
+
+    A call site can also sample its records with `extra={"sample": n}`, letting only one of
+    every n through before the rate limit applies.
+
+    Args:
+        rate (float): Records per second allowed per call site once the burst is spent.
+        burst (int): Records a call site may log in a row.
+        max_level (int): Records above this level, e.g. warnings and errors, are never dropped.
+    """
+
+    def __init__(self, rate: float = 10.0, burst: int = 100, max_level: int = logging.INFO):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_level = max_level
+        # Call site -> [tokens, last record time, suppressed records, sampled records]
+        self._sites: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        site = (record.pathname, record.lineno)
+        sample = getattr(record, "sample", 1)
+        with self._lock:
+            state = self._sites.get(site)
+            if state is None:
+                state = self._sites[site] = [float(self.burst), record.created, 0, 0]
+            state[3] += 1
+            if (state[3] - 1) % sample:
+                state[2] += 1
+                return False
+            tokens = min(self.burst, state[0] + (record.created - state[1]) * self.rate)
+            state[1] = record.created
+            if tokens < 1:
+                state[0] = tokens
+                state[2] += 1
+                return False
+            state[0] = tokens - 1
+            suppressed, state[2] = state[2], 0
+
+        if suppressed > 0:
+            # Format the message now, it may hold a literal % or take a mapping as arguments
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = ()
+        return True
+
+
+def setup_logger(
+    logger_name: str, log_file: str, level: int = logging.INFO, propagate: bool | None = None
+) -> logging.Logger:
     """
     Set up a logger with the specified name, log file, and log level.
 
+    The logger gets a single queue handler, rate limited per call site, and the console and file
+    handlers run in a background `QueueListener`. The `logging` section of the configuration
+    sets `max_bytes` and `backup_count` of the rotating log files, the `rate_limit`
+    (`rate`, `burst`) of the call sites and `propagate`.
+
     Args:
         logger_name (str): The name of the logger.
         log_file (str): The file path where the logger should store logs.
         level (int, optional): The log level. Defaults to logging.INFO.
+        propagate (bool | None): Also pass the records to the handlers of the parent loggers,
+            e.g. of the root logger set up by an application or by pytest's caplog. Defaults to
+            `logging.propagate`, on unless configured.
 
     Returns:
         logging.Logger: The configured logger instance.
     """
+    config = get_section("logging")
 
-    # Get the absolute path of the 'torchtrader' folder
+    # Get the absolute path of the log file in the 'logs' folder of the project
     base_dir = pathlib.Path(__file__).resolve().parent.parent.parent
-
-    # Create the 'logs' folder if it does not exist
-    logs_dir = base_dir / "logs"
-    logs_dir.mkdir(exist_ok=True)
-
-    # Get the absolute path of the log file
-    log_file_path = logs_dir / log_file
+    log_file_path = base_dir / "logs" / log_file
 
     # Define log colors based on severity
     log_colors = {
@@ -46,9 +146,19 @@ def setup_logger(logger_name: str, log_file: str, level: int = logging.INFO) ->
 
     logger = logging.getLogger(logger_name)
     logger.setLevel(level)
-
-    # Create a file handler
-    file_handler = logging.FileHandler(log_file_path)
+    logger.propagate = config.get("propagate", True) if propagate is None else propagate
+
+    # Setting a logger up again replaces its handler and listener
+    for handler in [h for h in logger.handlers if isinstance(h, ThreadQueueHandler)]:
+        logger.removeHandler(handler)
+    stop_logging(logger_name)
+
+    # Create a rotating file handler, opened on the first record
+    file_handler = LazyFileHandler(
+        log_file_path,
+        max_bytes=config.get("max_bytes", 10 * 1024 * 1024),
+        backup_count=config.get("backup_count", 5),
+    )
     file_handler.setLevel(level)
 
     # Create a console handler
@@ -69,13 +179,37 @@ def setup_logger(logger_name: str, log_file: str, level: int = logging.INFO) ->
     file_formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
     file_handler.setFormatter(file_formatter)
 
-    # Add the handlers to the logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # The logger only enqueues records, the listener thread does the formatting and the I/O
+    log_queue = queue.SimpleQueue()
+    queue_handler = ThreadQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(**config.get("rate_limit", {})))
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    _listeners[logger_name] = listener
 
     return logger
 
 
+def stop_logging(logger_name: str | None = None) -> None:
+    """
+    Write the queued records and stop the listener threads. Called automatically at exit.
+
+    Args:
+        logger_name (str | None): Only stop the listener of this logger. Defaults to all.
+    """
+    names = list(_listeners) if logger_name is None else [logger_name]
+    for name in names:
+        listener = _listeners.pop(name, None)
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+
+
+atexit.register(stop_logging)
+
 # Set up loggers for different modules
 app_logger = setup_logger("torchtrader", "torchtrader.log", logging.INFO)
 trade_logger = setup_logger("torchtrader.trade", "torchtrader_trade.log", logging.DEBUG)
@@ -0,0 +1,382 @@
+"""
+torchtrader/metrics.py
+
+In-process metrics of the hot paths: counters, gauges and fixed-bucket latency histograms,
+exported in the Prometheus text format over a local HTTP endpoint or dumped to a file.
+
+Metrics are off unless `metrics.enabled` is set in the configuration (or `REGISTRY.enabled` is
+set at runtime). While disabled, every update returns after a single attribute check and `timed`
+calls the wrapped function directly.
+
+Metrics are created once, usually at module level, and updated on the hot path:
+
+```python
+FETCH_SECONDS = REGISTRY.histogram("torchtrader_exchange_fetch_seconds", "Exchange fetch latency")
+
+with FETCH_SECONDS.time():
+    data = await exchange.fetch_ohlcv(symbol, timeframe)
+```
+"""
+import abc
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+from torchtrader.config import get_section
+from torchtrader.logs.logger import app_logger
+
+# Upper bounds in seconds, from 50 µs to 10 s
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _escape(value: Any) -> str:
+    # Label values escape backslashes, double quotes and newlines in the text format
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric(abc.ABC):
+    """
+    Base of the metric types: a name, a help text, fixed label values and a lock.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labels: Dict[str, str]):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def label_text(self, extra: Dict[str, str] | None = None) -> str:
+        labels = {**self.labels, **(extra or {})}
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+    @abc.abstractmethod
+    def samples(self) -> List[Tuple[str, float]]:
+        """
+        The `(name{labels}, value)` lines of the metric in the text format.
+        """
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count, e.g. of inserted rows.
+    """
+
+    kind = "counter"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+    def samples(self) -> List[Tuple[str, float]]:
+        return [(f"{self.name}{self.label_text()}", self.value)]
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, e.g. the number of buffered candles.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        if self.registry.enabled:
+            self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def samples(self) -> List[Tuple[str, float]]:
+        return [(f"{self.name}{self.label_text()}", self.value)]
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, e.g. latencies in seconds, over fixed buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(*args)
+        self.buckets = tuple(buckets)
+        # One count per bucket plus the +Inf one
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        if not self.registry.enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        """
+        Context manager observing the seconds spent in its block.
+        """
+        return _Timer(self)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def samples(self) -> List[Tuple[str, float]]:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        samples, cumulative = [], 0
+        for bound, count in zip((*self.buckets, "+Inf"), counts):
+            cumulative += count
+            samples.append((f"{self.name}_bucket{self.label_text({'le': str(bound)})}", cumulative))
+        samples.append((f"{self.name}_sum{self.label_text()}", total))
+        samples.append((f"{self.name}_count{self.label_text()}", cumulative))
+        return samples
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.start = 0
+
+    def __enter__(self) -> "_Timer":
+        if self.histogram.registry.enabled:
+            self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.start:
+            self.histogram.observe((time.perf_counter_ns() - self.start) / 1e9)
+
+
+class MetricsRegistry:
+    """
+    The metrics of the process, created on first use and looked up by name and labels.
+
+    Args:
+        enabled (bool | None): Whether updates are recorded. Defaults to `metrics.enabled` in
+            the configuration.
+    """
+
+    def __init__(self, enabled: bool | None = None):
+        if enabled is None:
+            enabled = bool(get_section("metrics").get("enabled", False))
+        self.enabled = enabled
+        self._metrics: Dict[Tuple[str, Tuple], Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, metric_class: type, name: str, help: str, labels: Dict[str, str], **options):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = metric_class(self, name, help, labels, **options)
+        if not isinstance(metric, metric_class):
+            raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+        return metric
+
+    def counter(self, name: str, help: str = "", **labels: str) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str = "", **labels: str) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(
+        self, name: str, help: str = "", buckets: Sequence[float] = LATENCY_BUCKETS, **labels: str
+    ) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self) -> str:
+        """
+        Render all the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines, described = [], set()
+        for metric in metrics:
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{sample} {value:g}" for sample, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def timed(histogram: Histogram) -> Callable:
+    """
+    Decorator observing the duration of every call of a function or coroutine function.
+
+    Args:
+        histogram (Histogram): The histogram receiving the durations in seconds.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if not histogram.registry.enabled:
+                    return await function(*args, **kwargs)
+                with histogram.time():
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not histogram.registry.enabled:
+                return function(*args, **kwargs)
+            with histogram.time():
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def indicator_seconds(indicator: str) -> Histogram:
+    """
+    The `torchtrader_indicator_seconds` histogram of an indicator, timing each of its updates.
+    """
+    return REGISTRY.histogram(
+        "torchtrader_indicator_seconds", "Indicator compute time", indicator=indicator
+    )
+
+
+def start_http_server(port: int, host: str = "127.0.0.1", registry: MetricsRegistry = None):
+    """
+    Serve the metrics at `http://host:port/metrics` from a daemon thread.
+
+    Args:
+        port (int): The port to listen on, 0 picks a free one.
+        host (str): The interface to listen on, local only by default.
+        registry (MetricsRegistry): The registry to serve. Defaults to `REGISTRY`.
+
+    Returns:
+        ThreadingHTTPServer: The running server, stop it with `shutdown()`.
+    """
+    from http.server import BaseHTTPRequestHandler
+    from http.server import ThreadingHTTPServer
+
+    registry = registry or REGISTRY
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    app_logger.info("Serving metrics on http://%s:%s/metrics", host, server.server_port)
+    return server
+
+
+def start_file_dump(
+    path: str | Path, interval: float = 15.0, registry: MetricsRegistry = None
+) -> threading.Event:
+    """
+    Write the metrics to a file every `interval` seconds from a daemon thread, e.g. for the
+    textfile collector of the Prometheus node exporter.
+
+    Args:
+        path (str | Path): The file to write, replaced atomically.
+        interval (float): Seconds between two dumps.
+        registry (MetricsRegistry): The registry to dump. Defaults to `REGISTRY`.
+
+    Returns:
+        threading.Event: Set it to stop dumping, after one last dump.
+    """
+    registry = registry or REGISTRY
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    stop = threading.Event()
+
+    def dump():
+        while True:
+            stopped = stop.wait(interval)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            tmp_path.write_text(registry.render())
+            os.replace(tmp_path, path)
+            if stopped:
+                return
+
+    threading.Thread(target=dump, name="metrics-dump", daemon=True).start()
+    return stop
+
+
+def start_exporters(registry: MetricsRegistry = None) -> None:
+    """
+    Start the exporters configured in the `metrics` section: `http_port` and `dump_path`
+    (every `dump_interval` seconds). Does nothing while metrics are disabled.
+    """
+    registry = registry or REGISTRY
+    config = get_section("metrics")
+    if not registry.enabled:
+        return
+    if config.get("http_port") is not None:
+        start_http_server(config["http_port"], config.get("http_host", "127.0.0.1"), registry)
+    if config.get("dump_path"):
+        start_file_dump(config["dump_path"], config.get("dump_interval", 15.0), registry)
@@ -0,0 +1,264 @@
+"""
+torchtrader/models/predict_model.py
+
+In-process inference service batching the predictions requested by many bots and symbols.
+
+Requests are queued by `predict` and collected into micro-batches: a batch runs as soon as it
+holds `max_batch_size` requests, or `max_wait_ms` after its first request arrived. The batch is
+stacked, run once through the model under `torch.inference_mode`, and every awaiting coroutine
+gets its own row of the output. While a batch runs in the worker thread, the event loop keeps
+serving the bots and collecting the next batch.
+
+```python
+service = InferenceService(model, max_batch_size=64, max_wait_ms=2)
+async with service:
+    prediction = await service.predict(features)  # features of one sample, no batch dim
+```
+"""
+import asyncio
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+import numpy as np
+import torch
+from torch import nn
+from torch import Tensor
+
+from torchtrader.logs.logger import app_logger
+from torchtrader.metrics import REGISTRY
+from torchtrader.profiling import profile_stage
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class InferenceStats:
+    """
+    Batch sizes and latencies of an inference service, over its last `size` batches.
+    """
+
+    def __init__(self, size: int = 4096):
+        self._sizes = np.zeros(size, dtype=np.int64)
+        self._seconds = np.zeros(size)
+        self.batches = 0
+        self.requests = 0
+        self.busy_seconds = 0.0
+
+    def add(self, batch_size: int, seconds: float) -> None:
+        self._sizes[self.batches % len(self._sizes)] = batch_size
+        self._seconds[self.batches % len(self._seconds)] = seconds
+        self.batches += 1
+        self.requests += batch_size
+        self.busy_seconds += seconds
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Batches, requests, mean batch size, batch latency percentiles in milliseconds and
+        throughput in requests per second of model time.
+        """
+        kept = min(self.batches, len(self._sizes))
+        result = {"batches": self.batches, "requests": self.requests}
+        if kept:
+            p50, p99 = np.percentile(self._seconds[:kept] * 1000, [50, 99])
+            result.update(
+                mean_batch_size=float(self._sizes[:kept].mean()),
+                p50_ms=float(p50),
+                p99_ms=float(p99),
+                throughput=self.requests / self.busy_seconds if self.busy_seconds else 0.0,
+            )
+        return result
+
+
+class InferenceService:
+    """
+    Micro-batching inference service of a model, on the current asyncio loop.
+
+    Args:
+        model (nn.Module): The model, called with a `[batch, ...]` tensor and returning a tensor
+            (or a tuple of tensors) with the batch as first dimension.
+        max_batch_size (int): Requests of a full batch.
+        max_wait_ms (float): Maximum wait of the first request of a batch for others to join.
+        compile (bool): Compile the model with `torch.compile`. Batches are then padded to a
+            power of two so that only a few shapes are ever compiled.
+        example (Tensor | None): A sample, without the batch dimension, run through the model
+            at every batch size bucket on start, so that no request pays the warm-up.
+        device (str | torch.device | None): Device of the model and the batches.
+        offload (bool): Run the batches in a worker thread instead of on the event loop.
+        name (str): The model label of the metrics.
+    """
+
+    def __init__(
+        self,
+        model: nn.Module,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0,
+        compile: bool = False,
+        example: Tensor | None = None,
+        device: str | torch.device | None = None,
+        offload: bool = True,
+        name: str = "model",
+    ):
+        self.device = torch.device(device) if device is not None else None
+        model = model.eval() if self.device is None else model.to(self.device).eval()
+        self.model = torch.compile(model) if compile else model
+        self.compiled = compile
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.example = example
+        self.offload = offload
+        self.name = name
+        self.stats = InferenceStats()
+        self._batch_seconds = REGISTRY.histogram(
+            "torchtrader_inference_batch_seconds", "Inference batch latency", model=name
+        )
+        self._batch_sizes = REGISTRY.histogram(
+            "torchtrader_inference_batch_size",
+            "Requests per inference batch",
+            buckets=BATCH_SIZE_BUCKETS,
+            model=name,
+        )
+        self._request_seconds = REGISTRY.histogram(
+            "torchtrader_inference_request_seconds", "Inference request latency", model=name
+        )
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    async def __aenter__(self) -> "InferenceService":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def start(self) -> None:
+        """
+        Warm the model up, then start batching the requests.
+        """
+        if self.example is not None:
+            await self._run_in_worker(self._warm_up)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._serve())
+
+    async def stop(self) -> None:
+        """
+        Stop batching once the requests already queued are served.
+        """
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def predict(self, inputs: Tensor) -> Any:
+        """
+        Predict a single sample.
+
+        Args:
+            inputs (Tensor): The features of the sample, without the batch dimension.
+
+        Returns:
+            Any: The row of the model output for the sample, a tensor or a tuple of tensors.
+        """
+        if self._task is None:
+            raise RuntimeError(f"Inference service {self.name} is not started")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((inputs, future, time.perf_counter()))
+        return await future
+
+    def _warm_up(self) -> None:
+        size = 1
+        while size <= self.max_batch_size:
+            self._forward(self.example.unsqueeze(0).expand(size, *self.example.shape))
+            size *= 2
+        app_logger.info("Inference service %s warmed up", self.name)
+
+    async def _run_in_worker(self, function, *args) -> Any:
+        if self.offload:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    async def _serve(self) -> None:
+        stopping = False
+        running: asyncio.Future | None = None
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = first[2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    request = self._queue.get_nowait()
+                else:
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0:
+                        break
+                    try:
+                        request = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            # One batch in the model at a time, the next one is collected meanwhile
+            if running is not None:
+                await running
+            running = asyncio.ensure_future(self._run_batch(batch))
+        if running is not None:
+            await running
+
+    async def _run_batch(self, batch: List[Tuple[Tensor, asyncio.Future, float]]) -> None:
+        # Requests of different shapes cannot be stacked together, they are run per shape
+        groups: Dict[Tuple, List] = {}
+        for request in batch:
+            inputs = request[0]
+            groups.setdefault((tuple(inputs.shape), inputs.dtype), []).append(request)
+
+        for requests in groups.values():
+            start = time.perf_counter()
+            try:
+                outputs = await self._run_in_worker(
+                    self._predict_batch, [inputs for inputs, _, _ in requests]
+                )
+            except Exception as e:
+                app_logger.error("Inference batch of %s failed: %s", self.name, e)
+                for _, future, _ in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            done = time.perf_counter()
+            self.stats.add(len(requests), done - start)
+            self._batch_seconds.observe(done - start)
+            self._batch_sizes.observe(len(requests))
+            for index, (_, future, queued) in enumerate(requests):
+                self._request_seconds.observe(done - queued)
+                if not future.done():
+                    future.set_result(_row(outputs, index))
+
+    def _predict_batch(self, samples: List[Tensor]) -> Any:
+        inputs = torch.stack(samples)
+        if self.compiled:
+            # Pad to a power of two, compiled graphs are specialized on the batch size
+            padded = 1 << (len(samples) - 1).bit_length()
+            if padded > len(samples):
+                padding = inputs[-1:].expand(padded - len(samples), *inputs.shape[1:])
+                inputs = torch.cat([inputs, padding])
+        return self._forward(inputs)
+
+    def _forward(self, inputs: Tensor) -> Any:
+        with profile_stage("evaluate"), torch.inference_mode():
+            if self.device is not None:
+                inputs = inputs.to(self.device, non_blocking=True)
+            outputs = self.model(inputs)
+            if isinstance(outputs, tuple):
+                return tuple(output.cpu() for output in outputs)
+            return outputs.cpu()
+
+
+def _row(outputs: Any, index: int) -> Any:
+    if isinstance(outputs, tuple):
+        return tuple(output[index] for output in outputs)
+    return outputs[index]
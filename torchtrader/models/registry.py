@@ -0,0 +1,192 @@
+"""
+torchtrader/models/registry.py
+
+Content-addressed store of model checkpoints, loaded memory-mapped and shared by the bots.
+
+```
+<root>/index.json                  name -> versions (digest, time, metadata)
+<root>/<digest[:2]>/<digest>.pt    state dict saved by torch.save
+```
+
+The digest is a SHA-256 of the tensors of the state dict, so saving the same weights twice
+stores them once. Checkpoints are loaded with `torch.load(mmap=True)`: the weights stay in the
+page cache, shared by every process mapping the same file, instead of being copied per model.
+Within a process, the models built from a checkpoint are kept in an LRU warm pool, so 50 bots
+asking for the same model get the same instance.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+
+import torch
+from torch import nn
+from torch import Tensor
+
+from torchtrader.config import get_section
+from torchtrader.config import PROJECT_DIR
+from torchtrader.logs.logger import app_logger
+from torchtrader.metrics import REGISTRY
+
+DEFAULT_CHECKPOINT_ROOT = PROJECT_DIR / "models" / "checkpoints"
+POOL_HITS = REGISTRY.counter("torchtrader_checkpoint_pool_hits_total", "Warm pool hits")
+POOL_MISSES = REGISTRY.counter("torchtrader_checkpoint_pool_misses_total", "Warm pool misses")
+
+
+def state_dict_digest(state_dict: Dict[str, Tensor]) -> str:
+    """
+    SHA-256 of the names, dtypes, shapes and contents of the tensors of a state dict.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(state_dict):
+        tensor = state_dict[name].detach().cpu().contiguous()
+        digest.update(f"{name}:{tensor.dtype}:{tuple(tensor.shape)}".encode())
+        digest.update(tensor.reshape(-1).view(torch.uint8).numpy().tobytes())
+    return digest.hexdigest()
+
+
+class CheckpointRegistry:
+    """
+    Save, version and load model checkpoints. Options default to the `checkpoints`
+    configuration.
+
+    Args:
+        root (str | Path | None): The store directory, `models/checkpoints` by default.
+        pool_size (int | None): Loaded checkpoints and models kept warm, 8 by default.
+    """
+
+    def __init__(self, root: str | Path | None = None, pool_size: int | None = None):
+        config = get_section("checkpoints")
+        self.root = Path(root or config.get("root") or DEFAULT_CHECKPOINT_ROOT)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.pool_size = pool_size or config.get("pool_size", 8)
+        self._pool: OrderedDict = OrderedDict()
+        self._lock = threading.RLock()
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest}.pt"
+
+    def _read_index(self) -> Dict[str, List[Dict[str, Any]]]:
+        index_path = self.root / "index.json"
+        return json.loads(index_path.read_text()) if index_path.is_file() else {}
+
+    def _write_index(self, index: Dict[str, List[Dict[str, Any]]]) -> None:
+        tmp_path = self.root / "index.json.tmp"
+        tmp_path.write_text(json.dumps(index, indent=1))
+        os.replace(tmp_path, self.root / "index.json")
+
+    def save(
+        self,
+        name: str,
+        model: nn.Module | Dict[str, Tensor],
+        metadata: Dict[str, Any] | None = None,
+    ) -> str:
+        """
+        Save the weights of a model as the latest version of `name`.
+
+        Args:
+            name (str): The model name, e.g. "lstm-btc-1m".
+            model (nn.Module | Dict[str, Tensor]): The model or its state dict.
+            metadata (Dict[str, Any] | None): JSON serializable notes, e.g. the training run.
+
+        Returns:
+            str: The digest of the checkpoint. A version is only added when it differs from the
+            latest one.
+        """
+        state_dict = model.state_dict() if isinstance(model, nn.Module) else model
+        digest = state_dict_digest(state_dict)
+        path = self.path(digest)
+        if not path.is_file():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            torch.save({key: value.detach().cpu() for key, value in state_dict.items()}, tmp_path)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            index = self._read_index()
+            versions = index.setdefault(name, [])
+            if not versions or versions[-1]["digest"] != digest:
+                versions.append({"digest": digest, "time": time.time(), "metadata": metadata or {}})
+                self._write_index(index)
+        app_logger.info("Saved checkpoint %s of %s", digest[:12], name)
+        return digest
+
+    def versions(self, name: str) -> List[Dict[str, Any]]:
+        """
+        The versions of a model, oldest first.
+        """
+        return self._read_index().get(name, [])
+
+    def resolve(self, name: str, version: int = -1) -> str:
+        """
+        The digest of a version of `name` (the latest by default), or `name` if it is a digest.
+        """
+        versions = self.versions(name)
+        if versions:
+            return versions[version]["digest"]
+        if self.path(name).is_file():
+            return name
+        raise KeyError(f"No checkpoint named {name}")
+
+    def state_dict(self, name: str, version: int = -1) -> Dict[str, Tensor]:
+        """
+        The memory-mapped state dict of a checkpoint, loaded once per process while it is warm.
+        """
+        digest = self.resolve(name, version)
+        return self._pooled((digest, None), lambda: self._load(digest))
+
+    def load(self, name: str, factory: Callable[[], nn.Module], version: int = -1) -> nn.Module:
+        """
+        A model with the weights of a checkpoint, in eval mode and without gradients.
+
+        Models are shared: every caller asking for the same checkpoint and factory gets the
+        same instance while it is in the warm pool, so it must only be used for inference.
+
+        Args:
+            name (str): The model name or a checkpoint digest.
+            factory (Callable[[], nn.Module]): Builds the model, e.g. the model class.
+            version (int): The version index, the latest by default.
+
+        Returns:
+            nn.Module: The model, its parameters memory-mapped from the checkpoint file.
+        """
+        digest = self.resolve(name, version)
+
+        def build() -> nn.Module:
+            model = factory()
+            # assign keeps the mapped tensors instead of copying them into fresh parameters
+            model.load_state_dict(self.state_dict(digest), assign=True)
+            model.requires_grad_(False)
+            return model.eval()
+
+        return self._pooled((digest, factory), build)
+
+    def _load(self, digest: str) -> Dict[str, Tensor]:
+        return torch.load(self.path(digest), mmap=True, weights_only=True, map_location="cpu")
+
+    def _pooled(self, key: tuple, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._pool:
+                POOL_HITS.inc()
+                self._pool.move_to_end(key)
+                return self._pool[key]
+            POOL_MISSES.inc()
+            value = build()
+            self._pool[key] = value
+            while len(self._pool) > self.pool_size:
+                self._pool.popitem(last=False)
+            return value
+
+    def clear(self) -> None:
+        """
+        Drop the warm pool.
+        """
+        with self._lock:
+            self._pool.clear()
@@ -0,0 +1,352 @@
+"""
+torchtrader/portfolio.py
+
+Portfolio ledger of all the bots, as dense `[bots, assets]` tensors.
+
+Positions, average costs, realized and unrealized P&L, fees and exposures of every bot and asset
+are cells of a few tensors, so that:
+
+- a batch of fills is applied at once, whatever the number of bots and assets it touches,
+- a price update marks the whole portfolio to market in one vectorized pass,
+- the risk limits (gross exposure, drawdown from the equity peak) are checked for every bot
+  after every bar.
+
+Positions are signed (negative when short) and average costs are those of the open position:
+fills reducing a position realize `quantity * (price - average cost)` and leave the average cost
+unchanged, a fill flipping it opens the new side at the fill price.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import Sequence
+
+import torch
+from torch import Tensor
+
+from torchtrader.config import get_section
+from torchtrader.logs.logger import app_logger
+
+SIDES = {"buy": 1.0, "sell": -1.0}
+
+
+@dataclass
+class RiskReport:
+    """
+    Risk limit breaches of every bot, as `[bots]` boolean tensors.
+    """
+
+    exposure: Tensor
+    drawdown: Tensor
+
+    @property
+    def breached(self) -> Tensor:
+        return self.exposure | self.drawdown
+
+
+class PortfolioLedger:
+    """
+    Positions and P&L of many bots trading many assets. Options default to the `portfolio`
+    configuration.
+
+    Args:
+        bots (Sequence[str]): The bot names, more can be added with `add_bot`.
+        assets (Sequence[str]): The asset symbols, more are added by `add_asset` or on their
+            first fill.
+        cash (float | None): Starting cash of every bot, 0 by default.
+        max_exposure (float | None): Gross exposure (sum of |position| x price) allowed per bot,
+            unlimited by default.
+        max_drawdown (float | None): Drawdown of the equity from its peak allowed per bot, as a
+            fraction, e.g. 0.2. Unlimited by default, and only allowed with a positive cash.
+        dtype (torch.dtype): The dtype of the tensors.
+    """
+
+    def __init__(
+        self,
+        bots: Sequence[str] = (),
+        assets: Sequence[str] = (),
+        cash: float | None = None,
+        max_exposure: float | None = None,
+        max_drawdown: float | None = None,
+        dtype: torch.dtype = torch.float64,
+    ):
+        config = get_section("portfolio")
+        self.initial_cash = cash if cash is not None else config.get("cash", 0.0)
+        self.max_exposure = max_exposure if max_exposure is not None else config.get("max_exposure")
+        self.max_drawdown = max_drawdown if max_drawdown is not None else config.get("max_drawdown")
+        self._check_cash(self.initial_cash)
+        self.dtype = dtype
+        self.bots: Dict[str, int] = {}
+        self.assets: Dict[str, int] = {}
+
+        self.position = torch.zeros(0, 0, dtype=dtype)
+        self.avg_cost = torch.zeros(0, 0, dtype=dtype)
+        self.realized = torch.zeros(0, 0, dtype=dtype)
+        self.fees = torch.zeros(0, 0, dtype=dtype)
+        self.unrealized = torch.zeros(0, 0, dtype=dtype)
+        self.exposure = torch.zeros(0, 0, dtype=dtype)
+        self.prices = torch.zeros(0, dtype=dtype)
+        self._marked = torch.zeros(0, dtype=torch.bool)
+        self.cash = torch.zeros(0, dtype=dtype)
+        self.equity = torch.zeros(0, dtype=dtype)
+        self.peak = torch.zeros(0, dtype=dtype)
+        for bot in bots:
+            self.add_bot(bot)
+        for asset in assets:
+            self.add_asset(asset)
+
+    _MATRICES = ("position", "avg_cost", "realized", "fees", "unrealized", "exposure")
+
+    def add_bot(self, name: str, cash: float | None = None) -> int:
+        """
+        Add a bot with no position, returns its row. Adding a known bot returns its row.
+        """
+        if name in self.bots:
+            return self.bots[name]
+        cash = self.initial_cash if cash is None else cash
+        self._check_cash(cash)
+        for attribute in self._MATRICES:
+            matrix = getattr(self, attribute)
+            setattr(self, attribute, torch.cat([matrix, matrix.new_zeros(1, len(self.assets))]))
+        for attribute in ("cash", "equity", "peak"):
+            setattr(self, attribute, torch.cat([getattr(self, attribute), self._scalar(cash)]))
+        self.bots[name] = len(self.bots)
+        return self.bots[name]
+
+    def _check_cash(self, cash: float) -> None:
+        # The drawdown is a fraction of the equity peak, a bot starting from no cash has no peak
+        if self.max_drawdown is not None and cash <= 0:
+            raise ValueError(f"max_drawdown needs a positive starting cash, got {cash}")
+
+    def add_asset(self, symbol: str) -> int:
+        """
+        Add an asset with no position and no price yet, returns its column.
+        """
+        if symbol in self.assets:
+            return self.assets[symbol]
+        for attribute in self._MATRICES:
+            matrix = getattr(self, attribute)
+            setattr(self, attribute, torch.cat([matrix, matrix.new_zeros(len(self.bots), 1)], 1))
+        self.prices = torch.cat([self.prices, self._scalar(float("nan"))])
+        self._marked = torch.cat([self._marked, torch.zeros(1, dtype=torch.bool)])
+        self.assets[symbol] = len(self.assets)
+        return self.assets[symbol]
+
+    def _scalar(self, value: float) -> Tensor:
+        return torch.tensor([value], dtype=self.dtype)
+
+    def apply_fills(
+        self,
+        bots: Tensor,
+        assets: Tensor,
+        quantities: Tensor,
+        prices: Tensor,
+        fees: Tensor | None = None,
+    ) -> None:
+        """
+        Apply a batch of fills, in order.
+
+        Args:
+            bots (Tensor): `[n]` rows of the bots.
+            assets (Tensor): `[n]` columns of the assets.
+            quantities (Tensor): `[n]` signed quantities, positive when buying.
+            prices (Tensor): `[n]` fill prices.
+            fees (Tensor | None): `[n]` fees paid, in cash.
+        """
+        bots = torch.as_tensor(bots, dtype=torch.long)
+        assets = torch.as_tensor(assets, dtype=torch.long)
+        quantities = torch.as_tensor(quantities, dtype=self.dtype)
+        prices = torch.as_tensor(prices, dtype=self.dtype)
+        if fees is None:
+            fees = torch.zeros_like(quantities)
+        fees = torch.as_tensor(fees, dtype=self.dtype)
+
+        cells = bots * len(self.assets) + assets
+        self.cash.index_add_(0, bots, -(quantities * prices + fees))
+        self.fees.view(-1).index_add_(0, cells, fees)
+        # Assets never marked are valued at their last fill price
+        last = torch.full((len(self.assets),), -1, dtype=torch.long)
+        last.scatter_reduce_(0, assets, torch.arange(len(assets)), "amax")
+        unmarked = (last >= 0) & ~self._marked
+        self.prices[unmarked] = prices[last[unmarked]]
+
+        # Fills of distinct cells are applied together, repeated cells in successive rounds
+        rounds = _occurrences(cells)
+        for index in range(int(rounds.max()) + 1 if len(cells) else 0):
+            selected = rounds == index
+            self._apply_cells(cells[selected], quantities[selected], prices[selected])
+        self._revalue()
+
+    def _apply_cells(self, cells: Tensor, quantity: Tensor, price: Tensor) -> None:
+        position = self.position.view(-1)[cells]
+        cost = self.avg_cost.view(-1)[cells]
+        total = position + quantity
+        increasing = (position * quantity >= 0) & (quantity != 0)
+        closed = torch.where(
+            increasing, 0.0, torch.sign(position) * torch.minimum(quantity.abs(), position.abs())
+        )
+        self.realized.view(-1).index_add_(0, cells, closed * (price - cost))
+
+        blended = (position * cost + quantity * price) / torch.where(total == 0, 1.0, total)
+        flipped = quantity.abs() > position.abs()
+        cost = torch.where(
+            increasing,
+            blended,
+            torch.where(flipped, price, torch.where(total == 0, 0.0, cost)),
+        )
+        self.position.view(-1)[cells] = total
+        self.avg_cost.view(-1)[cells] = cost
+
+    def fill(
+        self,
+        bot: str,
+        asset: str,
+        side: str,
+        quantity: float,
+        price: float,
+        fee: float = 0.0,
+    ) -> None:
+        """
+        Apply a single fill, adding its bot and asset when new.
+
+        Args:
+            bot (str): The bot name.
+            asset (str): The asset symbol.
+            side (str): "buy" or "sell".
+            quantity (float): The unsigned quantity filled.
+            price (float): The fill price.
+            fee (float): The fee paid.
+        """
+        row = self.add_bot(bot)
+        column = self.add_asset(asset)
+        self.apply_fills(
+            torch.tensor([row]),
+            torch.tensor([column]),
+            torch.tensor([SIDES[side] * quantity]),
+            torch.tensor([price]),
+            torch.tensor([fee]),
+        )
+
+    def mark(self, prices: Tensor | Mapping[str, float]) -> None:
+        """
+        Mark the portfolio to market.
+
+        Args:
+            prices (Tensor | Mapping[str, float]): The `[assets]` prices of all the assets, or the
+                prices of some of them by symbol.
+        """
+        if isinstance(prices, Mapping):
+            for symbol, price in prices.items():
+                column = self.add_asset(symbol)
+                self.prices[column] = price
+                self._marked[column] = True
+        else:
+            self.prices.copy_(torch.as_tensor(prices, dtype=self.dtype))
+            self._marked.fill_(True)
+        self._revalue()
+
+    def _revalue(self) -> None:
+        prices = self.prices.nan_to_num(0.0)
+        held = self.position != 0
+        torch.mul(self.position, prices - self.avg_cost, out=self.unrealized)
+        self.unrealized.masked_fill_(~held, 0.0)
+        torch.mul(self.position.abs(), prices, out=self.exposure)
+        torch.add(self.cash, (self.position * prices).sum(1), out=self.equity)
+        torch.maximum(self.peak, self.equity, out=self.peak)
+
+    @property
+    def drawdown(self) -> Tensor:
+        """
+        `[bots]` drawdown of the equity from its peak, as a fraction of the peak.
+        """
+        return torch.where(self.peak > 0, 1 - self.equity / self.peak, 0.0)
+
+    def check_risk(self) -> RiskReport:
+        """
+        The bots over their gross exposure or drawdown limit.
+        """
+        breaches = torch.zeros(len(self.bots), dtype=torch.bool)
+        exposure = breaches
+        drawdown = breaches
+        if self.max_exposure is not None:
+            exposure = self.exposure.sum(1) > self.max_exposure
+        if self.max_drawdown is not None:
+            drawdown = self.drawdown > self.max_drawdown
+        return RiskReport(exposure, drawdown)
+
+    def breaches(self) -> List[str]:
+        """
+        The names of the bots over a risk limit, logged as warnings.
+        """
+        report = self.check_risk()
+        names = list(self.bots)
+        breached = [names[row] for row in report.breached.nonzero().flatten().tolist()]
+        for name in breached:
+            row = self.bots[name]
+            app_logger.warning(
+                "Bot %s over its risk limits: exposure %.2f, drawdown %.2f%%",
+                name,
+                float(self.exposure[row].sum()),
+                float(self.drawdown[row]) * 100,
+            )
+        return breached
+
+    def summary(self, bot: str) -> Dict[str, float]:
+        """
+        Cash, equity, realized and unrealized P&L, fees, gross exposure and drawdown of a bot.
+        """
+        row = self.bots[bot]
+        return {
+            "cash": float(self.cash[row]),
+            "equity": float(self.equity[row]),
+            "realized": float(self.realized[row].sum()),
+            "unrealized": float(self.unrealized[row].sum()),
+            "fees": float(self.fees[row].sum()),
+            "exposure": float(self.exposure[row].sum()),
+            "drawdown": float(self.drawdown[row]),
+        }
+
+    @classmethod
+    def from_journal(
+        cls, path: str | Path | None = None, bot: str = "journal", **options
+    ) -> "PortfolioLedger":
+        """
+        Rebuild the positions from the trades of a journal, as the fills of a single bot.
+        Trades without an execution price are skipped.
+
+        Args:
+            path (str | Path | None): The journal file, see `TradeJournal`.
+            bot (str): The bot the trades are booked to.
+            **options: Other arguments of `PortfolioLedger`.
+        """
+        from torchtrader.logs.journal import read_journal
+
+        trades = read_journal(path)
+        ledger = cls([bot], **options)
+        priced = ~torch.from_numpy(trades["price"]).isnan()
+        if int((~priced).sum()):
+            app_logger.warning("Skipped %d journal trades without price", int((~priced).sum()))
+        symbols = trades["symbol"][priced.numpy()]
+        columns = torch.tensor([ledger.add_asset(str(symbol)) for symbol in symbols])
+        quantities = torch.from_numpy(trades["quantity"] * trades["side"])[priced]
+        ledger.apply_fills(
+            torch.zeros(len(columns), dtype=torch.long),
+            columns,
+            quantities,
+            torch.from_numpy(trades["price"])[priced],
+        )
+        return ledger
+
+
+def _occurrences(cells: Tensor) -> Tensor:
+    # Rank of every fill among the earlier fills of the same cell: 0 for the first one, ...
+    order = torch.sort(cells, stable=True).indices
+    sorted_cells = cells[order]
+    starts = torch.ones_like(sorted_cells, dtype=torch.bool)
+    starts[1:] = sorted_cells[1:] != sorted_cells[:-1]
+    positions = torch.arange(len(cells))
+    first = torch.cummax(torch.where(starts, positions, 0), 0).values
+    ranks = torch.empty_like(cells)
+    ranks[order] = positions - first
+    return ranks
@@ -0,0 +1,357 @@
+"""
+torchtrader/profiling.py
+
+Profiling of the pipeline stages (collect, store, features, evaluate, trade).
+
+Code tags the stage it belongs to with `profile_stage(name)` or `@profiled(name)`. Both cost a
+single check while profiling is off. The stages are tracked per asyncio task, and code that
+awaits, coroutine functions or `profile_stage(name, asynchronous=True)`, is only sampled and
+timed. Once `enable_profiling()` is called, e.g. by
+`main.py --profile`, each stage is profiled and `close()` writes under
+`reports/profiles/<run>/`:
+
+```
+<stage>.pstats     cProfile statistics, load them with pstats or snakeviz
+<stage>.txt        the 50 functions with the highest cumulative time
+<stage>.folded     sampled stacks in the folded format of flamegraph.pl and speedscope
+all.folded         every sampled stack, prefixed with its stage
+torch.txt          torch.profiler operator summary of the stages run with torch_kernels
+torch.json         Chrome trace of the same operators, with one range per stage
+summary.txt        calls and wall time per stage
+```
+
+In "sampling" mode only the stack sampler runs, which is cheap enough for production. A live
+process can also be sampled for a while without stopping it, see `install_signal_handler`.
+"""
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from collections import defaultdict
+from contextlib import contextmanager
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Set
+from typing import Tuple
+
+from torchtrader.config import get_section
+from torchtrader.config import PROJECT_DIR
+from torchtrader.logs.logger import app_logger
+
+STAGES = ("collect", "store", "features", "evaluate", "trade")
+DEFAULT_PROFILE_DIR = PROJECT_DIR / "reports" / "profiles"
+# Stages whose kernels run in torch, profiled with torch.profiler when torch_kernels is set
+TORCH_STAGES = ("features", "evaluate")
+# Active stages of the running thread or task, innermost last: every asyncio task gets its own
+_active_stages: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar(
+    "torchtrader_stages", default=()
+)
+
+
+class StackSampler(threading.Thread):
+    """
+    Daemon thread sampling the Python stacks of all the other threads every `interval` seconds.
+
+    Args:
+        interval (float): Seconds between two samples.
+        stage_of (Callable[[int], str]): Gives the current stage of a thread id.
+        duration (float | None): Stop by itself after this many seconds.
+    """
+
+    def __init__(
+        self, interval: float, stage_of: Callable[[int], str], duration: float | None = None
+    ):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.stage_of = stage_of
+        self.duration = duration
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        deadline = None if self.duration is None else time.monotonic() + self.duration
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[(self.stage_of(thread_id), ";".join(reversed(names)))] += 1
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def write(self, output_dir: Path, prefix: str = "") -> None:
+        """
+        Write one folded stacks file per stage plus `all.folded` with the stage as root frame.
+        """
+        output_dir.mkdir(parents=True, exist_ok=True)
+        per_stage: Dict[str, List[str]] = defaultdict(list)
+        for (stage, stack), count in sorted(self.stacks.items()):
+            per_stage[stage].append(f"{stack} {count}")
+            per_stage["all"].append(f"{stage};{stack} {count}")
+        for stage, lines in per_stage.items():
+            (output_dir / f"{prefix}{stage}.folded").write_text("\n".join(lines) + "\n")
+
+
+class StageProfiler:
+    """
+    Profile the pipeline stages of a run. Options default to the `profiling` configuration.
+
+    Args:
+        enabled (bool): Whether stages are profiled at all.
+        mode (str | None): "deterministic" (cProfile plus stack sampling) or "sampling".
+        output_dir (str | Path | None): Directory of the runs, `reports/profiles` by default.
+        sample_interval (float | None): Seconds between two stack samples, 5 ms by default.
+        torch_kernels (bool | None): Profile the torch operators of the features and evaluate
+            stages with torch.profiler.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        mode: str | None = None,
+        output_dir: str | Path | None = None,
+        sample_interval: float | None = None,
+        torch_kernels: bool | None = None,
+    ):
+        config = get_section("profiling")
+        self.enabled = enabled
+        self.mode = mode or config.get("mode", "deterministic")
+        if self.mode not in ("deterministic", "sampling"):
+            raise ValueError(f"Unknown profiling mode: {self.mode}")
+        self.sample_interval = sample_interval or config.get("sample_interval", 0.005)
+        self.torch_kernels = (
+            config.get("torch_kernels", True) if torch_kernels is None else torch_kernels
+        )
+        run = datetime.now().strftime("%Y%m%dT%H%M%S")
+        self.output_dir = Path(output_dir or config.get("output_dir") or DEFAULT_PROFILE_DIR) / run
+
+        self._lock = threading.Lock()
+        # Stage last entered or left on every thread, for the sampler that cannot read the
+        # context of other threads
+        self._thread_stages: Dict[int, str] = {}
+        # Threads running a cProfile profiler, only one can run per thread
+        self._profiled_threads: Set[int] = set()
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._calls: Counter = Counter()
+        self._seconds: Counter = Counter()
+        self._sampler: StackSampler | None = None
+        self._torch_profile = None
+
+    def current_stage(self, thread_id: int) -> str:
+        return self._thread_stages.get(thread_id, "other")
+
+    def stage(self, name: str, asynchronous: bool = False):
+        """
+        Context manager profiling the code of a stage.
+
+        The active stages are kept in a context variable, so coroutines interleaved on the
+        event loop each see their own. Nested stages are attributed to the innermost one by the
+        sampler, while cProfile keeps profiling the outermost one, as only one cProfile
+        profiler can run per thread.
+
+        Args:
+            name (str): The stage, e.g. "evaluate".
+            asynchronous (bool): The block awaits. It is then only sampled and timed: cProfile
+                and torch ranges are per thread and would also record the coroutines run by
+                the event loop while it is suspended.
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._stage(name, asynchronous)
+
+    @contextmanager
+    def _stage(self, name: str, asynchronous: bool = False) -> Iterator[None]:
+        thread_id = threading.get_ident()
+        self._start_sampler()
+
+        profile = None
+        torch_range = nullcontext()
+        if not asynchronous:
+            with self._lock:
+                if self.mode == "deterministic" and thread_id not in self._profiled_threads:
+                    profile = self._profiles.setdefault(name, cProfile.Profile())
+                    self._profiled_threads.add(thread_id)
+            if self.torch_kernels and name in TORCH_STAGES:
+                torch_range = self._torch_range(name)
+
+        stages = _active_stages.get()
+        token = _active_stages.set(stages + (name,))
+        self._thread_stages[thread_id] = name
+        start = time.perf_counter()
+        try:
+            with torch_range:
+                if profile is not None:
+                    profile.enable()
+                try:
+                    yield
+                finally:
+                    if profile is not None:
+                        profile.disable()
+        finally:
+            _active_stages.reset(token)
+            self._thread_stages[thread_id] = stages[-1] if stages else "other"
+            with self._lock:
+                if profile is not None:
+                    self._profiled_threads.discard(thread_id)
+                self._calls[name] += 1
+                self._seconds[name] += time.perf_counter() - start
+
+    def _start_sampler(self) -> None:
+        with self._lock:
+            if self._sampler is None:
+                self._sampler = StackSampler(self.sample_interval, self.current_stage)
+                self._sampler.start()
+
+    def _torch_range(self, name: str):
+        import torch
+
+        with self._lock:
+            if self._torch_profile is None:
+                self._torch_profile = torch.profiler.profile(
+                    activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True
+                )
+                self._torch_profile.start()
+        return torch.profiler.record_function(f"stage:{name}")
+
+    def close(self) -> Path | None:
+        """
+        Stop profiling and write the reports of the run.
+
+        Returns:
+            Path | None: The directory of the reports, or None if nothing was profiled.
+        """
+        if not self.enabled or not self._calls:
+            return None
+        self.enabled = False
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler.write(self.output_dir)
+
+        for name, profile in self._profiles.items():
+            profile.dump_stats(self.output_dir / f"{name}.pstats")
+            report = io.StringIO()
+            pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(50)
+            (self.output_dir / f"{name}.txt").write_text(report.getvalue())
+
+        if self._torch_profile is not None:
+            self._torch_profile.stop()
+            table = self._torch_profile.key_averages().table(sort_by="cpu_time_total")
+            (self.output_dir / "torch.txt").write_text(table)
+            self._torch_profile.export_chrome_trace(str(self.output_dir / "torch.json"))
+
+        summary = [f"{'stage':<12} {'calls':>8} {'seconds':>10}"]
+        for name in sorted(self._calls):
+            summary.append(f"{name:<12} {self._calls[name]:>8} {self._seconds[name]:>10.3f}")
+        (self.output_dir / "summary.txt").write_text("\n".join(summary) + "\n")
+
+        app_logger.info("Profiling reports written to %s", self.output_dir)
+        return self.output_dir
+
+    def install_signal_handler(
+        self, signum: int = getattr(signal, "SIGUSR1", None), duration: float = None
+    ) -> None:
+        """
+        Sample the stacks of the process for `duration` seconds whenever it receives `signum`
+        (SIGUSR1 by default), without stopping it, e.g. `kill -USR1 <pid>`. The folded stacks
+        are written to `live-<time>-<stage>.folded` in the output directory.
+
+        Args:
+            signum (int): The signal starting a sampling window. Only on POSIX systems.
+            duration (float): Seconds of sampling, `profiling.signal_duration` or 30 by default.
+        """
+        duration = duration or get_section("profiling").get("signal_duration", 30.0)
+
+        def sample(*_):
+            sampler = StackSampler(self.sample_interval, self.current_stage, duration)
+
+            def run():
+                sampler.run()
+                prefix = f"live-{datetime.now().strftime('%H%M%S')}-"
+                sampler.write(self.output_dir, prefix)
+                app_logger.info("Live profile written to %s", self.output_dir)
+
+            threading.Thread(target=run, name="live-profile", daemon=True).start()
+
+        signal.signal(signum, sample)
+
+
+_profiler = StageProfiler(enabled=False)
+
+
+def get_profiler() -> StageProfiler:
+    return _profiler
+
+
+def enable_profiling(**options) -> StageProfiler:
+    """
+    Start profiling the stages of this process, see `StageProfiler` for the options.
+    """
+    global _profiler
+    _profiler = StageProfiler(enabled=True, **options)
+    return _profiler
+
+
+def profile_stage(name: str, asynchronous: bool = False):
+    """
+    Context manager tagging its block as part of a pipeline stage, see `StageProfiler.stage`.
+    """
+    return _profiler.stage(name, asynchronous)
+
+
+def active_stages() -> Tuple[str, ...]:
+    """
+    The stages active in the running thread or task, innermost last.
+    """
+    return _active_stages.get()
+
+
+def profiled(name: str) -> Callable:
+    """
+    Decorator tagging every call of a function or coroutine function as part of a stage.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if not _profiler.enabled:
+                    return await function(*args, **kwargs)
+                with _profiler.stage(name, asynchronous=True):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _profiler.enabled:
+                return function(*args, **kwargs)
+            with _profiler.stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
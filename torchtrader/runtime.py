@@ -0,0 +1,426 @@
+"""
+torchtrader/runtime.py
+
+Event-driven runtime running many trading bots on a single asyncio loop:
+
+```
+bar source -> bar buffer -> incremental indicators -> strategy.on_bar -> order intent
+```
+
+Every bot owns preallocated buffers for its bars and indicator values, so the hot path does not
+allocate per bar. Sources never wait on bots: each bot has its own inbox, and a bot that falls
+behind updates its indicators with every pending bar but only decides on the latest one.
+Strategies can be offloaded to a thread, and a decision that exceeds its latency budget is
+abandoned, so a slow strategy cannot stall the other bots.
+"""
+import asyncio
+import inspect
+import math
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import AsyncIterator
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Sequence
+
+import numpy as np
+
+from torchtrader.config import get_section
+from torchtrader.logs.logger import app_logger
+from torchtrader.metrics import indicator_seconds
+from torchtrader.metrics import REGISTRY
+from torchtrader.profiling import profile_stage
+from torchtrader.utils import timeframe_to_seconds
+
+BAR_FIELDS = ("timestamp", "open", "high", "low", "close", "volume")
+
+
+@dataclass
+class OrderIntent:
+    """
+    Order decided by a strategy, before any risk check or execution.
+    """
+
+    bot: str
+    symbol: str
+    side: str
+    quantity: float
+    price: float = math.nan
+    bar_timestamp: int = 0
+    latency_ns: int = 0
+
+
+class BarBuffer:
+    """
+    Preallocated ring buffer of the last `capacity` bars, one column per field of `BAR_FIELDS`.
+
+    Every bar is written twice, `capacity` rows apart, so the last n bars are always a
+    contiguous view of the storage and `window` never copies.
+
+    Args:
+        capacity (int): The number of bars kept.
+        fields (Sequence[str]): The columns, `BAR_FIELDS` by default.
+    """
+
+    def __init__(self, capacity: int = 1024, fields: Sequence[str] = BAR_FIELDS):
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self._data = np.full((2 * capacity, len(self.fields)), np.nan)
+        self._next = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, values: Sequence[float]) -> None:
+        self._data[self._next] = values
+        self._data[self._next + self.capacity] = values
+        self._next = (self._next + 1) % self.capacity
+        self.count += 1
+
+    def window(self, n: int | None = None) -> np.ndarray:
+        """
+        The last n bars (all the kept ones by default), oldest first, as a `[n, fields]` view.
+        """
+        n = len(self) if n is None else min(n, len(self))
+        end = self._next + self.capacity
+        return self._data[end - n : end]
+
+    def column(self, name: str, n: int | None = None) -> np.ndarray:
+        return self.window(n)[:, self.fields.index(name)]
+
+    def last(self, name: str = "close") -> float:
+        return float(self._data[self._next + self.capacity - 1, self.fields.index(name)])
+
+
+class LatencyStats:
+    """
+    Bar-to-decision latencies of a bot, in a preallocated ring of the last `size` samples.
+    """
+
+    def __init__(self, size: int = 4096):
+        self._samples = np.zeros(size, dtype=np.int64)
+        self.count = 0
+        self.overruns = 0
+        self.conflated = 0
+
+    def add(self, latency_ns: int) -> None:
+        self._samples[self.count % len(self._samples)] = latency_ns
+        self.count += 1
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Count, overruns, conflated bars and percentiles in milliseconds of the kept samples.
+        """
+        samples = self._samples[: min(self.count, len(self._samples))] / 1e6
+        result = {"count": self.count, "overruns": self.overruns, "conflated": self.conflated}
+        if len(samples):
+            p50, p99 = np.percentile(samples, [50, 99])
+            result.update(p50_ms=float(p50), p99_ms=float(p99), max_ms=float(samples.max()))
+        return result
+
+
+class Strategy:
+    """
+    Base class of the strategies run by `StrategyRuntime`.
+
+    Subclasses declare their incremental indicators in `indicators`, which are updated with every
+    bar, and decide in `on_bar`, called with the latest bar. `on_bar` may be a coroutine. Set
+    `offload = True` for strategies doing heavy synchronous work, e.g. model inference, so they
+    run in a worker thread instead of on the event loop. The bars of an offloaded strategy keep
+    advancing while it runs, so it should copy the window it needs first.
+    """
+
+    offload: bool = False
+
+    def indicators(self) -> Dict[str, Callable[[np.ndarray], float]]:
+        """
+        The indicators of the strategy, called with the `[fields]` row of every new bar and
+        returning the updated value, e.g. `lambda bar: float(ema(torch.tensor(bar[4]), 0.1))`.
+        """
+        return {}
+
+    def on_bar(self, bars: BarBuffer, values: Dict[str, float]) -> Any:
+        """
+        Decide on the latest bar.
+
+        Args:
+            bars (BarBuffer): The bars of the bot, the latest one last.
+            values (Dict[str, float]): The latest value of every indicator.
+
+        Returns:
+            Any: None, or an order as a (side, quantity) tuple or an `OrderIntent`.
+        """
+        return None
+
+
+@dataclass
+class Bot:
+    """
+    A strategy trading one symbol, with its buffers and latency statistics.
+    """
+
+    name: str
+    symbol: str
+    strategy: Strategy
+    bars: BarBuffer
+    latency: LatencyStats = field(default_factory=LatencyStats)
+    values: Dict[str, float] = field(default_factory=dict)
+    inbox: List[tuple] = field(default_factory=list)
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    decision: asyncio.Future | None = None
+
+
+async def replay_source(bars: Iterable[Sequence[float]], interval: float = 0.0) -> AsyncIterator:
+    """
+    Bar source replaying recorded bars, e.g. rows of `read_ohlcv` for paper trading and tests.
+
+    Args:
+        bars (Iterable[Sequence[float]]): Rows in the `BAR_FIELDS` order.
+        interval (float): Seconds to wait between two bars.
+    """
+    for bar in bars:
+        yield bar
+        await asyncio.sleep(interval)
+
+
+async def market_data_source(
+    market: str, base: str, quote: str, timeframe: str, poll_interval: float | None = None
+) -> AsyncIterator:
+    """
+    Live bar source polling `fetch_ohlcv` on one exchange session and emitting every bar once
+    it closed.
+
+    Args:
+        market (str): The ccxt exchange id, e.g. "binance".
+        base (str): The base currency, e.g. "BTC".
+        quote (str): The quote currency, e.g. "USDT".
+        timeframe (str): The bar timeframe, e.g. "1m".
+        poll_interval (float | None): Seconds between two polls. Defaults to a tenth of the
+            timeframe.
+    """
+    from torchtrader.data.collection import CANDLES_FETCHED
+    from torchtrader.data.collection import FETCH_SECONDS
+    from torchtrader.data.collection import MarketData
+
+    market_data = MarketData(market)
+    poll_interval = poll_interval or timeframe_to_seconds(timeframe) / 10
+    current = None
+    async with market_data.setup_exchange():
+        while True:
+            with FETCH_SECONDS.time():
+                # The last closed bar with its final values, then the one in progress
+                candles = await market_data.exchange.fetch_ohlcv(
+                    f"{base}/{quote}", timeframe, limit=2
+                )
+            CANDLES_FETCHED.inc(len(candles))
+            for candle in candles:
+                bar = tuple(candle[: len(BAR_FIELDS)])
+                if current is not None and bar[0] > current[0]:
+                    yield current
+                if current is None or bar[0] >= current[0]:
+                    current = bar
+            await asyncio.sleep(poll_interval)
+
+
+class StrategyRuntime:
+    """
+    Run many bots, each fed by a bar source, on the current asyncio loop.
+
+    Options default to the `runtime` configuration.
+
+    Args:
+        budget_ms (float | None): Latency budget of a decision, from the arrival of a bar to the
+            order intent. Decisions running over it are abandoned and counted as overruns.
+        on_intent (Callable[[OrderIntent], Any] | None): Receives every order intent, may be a
+            coroutine function. Defaults to logging the intents.
+        buffer_size (int | None): Bars kept by every bot.
+    """
+
+    def __init__(
+        self,
+        budget_ms: float | None = None,
+        on_intent: Callable[[OrderIntent], Any] | None = None,
+        buffer_size: int | None = None,
+    ):
+        config = get_section("runtime")
+        self.budget_ms = budget_ms or config.get("budget_ms", 50.0)
+        self.on_intent = on_intent or self._log_intent
+        self.buffer_size = buffer_size or config.get("buffer_size", 1024)
+        self.bots: Dict[str, Bot] = {}
+        self._sources: Dict[str, AsyncIterator] = {}
+        self._tasks: Dict[str, tuple] = {}
+        self._stop_event: asyncio.Event | None = None
+        self._changed = asyncio.Event()
+
+    def add_bot(self, name: str, symbol: str, strategy: Strategy, source: AsyncIterator) -> Bot:
+        """
+        Register a bot trading `symbol` with `strategy` on the bars of `source`. Bots added while
+        the runtime runs start at once.
+        """
+        if name in self.bots:
+            raise ValueError(f"Bot {name} already exists")
+        bot = Bot(name, symbol, strategy, BarBuffer(self.buffer_size))
+        self.bots[name] = bot
+        self._sources[name] = source
+        if self._stop_event is not None:
+            self._start(bot)
+        return bot
+
+    def remove_bot(self, name: str) -> Bot:
+        """
+        Stop a bot and unregister it, dropping the bars it did not process yet.
+        """
+        bot = self.bots.pop(name)
+        del self._sources[name]
+        # Cancelling the feeder also closes the source, at the bar it was waiting for
+        for task in self._tasks.pop(name, ()):
+            task.cancel()
+        self._changed.set()
+        return bot
+
+    def _start(self, bot: Bot) -> None:
+        feeder = asyncio.create_task(self._feed(self._sources[bot.name], bot))
+        worker = asyncio.create_task(self._work(bot, self._stop_event))
+        self._tasks[bot.name] = (feeder, worker)
+        self._changed.set()
+
+    async def run(self, stop_event: asyncio.Event | None = None, persistent: bool = False) -> None:
+        """
+        Run until every source is exhausted, or until `stop_event` is set.
+
+        Args:
+            stop_event (asyncio.Event | None): Stops the runtime once set.
+            persistent (bool): Keep running without any source left, until `stop_event` is set,
+                e.g. for bots added later.
+        """
+        stop_event = self._stop_event = stop_event or asyncio.Event()
+        for bot in self.bots.values():
+            self._start(bot)
+        stopper = asyncio.create_task(stop_event.wait())
+        try:
+            while True:
+                # Bots may be added and removed meanwhile, the feeders are watched anew
+                feeders = [feeder for feeder, _ in self._tasks.values() if not feeder.done()]
+                if not feeders and not persistent:
+                    break
+                self._changed.clear()
+                changed = asyncio.create_task(self._changed.wait())
+                await asyncio.wait(
+                    [stopper, changed, *feeders], return_when=asyncio.FIRST_COMPLETED
+                )
+                changed.cancel()
+                if stopper.done():
+                    break
+        finally:
+            stop_event.set()
+            tasks = [task for pair in self._tasks.values() for task in pair]
+            for feeder, _ in self._tasks.values():
+                feeder.cancel()
+            for bot in self.bots.values():
+                bot.wakeup.set()
+            # Workers drain the bars already received before returning
+            await asyncio.gather(stopper, *tasks, return_exceptions=True)
+            self._tasks.clear()
+            self._stop_event = None
+
+    def latency(self) -> Dict[str, Dict[str, float]]:
+        """
+        The bar-to-decision latency summary of every bot, see `LatencyStats.summary`.
+        """
+        return {name: bot.latency.summary() for name, bot in self.bots.items()}
+
+    async def _feed(self, source: AsyncIterator, bot: Bot) -> None:
+        async for bar in source:
+            # Never blocks: a bot that is behind finds all its pending bars in the inbox
+            bot.inbox.append((time.perf_counter_ns(), bar))
+            bot.wakeup.set()
+
+    async def _work(self, bot: Bot, stop_event: asyncio.Event) -> None:
+        indicators = bot.strategy.indicators()
+        timers = {name: indicator_seconds(name) for name in indicators}
+        histogram = REGISTRY.histogram(
+            "torchtrader_bar_to_decision_seconds", "Bar to decision latency", bot=bot.name
+        )
+        while True:
+            if not bot.inbox:
+                if stop_event.is_set():
+                    return
+                await bot.wakeup.wait()
+                bot.wakeup.clear()
+                continue
+            pending, bot.inbox = bot.inbox, []
+
+            with profile_stage("features"):
+                for _, bar in pending:
+                    bot.bars.append(bar)
+                    row = bot.bars.window(1)[0]
+                    for name, indicator in indicators.items():
+                        with timers[name].time():
+                            bot.values[name] = indicator(row)
+            bot.latency.conflated += len(pending) - 1
+            received_ns = pending[-1][0]
+
+            decision = await self._decide(bot)
+            latency_ns = time.perf_counter_ns() - received_ns
+            bot.latency.add(latency_ns)
+            histogram.observe(latency_ns / 1e9)
+
+            if decision is not None:
+                await self._emit(bot, decision, latency_ns)
+
+    async def _decide(self, bot: Bot) -> Any:
+        strategy = bot.strategy
+        if strategy.offload:
+            # A thread cannot be cancelled: skip the bar while the last decision still runs
+            if bot.decision is not None and not bot.decision.done():
+                bot.latency.overruns += 1
+                return None
+            bot.decision = asyncio.ensure_future(
+                asyncio.to_thread(self._evaluate, strategy, bot.bars, dict(bot.values))
+            )
+            call = asyncio.shield(bot.decision)
+        elif inspect.iscoroutinefunction(strategy.on_bar):
+            call = strategy.on_bar(bot.bars, bot.values)
+        else:
+            return self._evaluate(strategy, bot.bars, bot.values)
+        try:
+            # Only sampled and timed: the loop runs the other bots while this one awaits
+            with profile_stage("evaluate", asynchronous=True):
+                return await asyncio.wait_for(call, self.budget_ms / 1000)
+        except asyncio.TimeoutError:
+            bot.latency.overruns += 1
+            app_logger.warning("Bot %s abandoned a decision over %s ms", bot.name, self.budget_ms)
+            return None
+
+    @staticmethod
+    def _evaluate(strategy: Strategy, bars: BarBuffer, values: Dict[str, float]) -> Any:
+        with profile_stage("evaluate"):
+            return strategy.on_bar(bars, values)
+
+    async def _emit(self, bot: Bot, decision: Any, latency_ns: int) -> None:
+        if isinstance(decision, OrderIntent):
+            intent = decision
+        else:
+            side, quantity = decision
+            intent = OrderIntent(bot.name, bot.symbol, side, quantity, bot.bars.last("close"))
+        intent.bar_timestamp = int(bot.bars.last("timestamp"))
+        intent.latency_ns = latency_ns
+        result = self.on_intent(intent)
+        if inspect.isawaitable(result):
+            await result
+
+    @staticmethod
+    def _log_intent(intent: OrderIntent) -> None:
+        app_logger.info(
+            "Order intent of %s: %s %s %s at %s",
+            intent.bot,
+            intent.side,
+            intent.quantity,
+            intent.symbol,
+            intent.price,
+        )
@@ -0,0 +1,537 @@
+"""
+torchtrader/train/walk_forward.py
+
+Walk-forward optimization of the parameters of the indicator strategies (RSI, MACD, Ichimoku).
+
+History is split into rolling train/test folds. Candidates are ranked on the train windows only,
+with successive halving over the folds: every candidate is scored on the first fold, the best
+1/eta are scored on eta times more folds, and so on until the survivors have seen all the folds.
+Each fold then trades its test window with the winner of the same search run on the folds up to
+it only, never on later windows, which gives an out-of-sample track record of the whole search.
+
+Evaluations are backtested by `torchtrader.evaluate.backtest` in batches of candidates per fold,
+spread over a process pool, and appended to a cache file so that a search can be resumed.
+"""
+import hashlib
+import itertools
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+import torch
+import torch.nn.functional as F
+from torch import Tensor
+
+from torchtrader.config import get_section
+from torchtrader.data.database import DATA_DIR
+from torchtrader.evaluate.backtest import backtest
+from torchtrader.logs.logger import app_logger
+from torchtrader.ta.rsi import RSI
+
+DEFAULT_CACHE_PATH = DATA_DIR / "interim" / "walk_forward.jsonl"
+# Direction of the backtest metrics usable as objective, +1 when higher is better
+METRICS = {"sharpe": 1, "total_return": 1, "max_drawdown": -1}
+
+
+@dataclass(frozen=True)
+class Fold:
+    """
+    Bar ranges `[start, end)` of the train and test windows of a walk-forward fold.
+    """
+
+    train_start: int
+    train_end: int
+    test_start: int
+    test_end: int
+
+
+def walk_forward_folds(
+    n_bars: int, train_bars: int, test_bars: int, step: int | None = None, anchored: bool = False
+) -> List[Fold]:
+    """
+    Split `n_bars` bars into consecutive folds, every test window following its train window.
+
+    Args:
+        n_bars (int): The bars of the history.
+        train_bars (int): The bars of a train window, of the first one when `anchored`.
+        test_bars (int): The bars of a test window.
+        step (int | None): Bars between the starts of two folds, `test_bars` by default so that
+            the test windows tile the history.
+        anchored (bool): Start all the train windows on the first bar instead of rolling them.
+
+    Returns:
+        List[Fold]: The folds, oldest first.
+    """
+    step = step or test_bars
+    folds, start = [], 0
+    while start + train_bars + test_bars <= n_bars:
+        train_end = start + train_bars
+        folds.append(Fold(0 if anchored else start, train_end, train_end, train_end + test_bars))
+        start += step
+    if not folds:
+        raise ValueError(f"{n_bars} bars cannot hold a {train_bars} + {test_bars} bars fold")
+    return folds
+
+
+def ema(values: Tensor, periods: Sequence[float]) -> Tensor:
+    """
+    Exponential moving averages of `values` `[..., T]` for every period, seeded with the first
+    value like `torchtrader.ta.ema.ExponentialMovingAverage`.
+
+    Returns:
+        Tensor: The averages `[len(periods), ..., T]`.
+    """
+    alphas = torch.tensor([2 / (period + 1) for period in periods], dtype=values.dtype)
+    alphas = alphas.reshape(-1, *([1] * (values.dim() - 1)))
+    averages = torch.empty((len(periods), *values.shape), dtype=values.dtype)
+    averages[..., 0] = values[..., 0]
+    # One step per bar for all the periods and series at once
+    for t in range(1, values.shape[-1]):
+        averages[..., t] = averages[..., t - 1] + alphas * (values[..., t] - averages[..., t - 1])
+    return averages
+
+
+def _rolling(values: Tensor, period: int, reduce: Callable) -> Tensor:
+    # Rolling reduction over the last axis, NaN until the window is full
+    result = torch.full_like(values, math.nan)
+    if period <= values.shape[-1]:
+        result[..., period - 1 :] = reduce(values.unfold(-1, period, 1), dim=-1)
+    return result
+
+
+def _hold(signals: Tensor) -> Tensor:
+    # Forward fill the non-zero entries, so a position is held until the opposite signal
+    steps = torch.arange(signals.shape[-1]).expand_as(signals)
+    last = torch.where(signals != 0, steps, torch.zeros_like(steps)).cummax(dim=-1).values
+    return signals.gather(-1, last)
+
+
+def rsi_signals(close: Tensor, high: Tensor, low: Tensor, candidates: List[Dict]) -> Tensor:
+    """
+    Mean reversion on the RSI of `torchtrader.ta.rsi`: long once it falls under `lower`, short
+    once it rises over `upper`. Parameters: `window`, `lower`, `upper`.
+    """
+    changes = close[..., 1:] - close[..., :-1]
+    gains, losses = RSI.compute_individual_gains_losses(changes)
+    signals = torch.empty((len(candidates), *close.shape), dtype=close.dtype)
+    rsi_of: Dict[int, Tensor] = {}
+    for index, params in enumerate(candidates):
+        window = params["window"]
+        if window not in rsi_of:
+            padding = (window - 1, 0)
+            average_gain = F.avg_pool1d(F.pad(gains, padding).unsqueeze(1), window, 1).squeeze(1)
+            average_loss = F.avg_pool1d(F.pad(losses, padding).unsqueeze(1), window, 1).squeeze(1)
+            rsi = RSI.compute_rsi(RSI.compute_rs(average_gain, average_loss))
+            # No value before the first full window, nor on the first bar without a change
+            rsi[..., : window - 1] = math.nan
+            rsi_of[window] = F.pad(rsi, (1, 0), value=math.nan)
+        rsi = rsi_of[window]
+        entries = (rsi < params["lower"]).to(close.dtype) - (rsi > params["upper"]).to(close.dtype)
+        signals[index] = _hold(entries)
+    return signals
+
+
+def macd_signals(close: Tensor, high: Tensor, low: Tensor, candidates: List[Dict]) -> Tensor:
+    """
+    Long while the MACD line is over its signal line, short otherwise. Parameters: `fast`,
+    `slow` and `signal` EMA periods.
+    """
+    periods = sorted({params[name] for params in candidates for name in ("fast", "slow")})
+    averages = dict(zip(periods, ema(close, periods)))
+    lines = torch.stack(
+        [averages[params["fast"]] - averages[params["slow"]] for params in candidates]
+    )
+    # Signal lines of every candidate in a single pass: EMAs of [P, N, T] with per-row periods
+    signal_periods = sorted({params["signal"] for params in candidates})
+    smoothed = ema(lines, signal_periods)
+    rows = torch.tensor([signal_periods.index(params["signal"]) for params in candidates])
+    signal_lines = smoothed[rows, torch.arange(len(candidates))]
+    signals = torch.sign(lines - signal_lines)
+    # No signal until the slow EMA has seen `slow` bars
+    for index, params in enumerate(candidates):
+        signals[index, :, : params["slow"]] = 0
+    return signals
+
+
+def ichimoku_signals(close: Tensor, high: Tensor, low: Tensor, candidates: List[Dict]) -> Tensor:
+    """
+    Ichimoku trend following: long when the conversion line is over the base line and the close
+    is over the span B midpoint, short in the opposite case, flat otherwise. Parameters:
+    `conversion`, `base` and `span_b` periods.
+    """
+    midpoints: Dict[int, Tensor] = {}
+    for period in {
+        params[name] for params in candidates for name in ("conversion", "base", "span_b")
+    }:
+        midpoints[period] = (
+            _rolling(high, period, torch.amax) + _rolling(low, period, torch.amin)
+        ) / 2
+    signals = torch.empty((len(candidates), *close.shape), dtype=close.dtype)
+    for index, params in enumerate(candidates):
+        trend = midpoints[params["conversion"]] - midpoints[params["base"]]
+        cloud = close - midpoints[params["span_b"]]
+        agree = torch.sign(trend) == torch.sign(cloud)
+        signals[index] = torch.where(agree, torch.sign(trend), 0).nan_to_num_(0.0)
+    return signals
+
+
+@dataclass(frozen=True)
+class StrategySpec:
+    """
+    A strategy searchable by the optimizer: the builder of the signals of a batch of candidates,
+    `[P, N, T]` target positions, and the check of the valid parameter combinations.
+    """
+
+    build: Callable[[Tensor, Tensor, Tensor, List[Dict]], Tensor]
+    valid: Callable[[Dict], bool]
+
+
+STRATEGIES: Dict[str, StrategySpec] = {
+    "rsi": StrategySpec(rsi_signals, lambda params: params["lower"] < params["upper"]),
+    "macd": StrategySpec(macd_signals, lambda params: params["fast"] < params["slow"]),
+    "ichimoku": StrategySpec(
+        ichimoku_signals, lambda params: params["conversion"] < params["base"] < params["span_b"]
+    ),
+}
+
+
+def parameter_grid(strategy: str, space: Dict[str, Sequence]) -> List[Dict]:
+    """
+    All the valid combinations of the values of `space`, e.g. `{"window": [7, 14, 21]}`.
+    """
+    names = sorted(space)
+    grid = [
+        dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))
+    ]
+    return [params for params in grid if STRATEGIES[strategy].valid(params)]
+
+
+@dataclass
+class WalkForwardResult:
+    """
+    Outcome of a search. `ranking` holds the (params, mean train score, folds scored) of every
+    candidate, best first. `fold_params` and `test_scores` are the parameters traded by every fold
+    and their out-of-sample score.
+    """
+
+    best_params: Dict
+    best_score: float
+    ranking: List[Tuple[Dict, float, int]]
+    fold_params: List[Dict]
+    test_scores: List[float]
+    evaluations: int = 0
+    cache_hits: int = 0
+
+    @property
+    def test_score(self) -> float:
+        return sum(self.test_scores) / len(self.test_scores)
+
+
+class EvaluationCache:
+    """
+    Append-only JSON lines file of the scores already computed, keyed by a hash of everything
+    a score depends on. Without a path, the cache only lives in memory.
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path else None
+        self._scores: Dict[str, float] = {}
+        if self.path is not None and self.path.is_file():
+            with open(self.path) as cache_file:
+                for line in cache_file:
+                    # A line torn by an interrupted search is recomputed
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._scores[entry["key"]] = entry["score"]
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    @staticmethod
+    def key(**parts: Any) -> str:
+        return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> float | None:
+        return self._scores.get(key)
+
+    def put_many(self, scores: Dict[str, float]) -> None:
+        self._scores.update(scores)
+        if self.path is not None and scores:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as cache_file:
+                cache_file.writelines(
+                    json.dumps({"key": key, "score": score}) + "\n" for key, score in scores.items()
+                )
+
+
+def data_fingerprint(*tensors: Tensor) -> str:
+    """
+    Hash of the price tensors, so cached scores are never reused on other data.
+    """
+    digest = hashlib.sha1()
+    for tensor in tensors:
+        digest.update(str(tuple(tensor.shape)).encode())
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+
+# Prices of a worker process, sent once by the pool initializer instead of with every task
+_worker_prices: Tuple[Tensor, Tensor, Tensor] | None = None
+
+
+def _init_worker(close: Tensor, high: Tensor, low: Tensor) -> None:
+    global _worker_prices
+    _worker_prices = (close, high, low)
+    # The workers already use all the cores between them
+    torch.set_num_threads(1)
+
+
+def _score_in_worker(*args) -> List[float]:
+    return score_window(*_worker_prices, *args)
+
+
+def score_window(
+    close: Tensor,
+    high: Tensor,
+    low: Tensor,
+    strategy: str,
+    candidates: List[Dict],
+    start: int,
+    end: int,
+    options: Dict[str, Any],
+) -> List[float]:
+    """
+    Score a batch of candidates on the bars `[start, end)`: the objective metric of their
+    backtest, averaged over the assets and signed so that higher is better.
+
+    Indicators see up to `options["warmup"]` bars before `start`, and only bars before the
+    decision they drive, so the scores of a test window never depend on its future.
+    """
+    first = max(0, start - options["warmup"])
+    window = slice(first, end)
+    signals = STRATEGIES[strategy].build(
+        close[:, window], high[:, window], low[:, window], candidates
+    )
+    result = backtest(
+        signals[..., start - first :],
+        close[:, start:end],
+        fee=options["fee"],
+        slippage=options["slippage"],
+        periods_per_year=options["periods_per_year"],
+    )
+    scores = getattr(result, options["metric"]).mean(dim=1) * METRICS[options["metric"]]
+    return scores.tolist()
+
+
+class WalkForwardOptimizer:
+    """
+    Successive halving search of the parameters of a strategy over walk-forward folds. Options
+    default to the `walk_forward` configuration.
+
+    Args:
+        strategy (str): A strategy of `STRATEGIES`: "rsi", "macd" or "ichimoku".
+        space (Dict[str, Sequence]): The values searched for every parameter.
+        folds (List[Fold]): The folds, see `walk_forward_folds`.
+        metric (str): The objective, a key of `METRICS`.
+        fee (float): Fee of the backtests, see `backtest`.
+        slippage (float): Slippage of the backtests.
+        periods_per_year (float | None): Annualization of the Sharpe ratio.
+        eta (int): Candidates kept at every rung are the best 1/eta, scored on eta times more
+            folds.
+        min_folds (int): Folds scored by every candidate at the first rung.
+        warmup (int): Bars before a window fed to the indicators, see `score_window`.
+        workers (int | None): Processes of the pool, 0 to evaluate in this process. Defaults to
+            `walk_forward.workers`, or the number of CPUs.
+        chunk_size (int): Candidates backtested together in one task.
+        cache_path (str | Path | None): The evaluation cache file. Defaults to
+            `walk_forward.cache_path`, or `data/interim/walk_forward.jsonl`.
+    """
+
+    def __init__(
+        self,
+        strategy: str,
+        space: Dict[str, Sequence],
+        folds: List[Fold],
+        metric: str = "sharpe",
+        fee: float = 0.001,
+        slippage: float = 0.0,
+        periods_per_year: float | None = None,
+        eta: int = 3,
+        min_folds: int = 1,
+        warmup: int = 200,
+        workers: int | None = None,
+        chunk_size: int = 32,
+        cache_path: str | Path | None = None,
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy}")
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        config = get_section("walk_forward")
+        self.strategy = strategy
+        self.candidates = parameter_grid(strategy, space)
+        self.folds = folds
+        self.eta = eta
+        self.min_folds = min_folds
+        self.chunk_size = chunk_size
+        self.workers = workers if workers is not None else config.get("workers", os.cpu_count())
+        self.cache = EvaluationCache(cache_path or config.get("cache_path") or DEFAULT_CACHE_PATH)
+        self.options = {
+            "metric": metric,
+            "fee": fee,
+            "slippage": slippage,
+            "periods_per_year": periods_per_year,
+            "warmup": warmup,
+        }
+
+    def run(
+        self, close: Tensor, high: Tensor | None = None, low: Tensor | None = None
+    ) -> WalkForwardResult:
+        """
+        Search the parameters on the prices `[N, T]`. High and low default to the close.
+
+        Returns:
+            WalkForwardResult: The ranking of the candidates and the out-of-sample results.
+        """
+        if not self.candidates:
+            raise ValueError("The search space has no valid candidate")
+        high = close if high is None else high
+        low = close if low is None else low
+        self._fingerprint = data_fingerprint(close, high, low)
+        self._computed = self._hits = 0
+
+        pool = None
+        if self.workers:
+            pool = ProcessPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=(close, high, low)
+            )
+        try:
+            return self._search(pool, close, high, low)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def _search(self, pool, close: Tensor, high: Tensor, low: Tensor) -> WalkForwardResult:
+        n_folds = len(self.folds)
+        _, train_scores = self._halving(pool, close, high, low, n_folds)
+
+        # Out of sample: every fold trades the best candidate of a search on the folds up to it
+        # only, the later train windows overlap or follow its test window. The scores computed
+        # by the search on all the folds are reused from the cache.
+        fold_best = [
+            self._halving(pool, close, high, low, fold + 1)[0][0] for fold in range(n_folds)
+        ]
+        test_scores = []
+        for fold, index in zip(self.folds, fold_best):
+            window = [(fold.test_start, fold.test_end)]
+            test_scores.append(self._score(pool, close, high, low, [index], window)[index][0])
+
+        ranking = sorted(
+            (
+                (self.candidates[index], _mean(scores), len(scores))
+                for index, scores in train_scores.items()
+            ),
+            key=lambda entry: (-entry[2], -entry[1]),
+        )
+        return WalkForwardResult(
+            best_params=ranking[0][0],
+            best_score=ranking[0][1],
+            ranking=ranking,
+            fold_params=[self.candidates[index] for index in fold_best],
+            test_scores=test_scores,
+            evaluations=self._computed,
+            cache_hits=self._hits,
+        )
+
+    def _halving(
+        self, pool, close: Tensor, high: Tensor, low: Tensor, n_folds: int
+    ) -> Tuple[List[int], Dict[int, List[float]]]:
+        # Successive halving on the train windows of the first n_folds folds: the candidates of
+        # the last rung, best first, and the train scores of every candidate
+        survivors = list(range(len(self.candidates)))
+        train_scores: Dict[int, List[float]] = {index: [] for index in survivors}
+        budget = min(self.min_folds, n_folds)
+        while True:
+            # Score the survivors on the folds they have not seen yet, up to the rung budget
+            windows = [(fold.train_start, fold.train_end) for fold in self.folds[:budget]]
+            scores = self._score(pool, close, high, low, survivors, windows)
+            for index in survivors:
+                train_scores[index] = scores[index]
+            ranked = sorted(survivors, key=lambda index: -_mean(train_scores[index]))
+            app_logger.info(
+                "Walk-forward %s: %s candidates scored on %s/%s folds",
+                self.strategy,
+                len(survivors),
+                budget,
+                n_folds,
+            )
+            if budget == n_folds:
+                return ranked, train_scores
+            survivors = ranked[: max(1, math.ceil(len(survivors) / self.eta))]
+            budget = min(n_folds, budget * self.eta)
+
+    def _score(
+        self,
+        pool,
+        close: Tensor,
+        high: Tensor,
+        low: Tensor,
+        indices: List[int],
+        windows: List[Tuple[int, int]],
+    ) -> Dict[int, List[float]]:
+        # Scores of every candidate on every window, from the cache or computed per window
+        keys = {
+            (index, window): self.cache.key(
+                strategy=self.strategy,
+                params=self.candidates[index],
+                window=window,
+                data=self._fingerprint,
+                **self.options,
+            )
+            for index in indices
+            for window in windows
+        }
+        scores = {pair: self.cache.get(key) for pair, key in keys.items()}
+        missing: Dict[Tuple[int, int], List[int]] = {}
+        for (index, window), score in scores.items():
+            if score is None:
+                missing.setdefault(window, []).append(index)
+        self._hits += sum(score is not None for score in scores.values())
+
+        tasks = []
+        for window, window_indices in missing.items():
+            for start in range(0, len(window_indices), self.chunk_size):
+                chunk = window_indices[start : start + self.chunk_size]
+                args = (self.strategy, [self.candidates[i] for i in chunk], *window, self.options)
+                if pool is None:
+                    result = score_window(close, high, low, *args)
+                else:
+                    result = pool.submit(_score_in_worker, *args)
+                tasks.append((window, chunk, result))
+
+        computed = {}
+        for window, chunk, result in tasks:
+            chunk_scores = result if pool is None else result.result()
+            for index, score in zip(chunk, chunk_scores):
+                scores[(index, window)] = score
+                computed[keys[(index, window)]] = score
+        self.cache.put_many(computed)
+        self._computed += len(computed)
+        return {index: [scores[(index, window)] for window in windows] for index in indices}
+
+
+def _mean(values: List[float]) -> float:
+    # NaN scores, e.g. of an asset without any move, rank last
+    values = [value for value in values if not math.isnan(value)]
+    return sum(values) / len(values) if values else -math.inf